@@ -0,0 +1,242 @@
+"""Time the stages of turning API data into HTML, against a synthetic
+regulation written to disk and read through the file system API backend."""
+from collections import OrderedDict
+import copy
+import shutil
+import sys
+import tempfile
+import timeit
+
+from django.core.cache import caches
+from django.test import RequestFactory, override_settings
+
+from regulations.benchmarks.synthetic import SyntheticRegulation
+from regulations.generator import generator
+from regulations.generator.compact_node import compact_tree
+from regulations.generator.html_builder import CFRHTMLBuilder
+from regulations.generator.label import Label
+from regulations.generator.layers import tree_builder
+from regulations.generator.layers.diff_applier import DiffApplier
+from regulations.generator.layers.layers_applier import (
+    InlineLayersApplier, LayersApplier, SpliceLayersApplier)
+from regulations.generator.toc import fetch_toc
+from regulations.views.partial import PartialSectionView
+
+
+LAYERS = ('defined', 'graphics', 'internal', 'keyterms', 'marker-hiding',
+          'marker-info', 'meta', 'terms', 'toc')
+
+
+def time_calls(fn, repeat, setup=None):
+    """Call fn `repeat` times, returning timing stats in milliseconds. If
+    provided, `setup` is called (untimed) before each call and its result
+    passed to fn"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            arg = setup()
+            start = timeit.default_timer()
+            fn(arg)
+        else:
+            start = timeit.default_timer()
+            fn()
+        times.append((timeit.default_timer() - start) * 1000)
+    times.sort()
+    return OrderedDict([
+        ('repeat', repeat),
+        ('min_ms', times[0]),
+        ('median_ms', times[len(times) // 2]),
+        ('mean_ms', sum(times) / len(times)),
+        ('max_ms', times[-1])])
+
+
+def node_bytes(node):
+    """Memory held by the nodes of a tree (and their lists of children),
+    not counting their contents"""
+    size = sys.getsizeof(node) + sys.getsizeof(node['children'])
+    extra = getattr(node, '_extra', None)
+    if extra is not None:
+        size += sys.getsizeof(extra)
+    return size + sum(node_bytes(child) for child in node['children'])
+
+
+class Benchmarks(object):
+    """Each `bench_*` method times one stage of the pipeline. The API data
+    must already be available (see `run`)"""
+    def __init__(self, regulation, repeat=5):
+        self.reg = regulation
+        self.repeat = repeat
+
+    @classmethod
+    def names(cls):
+        return [name[len('bench_'):] for name in sorted(dir(cls))
+                if name.startswith('bench_')]
+
+    def appliers(self):
+        creator = generator.LayerCreator()
+        creator.add_layers(LAYERS, 'cfr', self.reg.part, True,
+                           self.reg.version)
+        return creator.get_appliers()
+
+    def paragraph_layers(self):
+        """Each paragraph's text and its inline and search/replace layer
+        elements, as HTMLBuilder would find them"""
+        inline, _, search = self.appliers()
+        for node in self.reg.paragraphs_with_text():
+            label_id = '-'.join(node['label'])
+            yield (node['text'],
+                   inline.get_offset_pairs(label_id, node['text']),
+                   list(search.get_layer_pairs(label_id)))
+
+    def bench_generate_html(self):
+        appliers = self.appliers()
+
+        def generate(tree):
+            builder = CFRHTMLBuilder(*appliers)
+            builder.tree = tree
+            builder.generate_html()
+        return time_calls(generate, self.repeat,
+                          lambda: copy.deepcopy(self.reg.tree))
+
+    def bench_generate_html_compact(self):
+        """As bench_generate_html, with a tree of CompactNodes"""
+        appliers = self.appliers()
+
+        def generate(tree):
+            builder = CFRHTMLBuilder(*appliers)
+            builder.tree = tree
+            builder.generate_html()
+        return time_calls(generate, self.repeat,
+                          lambda: compact_tree(self.reg.tree))
+
+    def bench_tree_memory(self):
+        """Rather than timing, the bytes held by the nodes of the whole
+        (rendered) regulation, as dicts and as CompactNodes"""
+        appliers = self.appliers()
+        results = OrderedDict()
+        for name, tree in (('dict', copy.deepcopy(self.reg.tree)),
+                           ('compact', compact_tree(self.reg.tree))):
+            builder = CFRHTMLBuilder(*appliers)
+            builder.tree = tree
+            builder.generate_html()
+            results[name + '_bytes'] = node_bytes(tree)
+        results['nodes'] = len(tree_builder.build_tree_hash(self.reg.tree))
+        results['ratio'] = results['compact_bytes'] / float(
+            results['dict_bytes'])
+        return results
+
+    def bench_layers_applier(self):
+        """The original, PriorityQueue-based applier"""
+        paragraphs = [
+            (text, InlineLayersApplier.to_locations(inline, text) + search)
+            for text, inline, search in self.paragraph_layers()]
+
+        def apply_all():
+            for text, elements in paragraphs:
+                applier = LayersApplier()
+                applier.enqueue_from_list(elements)
+                applier.apply_layers(text)
+        return time_calls(apply_all, self.repeat)
+
+    def bench_splice_layers_applier(self):
+        paragraphs = list(self.paragraph_layers())
+
+        def apply_all():
+            for text, inline, search in paragraphs:
+                applier = SpliceLayersApplier()
+                applier.enqueue_offsets(inline, text)
+                applier.enqueue_from_list(search)
+                applier.apply_layers(text)
+        return time_calls(apply_all, self.repeat)
+
+    def bench_apply_diff_changes(self):
+        diff = self.reg.diff()
+        texts = dict(('-'.join(node['label']), node['text'])
+                     for node in self.reg.paragraphs_with_text())
+
+        def apply_all():
+            applier = DiffApplier(diff, self.reg.part)
+            for label_id, changes in diff.items():
+                applier.apply_diff_changes(texts[label_id], changes['text'])
+        return time_calls(apply_all, self.repeat)
+
+    def bench_apply_diff_long_paragraph(self):
+        """A (much rewritten) paragraph of ~50k characters, with an edit
+        every ~25 characters"""
+        text = ' '.join(node['text']
+                        for node in self.reg.paragraphs_with_text())[:50000]
+        changes = []
+        for start in range(0, len(text) - 20, 25):
+            changes.extend([['delete', start, start + 5],
+                            ['insert', start + 10, 'new words'],
+                            [['delete', start + 15, start + 20],
+                             ['insert', start + 20, 'replaced']]])
+
+        def apply_all():
+            DiffApplier({}, self.reg.part).apply_diff_changes(text, changes)
+        return time_calls(apply_all, self.repeat)
+
+    def bench_sort_appendix_labels(self):
+        """Order the children of a large appendix (as when grafting nodes
+        added by a diff) and sort the labels of every regulation text
+        paragraph (as the analyses sidebar does)"""
+        def mknode(*label):
+            return {'label': [self.reg.part, 'A'] + list(label),
+                    'node_type': 'appendix', 'children': []}
+        paragraphs = [mknode(str(i)) for i in range(500, 0, -1)]
+        romans = [mknode('1', numeral)
+                  for numeral in reversed(tree_builder.ROMAN_NUMERALS)]
+        labels = [node['label'] for node in self.reg.paragraphs_with_text()
+                  if node['label'][1].isdigit() and len(node['label']) > 2
+                  and 'Interp' not in node['label']]
+
+        def sort_all():
+            for children in (paragraphs, romans):
+                parent = {'label': children[0]['label'][:-1],
+                          'node_type': 'appendix', 'children': []}
+                tree_builder.add_children(parent, children)
+            sorted(Label(parts=label) for label in reversed(labels))
+        return time_calls(sort_all, self.repeat)
+
+    def bench_fetch_toc(self):
+        return time_calls(
+            lambda: fetch_toc(self.reg.part, self.reg.version), self.repeat)
+
+    def render_sections(self, _=None):
+        view = PartialSectionView.as_view()
+        for section in range(1, self.reg.sections + 1):
+            label_id = '{}-{}'.format(self.reg.part, section)
+            request = RequestFactory().get('/partial/{}/{}'.format(
+                label_id, self.reg.version))
+            view(request, label_id=label_id,
+                 version=self.reg.version).render()
+
+    def bench_partial_section_view(self):
+        """Render every section, with API data already cached"""
+        self.render_sections()
+        return time_calls(self.render_sections, self.repeat)
+
+    def bench_partial_section_view_uncached(self):
+        """Render every section, starting from an empty API cache each time"""
+        return time_calls(self.render_sections, self.repeat,
+                          caches['api_cache'].clear)
+
+
+def run(repeat=5, only=None, **scale):
+    """Generate a synthetic regulation of the requested `scale` (see
+    SyntheticRegulation), write it to a temporary directory and time each
+    benchmark (or only those named) against it"""
+    reg = SyntheticRegulation(**scale)
+    api_root = tempfile.mkdtemp()
+    results = OrderedDict()
+    try:
+        reg.write_api(api_root)
+        with override_settings(API_BASE=api_root + '/'):
+            benchmarks = Benchmarks(reg, repeat)
+            for name in only or Benchmarks.names():
+                caches['api_cache'].clear()
+                results[name] = getattr(benchmarks, 'bench_' + name)()
+    finally:
+        caches['api_cache'].clear()
+        shutil.rmtree(api_root)
+    return results
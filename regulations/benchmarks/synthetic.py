@@ -0,0 +1,205 @@
+"""Generate regulation trees, layers and diffs of configurable size, in the
+same shape as the API provides them. Text is nonsense, but deterministic for
+a given seed."""
+import json
+import os
+import random
+import string
+
+
+WORDS = ('the', 'of', 'a', 'any', 'and', 'or', 'to', 'is', 'not', 'shall',
+         'may', 'within', 'after', 'notice', 'fee', 'payment', 'period',
+         'business', 'days', 'written', 'provide', 'disclose', 'error',
+         'request', 'access', 'device', 'unless', 'except', 'such')
+
+
+def paragraph_marker(idx):
+    """a, b, ..., z, aa, bb, ..."""
+    letters = string.ascii_lowercase
+    return letters[idx % 26] * (idx // 26 + 1)
+
+
+class SyntheticRegulation(object):
+    """A regulation `part` containing `sections` sections, each with
+    `paragraphs` paragraphs. `terms` defined terms and `citations` internal
+    citations per paragraph are sprinkled through the text; the first
+    `interps` sections have an interpretation. Layer data is recorded while
+    the text is generated, so offsets line up"""
+    def __init__(self, part='9999', version='2016-00001', sections=20,
+                 paragraphs=10, terms=20, citations=3, interps=10,
+                 words_per_paragraph=60, seed=0):
+        self.part, self.version = part, version
+        self.sections, self.paragraphs = sections, paragraphs
+        self.citations, self.interps = citations, interps
+        self.words_per_paragraph = words_per_paragraph
+        self.rand = random.Random(seed)
+        self.terms = ['defined term {}'.format(i) for i in range(terms)]
+        self.layers = {
+            'terms': {'referenced': {}},
+            'internal-citations': {},
+            'paragraph-markers': {},
+            'interpretations': {},
+            'toc': {},
+            'meta': {part: [{
+                'cfr_title_number': 12, 'cfr_title_text': 'Banks',
+                'effective_date': '2016-01-01', 'reg_letter': 'S',
+                'statutory_name': 'Synthetic Regulation'}]},
+        }
+        self.tree = self.build_tree()
+
+    def section_title(self, section):
+        return u'\xa7 {}.{} Section {}.'.format(self.part, section, section)
+
+    def paragraph_text(self, label, marker=None):
+        """Nonsense text, with references to defined terms and citations
+        recorded in their respective layers"""
+        label_id = '-'.join(label)
+        if marker:
+            text = '({}) '.format(marker)
+            self.layers['paragraph-markers'][label_id] = [
+                {'text': '({})'.format(marker), 'locations': [0]}]
+        else:
+            text = '{}. '.format(label[-1])
+
+        citation_at = set(self.rand.sample(
+            range(self.words_per_paragraph),
+            min(self.citations, self.words_per_paragraph)))
+        for idx in range(self.words_per_paragraph):
+            if idx in citation_at:
+                section = str(self.rand.randint(1, self.sections))
+                cited = u'\xa7 {}.{}'.format(self.part, section)
+                self.layers['internal-citations'].setdefault(
+                    label_id, []).append({
+                        'citation': [self.part, section],
+                        'offsets': [[len(text), len(text) + len(cited)]]})
+                text += cited
+            elif self.terms and self.rand.random() < 0.1:
+                term_idx = self.rand.randrange(len(self.terms))
+                term = self.terms[term_idx]
+                self.layers['terms'].setdefault(label_id, []).append({
+                    'ref': '{}:{}'.format(term, self.definition(term_idx)),
+                    'offsets': [[len(text), len(text) + len(term)]]})
+                text += term
+            else:
+                text += self.rand.choice(WORDS)
+            text += ' '
+        return text.strip() + '.'
+
+    def definition(self, term_idx):
+        """Terms are defined in the first section's paragraphs"""
+        return '{}-1-{}'.format(
+            self.part, paragraph_marker(term_idx % self.paragraphs))
+
+    def build_section(self, section):
+        label = [self.part, str(section)]
+        children = []
+        for idx in range(self.paragraphs):
+            marker = paragraph_marker(idx)
+            children.append({
+                'label': label + [marker], 'node_type': 'regtext',
+                'text': self.paragraph_text(label + [marker], marker),
+                'children': []})
+        return {'label': label, 'node_type': 'regtext', 'text': '',
+                'title': self.section_title(section), 'children': children}
+
+    def build_interp(self, section):
+        label = [self.part, str(section), 'Interp']
+        paragraph = label + ['1']
+        text = self.paragraph_text(paragraph)
+        self.layers['interpretations'][
+            '{}-{}-a'.format(self.part, section)] = [
+                {'reference': '-'.join(label)}]
+        return {'label': label, 'node_type': 'interp', 'text': '',
+                'title': u'Section {}.{} - Section {}'.format(
+                    self.part, section, section),
+                'children': [{'label': paragraph, 'node_type': 'interp',
+                              'text': text, 'children': []}]}
+
+    def build_tree(self):
+        sections = [self.build_section(s)
+                    for s in range(1, self.sections + 1)]
+        for term_idx, term in enumerate(self.terms):
+            reference = self.definition(term_idx)
+            self.layers['terms']['referenced'][
+                '{}:{}'.format(term, reference)] = {
+                    'term': term, 'reference': reference,
+                    'position': [0, len(term)]}
+
+        toc = [{'index': s['label'], 'title': s['title']} for s in sections]
+        children = [{'label': [self.part, 'Subpart'],
+                     'node_type': 'emptypart', 'text': '',
+                     'children': sections}]
+        if self.interps:
+            interps = [self.build_interp(s)
+                       for s in range(1, min(self.interps, self.sections) + 1)]
+            interp_label = [self.part, 'Interp']
+            children.append({
+                'label': interp_label, 'node_type': 'interp', 'text': '',
+                'title': 'Supplement I to Part {}'.format(self.part),
+                'children': interps})
+            toc.append({'index': interp_label,
+                        'title': 'Supplement I to Part {}'.format(self.part)})
+            self.layers['toc']['-'.join(interp_label)] = [
+                {'index': i['label'], 'title': i['title']} for i in interps]
+        self.layers['toc'][self.part] = toc
+
+        return {'label': [self.part], 'node_type': 'regtext', 'text': '',
+                'title': 'PART {} - SYNTHETIC REGULATION (REGULATION S)'
+                         .format(self.part),
+                'children': children}
+
+    def paragraphs_with_text(self, node=None):
+        node = node or self.tree
+        if node['text']:
+            yield node
+        for child in node['children']:
+            for descendant in self.paragraphs_with_text(child):
+                yield descendant
+
+    def diff(self, fraction=0.3):
+        """A diff modifying roughly `fraction` of the paragraphs with
+        deletions, insertions and replacements"""
+        diff = {}
+        for node in self.paragraphs_with_text():
+            if self.rand.random() >= fraction:
+                continue
+            length = len(node['text'])
+            changes = []
+            starts = sorted(self.rand.sample(range(length), 3))
+            for start, limit in zip(starts, starts[1:] + [length]):
+                end = min(start + self.rand.randint(1, 10), limit)
+                kind = self.rand.choice(('insert', 'delete', 'replace'))
+                if kind == 'insert':
+                    changes.append(['insert', start, ' new words '])
+                elif kind == 'delete':
+                    changes.append(['delete', start, end])
+                else:
+                    changes.append([['delete', start, end],
+                                    ['insert', end, 'replaced']])
+            diff['-'.join(node['label'])] = {'op': 'modified',
+                                             'text': changes}
+        return diff
+
+    def write_api(self, root):
+        """Write the tree (and each section/interp subtree) and layers to
+        `root`, laid out as ApiClient expects to find them on disk"""
+        def write(path, data):
+            path = os.path.join(root, *path.split('/'))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                json.dump(data, f)
+
+        def write_subtrees(node):
+            write('regulation/{}/{}'.format('-'.join(node['label']),
+                                            self.version), node)
+            for child in node['children']:
+                if child['children']:
+                    write_subtrees(child)
+
+        write_subtrees(self.tree)
+        for name, data in self.layers.items():
+            write('layer/{}/cfr/{}/{}'.format(name, self.version, self.part),
+                  data)
+        write('regulation/{}/index.html'.format(self.part), {'versions': [
+            {'version': self.version, 'by_date': '2016-01-01'}]})
@@ -0,0 +1,667 @@
+"""Cache backends tuned for the shape of the data we get from the API."""
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+import copy
+import errno
+import json
+import marshal
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache, dummy
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:     # pragma: no cover (Python 2)
+    from collections import Mapping, MutableMapping
+
+try:
+    from django.utils.six.moves import cPickle as pickle
+except ImportError:     # pragma: no cover
+    import pickle
+
+
+def is_tree(value):
+    """Regulation trees (and subtrees) are dicts with labels and children"""
+    return (isinstance(value, Mapping) and 'label' in value and
+            'children' in value)
+
+
+def _copy_field(value):
+    """A private copy of a node's (JSON) field. Most are lists of strings or
+    numbers (e.g. labels), for which a shallow copy will do"""
+    if isinstance(value, list) and not any(
+            isinstance(item, (list, dict)) for item in value):
+        return list(value)
+    return copy.deepcopy(value)
+
+
+class CopyOnWriteNode(MutableMapping):
+    """A view of a frozen (never modified) regulation node. The node's own
+    fields (including lists, such as its label) are copied when the view is
+    created, so it can be freely modified; its children are only wrapped in
+    views of their own when first accessed. This means that looking up a
+    large tree but only walking a small part of it doesn't pay to copy the
+    rest.
+
+    Not a dict subclass: `dict(node)` and `{**node}` would read a dict's
+    storage directly, handing out the frozen children"""
+    __slots__ = ('_fields', '_frozen_children')
+    __hash__ = None
+
+    def __init__(self, frozen):
+        self._fields = dict(frozen)
+        self._frozen_children = self._fields.get('children')
+        for key, value in self._fields.items():
+            if key != 'children' and isinstance(value, (list, dict)):
+                self._fields[key] = _copy_field(value)
+
+    def _thaw(self):
+        if self._frozen_children is not None:
+            if self._fields.get('children') is self._frozen_children:
+                self._fields['children'] = [
+                    self._thaw_child(c) for c in self._frozen_children]
+            self._frozen_children = None
+
+    @staticmethod
+    def _thaw_child(child):
+        return CopyOnWriteNode(child)
+
+    def __getitem__(self, key):
+        if key == 'children':
+            self._thaw()
+        return self._fields[key]
+
+    def __setitem__(self, key, value):
+        if key == 'children':
+            self._frozen_children = None
+        self._fields[key] = value
+
+    def __delitem__(self, key):
+        if key == 'children':
+            self._frozen_children = None
+        del self._fields[key]
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def get(self, key, default=None):
+        if key == 'children':
+            self._thaw()
+        return self._fields.get(key, default)
+
+    def copy(self):
+        self._thaw()
+        return dict(self._fields)
+
+    def view(self):
+        """Another view of the same frozen node, unaffected by changes to
+        this one. Once this node's children have been thawed (and so may
+        have been changed), a view of a copy of it"""
+        if self._frozen_children is None and 'children' in self._fields:
+            return CopyOnWriteNode(copy.deepcopy(self))
+        return type(self)(self._fields)
+
+    def __reduce_ex__(self, protocol):
+        """Pickle/copy as a plain dict"""
+        return (dict, (), None, None, iter(self.items()))
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.copy())
+
+
+class FrozenTreeCache(LocMemCache):
+    """In-memory cache which, unlike LocMemCache, doesn't pickle regulation
+    trees. Trees are stored frozen and each `get` returns a
+    CopyOnWriteNode. Other values are pickled as usual"""
+
+    def _encode(self, value):
+        if is_tree(value):
+            try:
+                # A private copy, so later changes by the caller don't leak
+                # in. For JSON data, marshal is much faster than deepcopy
+                return marshal.loads(marshal.dumps(value))
+            except ValueError:
+                # e.g. a tree of CopyOnWriteNodes, which copy as dicts
+                if isinstance(value, (dict, CopyOnWriteNode)):
+                    return copy.deepcopy(value)
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, stored):
+        if isinstance(stored, dict):
+            return CopyOnWriteNode(stored)
+        return pickle.loads(stored)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        encoded = self._encode(value)
+        with self._lock.writer():
+            if self._has_expired(key):
+                self._set(key, encoded, timeout)
+                return True
+            return False
+
+    def get(self, key, default=None, version=None, acquire_lock=True):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        stored = None
+        with (self._lock.reader() if acquire_lock else dummy()):
+            if not self._has_expired(key):
+                stored = self._cache[key]
+        if stored is not None:
+            try:
+                return self._decode(stored)
+            except pickle.PickleError:
+                return default
+
+        with (self._lock.writer() if acquire_lock else dummy()):
+            self._delete(key)
+            return default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        encoded = self._encode(value)
+        with self._lock.writer():
+            self._set(key, encoded, timeout)
+
+    def incr(self, key, delta=1, version=None):
+        with self._lock.writer():
+            value = self.get(key, version=version, acquire_lock=False)
+            if value is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = value + delta
+            key = self.make_key(key, version=version)
+            self._cache[key] = self._encode(new_value)
+        return new_value
+
+
+class EncodedNode(CopyOnWriteNode):
+    """A regulation node whose children are kept encoded (see encode_tree)
+    until first accessed, so that looking up a large tree only pays to
+    decode the parts of it which are walked"""
+    __slots__ = ()
+
+    @staticmethod
+    def _thaw_child(child):
+        return decode_tree(child)
+
+
+def encode_tree(node):
+    """Serialize a node with marshal, encoding each of its children
+    separately so that they can be decoded lazily"""
+    fields = dict((key, value) for key, value in node.items()
+                  if key != 'children')
+    if not is_tree(node):
+        return marshal.dumps((fields, None))
+    return marshal.dumps((fields,
+                          [encode_tree(child) for child in node['children']]))
+
+
+def decode_tree(encoded):
+    fields, children = marshal.loads(encoded)
+    if children is None:
+        return fields
+    fields['children'] = children
+    return EncodedNode(fields)
+
+
+class SharedTreeCache(BaseCache):
+    """Cache stored in a SQLite database on local disk (memory-mapped), so
+    that it can be shared by all of the worker processes on a host rather
+    than each keeping its own copy of every tree. Regulation trees are
+    stored such that their nodes are decoded lazily (see EncodedNode); other
+    values are pickled.
+
+    Rather than a number of entries, the cache is limited to MAX_BYTES of
+    (encoded) values; the least recently used entries are evicted first.
+    Recency is tracked to within ACCESS_RESOLUTION seconds, to avoid a write
+    on every read. Hits, misses and evictions are counted across all
+    processes; see `stats`"""
+    #   Entry kinds
+    PICKLED, TREE = 0, 1
+    #   Per-process hit/miss counts are written out this often
+    STATS_FLUSH = 100
+
+    def __init__(self, location, params):
+        super(SharedTreeCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_bytes = int(options.get('MAX_BYTES', 512 * 1024 * 1024))
+        self.mmap_size = int(options.get('MMAP_SIZE', self.max_bytes * 2))
+        self.access_resolution = options.get('ACCESS_RESOLUTION', 10)
+        self._local = threading.local()
+        self._counts = {'hits': 0, 'misses': 0}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """SQLite connections can't be shared between threads (or forked
+        processes), so each gets its own"""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA mmap_size={}'.format(self.mmap_size))
+            conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, kind INTEGER, value BLOB, '
+                         'size INTEGER, expires REAL, accessed REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed '
+                         'ON entries (accessed)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters ('
+                         'name TEXT PRIMARY KEY, value INTEGER)')
+            self._local.connection, self._local.pid = conn, os.getpid()
+        return self._local.connection
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.connection
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _add_counts(conn, counts):
+        for name, delta in counts.items():
+            if delta:
+                conn.execute('INSERT OR IGNORE INTO counters VALUES (?, 0)',
+                             (name,))
+                conn.execute('UPDATE counters SET value = value + ? '
+                             'WHERE name = ?', (delta, name))
+
+    def _count(self, name):
+        with self._counts_lock:
+            self._counts[name] += 1
+            flush = sum(self._counts.values()) >= self.STATS_FLUSH
+        if flush:
+            self._flush_counts()
+
+    def _flush_counts(self):
+        with self._counts_lock:
+            counts, self._counts = self._counts, {'hits': 0, 'misses': 0}
+        with self._transaction() as conn:
+            self._add_counts(conn, counts)
+
+    def _encode(self, value):
+        if is_tree(value):
+            try:
+                return self.TREE, encode_tree(value)
+            except ValueError:
+                pass
+        return self.PICKLED, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, kind, stored):
+        stored = bytes(stored)
+        if kind == self.TREE:
+            return decode_tree(stored)
+        return pickle.loads(stored)
+
+    def _delete_entry(self, conn, key):
+        row = conn.execute('SELECT size FROM entries WHERE key = ?',
+                           (key,)).fetchone()
+        if row:
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._add_counts(conn, {'bytes': -row[0]})
+        return bool(row)
+
+    def _evict(self, conn, now):
+        """Remove expired, then least recently used, entries until we're
+        within budget"""
+        row = conn.execute("SELECT value FROM counters WHERE name = 'bytes'"
+                           ).fetchone()
+        excess = (row[0] if row else 0) - self.max_bytes
+        if excess <= 0:
+            return
+        evicted, freed = 0, 0
+        expired = conn.execute('SELECT key, size FROM entries '
+                               'WHERE expires <= ?', (now,)).fetchall()
+        for key, size in expired:
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            freed += size
+        while freed < excess:
+            rows = conn.execute('SELECT key, size FROM entries '
+                                'ORDER BY accessed LIMIT 32').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if freed >= excess:
+                    break
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                freed += size
+                evicted += 1
+        self._add_counts(conn, {'bytes': -freed, 'evictions': evicted})
+
+    def _set(self, key, value, timeout, replace=True):
+        kind, encoded = self._encode(value)
+        if len(encoded) > self.max_bytes:
+            if replace:
+                # Don't leave a stale value behind
+                with self._transaction() as conn:
+                    self._delete_entry(conn, key)
+            return False
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        with self._transaction() as conn:
+            row = conn.execute('SELECT expires FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+            if row and not replace and (row[0] is None or row[0] > now):
+                return False
+            self._delete_entry(conn, key)
+            conn.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, kind, sqlite3.Binary(encoded), len(encoded),
+                          expires, now))
+            self._add_counts(conn, {'bytes': len(encoded)})
+            self._evict(conn, now)
+        return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._set(key, value, timeout, replace=False)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._set(key, value, timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        row = self.connection.execute(
+            'SELECT kind, value, expires, accessed FROM entries '
+            'WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[2] is not None and row[2] <= now):
+            self._count('misses')
+            return default
+        kind, stored, _, accessed = row
+        try:
+            value = self._decode(kind, stored)
+        except (ValueError, EOFError, TypeError, pickle.PickleError):
+            self.delete(key)
+            self._count('misses')
+            return default
+        if now - accessed >= self.access_resolution:
+            with self._transaction() as conn:
+                conn.execute('UPDATE entries SET accessed = ? '
+                             'WHERE key = ?', (now, key))
+        self._count('hits')
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._transaction() as conn:
+            self._delete_entry(conn, key)
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM entries')
+            conn.execute("DELETE FROM counters WHERE name = 'bytes'")
+
+    def stats(self):
+        """Entries and bytes stored, along with the hits, misses and
+        evictions (of all processes) since the cache was created"""
+        self._flush_counts()
+        conn = self.connection
+        stats = dict.fromkeys(('bytes', 'hits', 'misses', 'evictions'), 0)
+        stats.update(conn.execute('SELECT name, value FROM counters'))
+        stats['entries'] = conn.execute('SELECT COUNT(*) FROM entries'
+                                        ).fetchone()[0]
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+def key_prefix(key):
+    """The kind of API data (e.g. "regulation", "layer", "diff") a cache key
+    (as generated by `make_key`) refers to"""
+    return key.split(':', 2)[-1].split('-', 1)[0]
+
+
+def stored_size(stored):
+    """Approximate bytes used by a value as stored by FrozenTreeCache"""
+    if isinstance(stored, bytes):
+        return len(stored)
+    try:
+        return len(marshal.dumps(stored))
+    except ValueError:
+        return 0
+
+
+class FrequencySketch(object):
+    """Approximate count of how often each key has been requested recently
+    (a count-min sketch, as used by TinyLFU). Counts are capped at 15 and
+    halved every `10 * width` increments, so that old popularity fades"""
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width=4096):
+        self.width = width
+        self.rows = [[0] * width for _ in range(self.DEPTH)]
+        self.increments = 0
+
+    def _indexes(self, key):
+        """A different counter in each row (via double hashing)"""
+        first = hash(key)
+        second = (first >> 16) | 1
+        return [(first + row * second) % self.width
+                for row in range(self.DEPTH)]
+
+    def increment(self, key):
+        for row, idx in zip(self.rows, self._indexes(key)):
+            if row[idx] < self.MAX_COUNT:
+                row[idx] += 1
+        self.increments += 1
+        if self.increments >= 10 * self.width:
+            self.increments //= 2
+            for row in self.rows:
+                row[:] = [count // 2 for count in row]
+
+    def estimate(self, key):
+        return min(row[idx]
+                   for row, idx in zip(self.rows, self._indexes(key)))
+
+
+def _new_usage():
+    return dict.fromkeys(('entries', 'bytes', 'hits', 'misses', 'evictions',
+                          'rejections'), 0)
+
+
+class ByteBudget(object):
+    """Tracks the size and recency of each entry in a cache, deciding which
+    to evict to stay within `max_bytes`. Entries are evicted least recently
+    used first, but a new entry is only admitted (TinyLFU-style) if it's
+    requested at least as often as the (byte-weighted) entries it would
+    displace, so a single large, rarely used tree can't flush many small,
+    popular entries. Usage is tallied per key prefix"""
+    def __init__(self, max_bytes, sketch_width=4096):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> (size, prefix); LRU first
+        self.bytes = 0
+        self.sketch = FrequencySketch(sketch_width)
+        self.usage = defaultdict(_new_usage)
+        self.lock = threading.Lock()
+
+    def _remove(self, key):
+        size, prefix = self.entries.pop(key)
+        self.bytes -= size
+        self.usage[prefix]['entries'] -= 1
+        self.usage[prefix]['bytes'] -= size
+
+    def record_get(self, key, hit):
+        with self.lock:
+            self.sketch.increment(key)
+            self.usage[key_prefix(key)]['hits' if hit else 'misses'] += 1
+            if hit and key in self.entries:
+                # Move to the most recently used end
+                self.entries[key] = self.entries.pop(key)
+
+    def admit(self, key, size):
+        """Account for storing `size` bytes at `key`. Returns whether to
+        store it and the keys which must be evicted to make room"""
+        prefix = key_prefix(key)
+        with self.lock:
+            replacing = key in self.entries
+            if replacing:
+                self._remove(key)
+            if size > self.max_bytes:
+                self.usage[prefix]['rejections'] += 1
+                return False, []
+
+            victims, freed, displaced = [], 0, 0
+            needed = self.bytes + size - self.max_bytes
+            for victim, (victim_size, _) in self.entries.items():
+                if freed >= needed:
+                    break
+                victims.append(victim)
+                freed += victim_size
+                displaced += self.sketch.estimate(victim) * victim_size
+            frequency = max(1, self.sketch.estimate(key))
+            if not replacing and frequency * size < displaced:
+                self.usage[prefix]['rejections'] += 1
+                return False, []
+
+            for victim in victims:
+                self.usage[self.entries[victim][1]]['evictions'] += 1
+                self._remove(victim)
+            self.entries[key] = (size, prefix)
+            self.bytes += size
+            self.usage[prefix]['entries'] += 1
+            self.usage[prefix]['bytes'] += size
+            return True, victims
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            for usage in self.usage.values():
+                usage['entries'] = usage['bytes'] = 0
+
+    def stats(self):
+        with self.lock:
+            prefixes = dict((prefix, dict(usage))
+                            for prefix, usage in self.usage.items())
+            stats = _new_usage()
+            for usage in prefixes.values():
+                for name, value in usage.items():
+                    stats[name] += value
+            stats['max_bytes'] = self.max_bytes
+            stats['prefixes'] = prefixes
+            return stats
+
+
+_budgets = {}
+
+
+class BudgetedTreeCache(FrozenTreeCache):
+    """A FrozenTreeCache limited by the bytes it holds (MAX_BYTES) rather
+    than by its number of entries; see ByteBudget. As each process has its
+    own copy, stats can be published (every STATS_INTERVAL seconds) to
+    STATS_FILE.<pid> for the cache_stats command to collect"""
+    def __init__(self, name, params):
+        super(BudgetedTreeCache, self).__init__(name, params)
+        options = params.get('OPTIONS', {})
+        if 'MAX_ENTRIES' not in options:
+            self._max_entries = sys.maxsize
+        self._budget = _budgets.setdefault(name, ByteBudget(
+            int(options.get('MAX_BYTES', 256 * 1024 * 1024)),
+            int(options.get('SKETCH_WIDTH', 4096))))
+        self.stats_file = options.get('STATS_FILE')
+        self.stats_interval = options.get('STATS_INTERVAL', 60)
+        self._published = time.time()
+
+    def get(self, key, default=None, version=None, acquire_lock=True):
+        missing = object()
+        value = super(BudgetedTreeCache, self).get(key, missing, version,
+                                                   acquire_lock)
+        self._budget.record_get(self.make_key(key, version=version),
+                                value is not missing)
+        if self.stats_file and \
+                time.time() - self._published >= self.stats_interval:
+            self.publish_stats()
+        return default if value is missing else value
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        admitted, victims = self._budget.admit(key, stored_size(value))
+        for victim in victims:
+            super(BudgetedTreeCache, self)._delete(victim)
+        if admitted:
+            super(BudgetedTreeCache, self)._set(key, value, timeout)
+        else:
+            # Don't leave a stale value behind
+            super(BudgetedTreeCache, self)._delete(key)
+
+    def _delete(self, key):
+        super(BudgetedTreeCache, self)._delete(key)
+        self._budget.remove(key)
+
+    def clear(self):
+        with self._lock.writer():
+            super(BudgetedTreeCache, self).clear()
+            self._budget.clear()
+
+    def stats(self):
+        """Entries, bytes, hits, misses, evictions and rejected entries of
+        this process, overall and per key prefix"""
+        return self._budget.stats()
+
+    def publish_stats(self):
+        self._published = time.time()
+        file_name = '{}.{}'.format(self.stats_file, os.getpid())
+        with open(file_name + '.tmp', 'w') as f:
+            json.dump(self.stats(), f)
+        os.rename(file_name + '.tmp', file_name)
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        # EPERM: it exists, but belongs to someone else
+        return err.errno == errno.EPERM
+    return True
+
+
+def published_stats(stats_file):
+    """Stats published by each (still running) process (see
+    BudgetedTreeCache), keyed by process id. Files left behind by processes
+    which have since exited are removed"""
+    directory, prefix = os.path.split(os.path.abspath(stats_file))
+    results = {}
+    for name in os.listdir(directory):
+        pid = name[len(prefix) + 1:]
+        if name.startswith(prefix + '.') and pid.isdigit():
+            file_name = os.path.join(directory, name)
+            if not process_exists(int(pid)):
+                try:
+                    os.remove(file_name)
+                except OSError:     # e.g. removed by another collector
+                    pass
+                continue
+            with open(file_name) as f:
+                results[int(pid)] = json.load(f)
+    return results
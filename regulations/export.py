@@ -0,0 +1,244 @@
+"""Render pages in-process, through the site's own URL patterns and views,
+writing them to disk as static files which a web server (or CDN) can serve
+without involving Django."""
+import gzip
+import hashlib
+import json
+import logging
+from multiprocessing import Pool
+import os
+
+from django.conf import settings
+from django.core.urlresolvers import resolve
+from django.test import RequestFactory
+
+from regulations.generator import api_reader, changes, sitemap
+
+try:
+    import brotli
+except ImportError:     # Optional; only needed for .br files
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def default_host():
+    """Requests need a host which passes ALLOWED_HOSTS validation"""
+    for host in settings.ALLOWED_HOSTS:
+        if '*' not in host:
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def render(path, host=None):
+    """Returns the response for this path, rendered"""
+    match = resolve(path)
+    request = RequestFactory().get(path, HTTP_HOST=host or default_host())
+    api_reader.start_request_memo()
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    finally:
+        api_reader.end_request_memo()
+    return response
+
+
+def output_file(output_dir, path):
+    """Pages are written as index.html files so that /1234 and /1234/5678
+    can coexist"""
+    return os.path.join(output_dir, path.strip('/'), 'index.html')
+
+
+def write_file(file_name, content, compress=True):
+    """Write the content, along with precompressed siblings (.gz and, if
+    the brotli library is installed, .br)"""
+    directory = os.path.dirname(file_name)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:     # another process may have just created it
+            if not os.path.isdir(directory):
+                raise
+
+    with open(file_name, 'wb') as f:
+        f.write(content)
+    if compress:
+        # mtime=0 so that unchanged content compresses identically
+        with open(file_name + '.gz', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                f.write(content)
+        if brotli is not None:
+            with open(file_name + '.br', 'wb') as f:
+                f.write(brotli.compress(content))
+
+
+def export_page(output_dir, page, compress=True):
+    """Render and write a single sitemap.Page. Returns the path of the file
+    written, or None if the page couldn't be rendered"""
+    path = page.path
+    try:
+        response = render(path)
+    except Exception:
+        logger.exception("Error rendering %s", path)
+        return None
+    if response.status_code != 200:
+        logger.warning("%s responded with %s", path, response.status_code)
+        return None
+
+    file_name = output_file(output_dir, path)
+    write_file(file_name, response.content, compress)
+    return file_name
+
+
+def batches(pages, size=25):
+    """Group consecutive pages of the same version (at most `size` at a
+    time), so that each worker process can reuse the API data it has
+    cached"""
+    batch = []
+    for page in pages:
+        version = page.args.get('version')
+        if batch and (len(batch) >= size or
+                      batch[-1].args.get('version') != version):
+            yield batch
+            batch = []
+        batch.append(page)
+    if batch:
+        yield batch
+
+
+def _export_batch(args):
+    """Pool.imap only passes a single argument"""
+    output_dir, pages, compress = args
+    return [(page, export_page(output_dir, page, compress))
+            for page in pages]
+
+
+def export_pages(output_dir, pages, processes=1, compress=True):
+    """Render and write each of the pages, in parallel if `processes` > 1.
+    Yields each page with the file it was written to (None on failure), in
+    completion order"""
+    tasks = ((output_dir, batch, compress) for batch in batches(pages))
+    if processes > 1:
+        pool = Pool(processes)
+        try:
+            for results in pool.imap_unordered(_export_batch, tasks):
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+    else:
+        for task in tasks:
+            for result in _export_batch(task):
+                yield result
+
+
+class SectionExport(object):
+    """Keeps a directory of a regulation's rendered sections and subterps
+    (content only, without chrome) up to date with the latest version, one
+    file per section. When moving to a new version, only those sections which
+    may have changed (see changes.affected_sections) are re-rendered; the
+    others are left as they were. A manifest records the version each file
+    is current for and a hash of its content. A file whose section failed
+    to render is left behind at its old version, so it's retried on the
+    next export"""
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, output_dir, part):
+        self.part = part
+        self.directory = os.path.join(output_dir, part)
+        self.manifest = self.load_manifest()
+
+    @staticmethod
+    def file_name(label_id):
+        return label_id + '.html'
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.directory, self.MANIFEST)) as f:
+                return json.load(f)
+        except IOError:
+            return {'part': self.part, 'version': None, 'files': {}}
+
+    def save_manifest(self):
+        """Write to a temporary file first so that the manifest is never
+        left half-written"""
+        file_name = os.path.join(self.directory, self.MANIFEST)
+        with open(file_name + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.rename(file_name + '.tmp', file_name)
+
+    def plan(self, version, full=False):
+        """Returns the label_ids of sections to render and the names of files
+        which no longer correspond to a section"""
+        labels = sitemap.toc_labels(self.part, version)
+        previous, existing = self.manifest['version'], self.manifest['files']
+
+        if full or previous is None:
+            affected = set(labels)
+        elif previous == version:
+            affected = set()
+        else:
+            affected = changes.affected_sections(self.part, previous, version)
+        to_render = [label_id for label_id in labels
+                     if label_id in affected or
+                     self.file_name(label_id) not in existing or
+                     existing[self.file_name(label_id)].get('version') !=
+                     previous]
+
+        current = set(self.file_name(label_id) for label_id in labels)
+        stale = sorted(name for name in existing if name not in current)
+        return to_render, stale
+
+    def remove(self, name):
+        for suffix in ('', '.gz', '.br'):
+            file_name = os.path.join(self.directory, name + suffix)
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        del self.manifest['files'][name]
+
+    def export(self, version, full=False, compress=True):
+        """Bring the directory up to date with `version`. Returns a dict
+        listing the label_ids "rendered" (with new content), "unchanged"
+        (rendered, but identical to what was there) and "failed", as well as
+        the names of files "deleted" (no longer in the regulation)"""
+        to_render, stale = self.plan(version, full)
+        results = {'rendered': [], 'unchanged': [], 'failed': [],
+                   'deleted': stale}
+        for name in stale:
+            self.remove(name)
+
+        files = self.manifest['files']
+        # Sections unaffected by the move to this version are current as-is
+        rendering = set(self.file_name(label_id) for label_id in to_render)
+        for name, entry in files.items():
+            if name not in rendering and \
+                    entry.get('version') == self.manifest['version']:
+                entry['version'] = version
+        for label_id in to_render:
+            page = sitemap.partial_page(label_id, version)
+            try:
+                response = render(page.path)
+            except Exception:
+                logger.exception("Error rendering %s", page.path)
+                response = None
+            if response is None or response.status_code != 200:
+                results['failed'].append(label_id)
+                continue
+
+            name = self.file_name(label_id)
+            digest = hashlib.sha256(response.content).hexdigest()
+            if files.get(name, {}).get('sha256') == digest:
+                results['unchanged'].append(label_id)
+            else:
+                write_file(os.path.join(self.directory, name),
+                           response.content, compress)
+                results['rendered'].append(label_id)
+            files[name] = {'sha256': digest, 'version': version}
+
+        self.manifest['version'] = version
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.save_manifest()
+        return results
@@ -1,7 +1,68 @@
 import json
 import os
+import random
+import threading
+
 from django.conf import settings
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from regulations.generator import executor
+
+
+class JitteredRetry(Retry):
+    """Retry policy which spreads its backoff uniformly between zero and the
+    exponential delay ("full jitter"), so that workers which failed together
+    don't all retry together"""
+    def get_backoff_time(self):
+        backoff = super(JitteredRetry, self).get_backoff_time()
+        return random.uniform(0, backoff)
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    retries = JitteredRetry(
+        total=settings.API_RETRIES, backoff_factor=settings.API_BACKOFF,
+        status_forcelist=(500, 502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_maxsize=settings.API_POOL_SIZE,
+                          max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """All ApiClients in this process share one pooled, keep-alive session.
+    It's created lazily (and re-created after a fork) so that pre-forking
+    servers don't share sockets between workers"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _build_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def pool_stats():
+    """Summarize connection reuse across the shared session's pools. A "miss"
+    is a request which needed a new connection; a "hit" reused one"""
+    stats = {'hits': 0, 'misses': 0}
+    if _session is None:
+        return stats
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats['misses'] += pool.num_connections
+            stats['hits'] += max(pool.num_requests - pool.num_connections, 0)
+    return stats
 
 
 class ApiClient:
@@ -19,12 +80,22 @@ class ApiClient:
         f.close()
         return json.loads(content)
 
+    def get_from_file_system_or_none(self, suffix):
+        """Like get_from_file_system, but missing files are treated as an
+        HTTP 404 would be"""
+        try:
+            return self.get_from_file_system(suffix)
+        except IOError:
+            return None
+
     def get(self, suffix, params={}):
-        """Make the GET request. Assume the result is JSON. Right now, there is
-        no error handling"""
+        """Make the GET request. Assume the result is JSON. Transient server
+        errors are retried by the shared session; anything else non-404 is
+        raised"""
 
         if self.base_url.startswith('http'):
-            r = requests.get(self.base_url + suffix, params=params)
+            r = get_session().get(self.base_url + suffix, params=params,
+                                  timeout=settings.API_TIMEOUT)
             if r.status_code == requests.codes.ok:
                 return r.json()
             elif r.status_code == 404:
@@ -33,3 +104,18 @@ class ApiClient:
                 r.raise_for_status()
         else:
             return self.get_from_file_system(suffix)
+
+    def get_many(self, suffixes):
+        """Retrieve several resources at once, returning their JSON (or None,
+        if not found) in the same order as the suffixes. If the API provides
+        a batch endpoint, this is a single request; otherwise, the individual
+        requests are made concurrently, on the shared executor"""
+        if not self.base_url.startswith('http'):
+            return [self.get_from_file_system_or_none(suffix)
+                    for suffix in suffixes]
+        elif settings.API_BATCH_ENDPOINT and suffixes:
+            found = self.get(settings.API_BATCH_ENDPOINT,
+                             {'path': list(suffixes)}) or {}
+            return [found.get(suffix) for suffix in suffixes]
+
+        return executor.map_ordered(self.get, suffixes)
@@ -1,8 +1,162 @@
+from collections import OrderedDict
+import copy
+import logging
+import marshal
+import threading
+
+from django.conf import settings
 from django.core.cache import caches
-from regulations.generator import api_client
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from regulations.cache_backends import CopyOnWriteNode, is_tree
+from regulations.generator import api_client, executor, generations, timing
+from regulations.generator.compact_node import materialize
+from regulations.generator.layers import tree_builder
 
 
 _cache_key = '-'.join
+_local = threading.local()
+logger = logging.getLogger(__name__)
+
+
+def _private_copy(value):
+    """A copy of (JSON) API data which shares nothing modifiable with the
+    original. For JSON data, marshal is much faster than deepcopy"""
+    if isinstance(value, CopyOnWriteNode):
+        return value.view()
+    try:
+        return marshal.loads(marshal.dumps(value))
+    except ValueError:
+        return copy.deepcopy(value)
+
+
+class RequestMemo(object):
+    """Already-deserialized API responses, shared by every ApiReader created
+    while handling a single request. Reading from the memo avoids another
+    (unpickling) trip through the api_cache. Callers modify what they're
+    given (e.g. annotating tree nodes), so the memo keeps its own copy of
+    each value and hands out copies of that: copy-on-write views of trees,
+    so only the parts walked are copied. Layer fetches happen in worker
+    threads, so access is locked"""
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.values.get(key)
+            if value is None:
+                return None
+            self.hits += 1
+        if is_tree(value) and not isinstance(value, CopyOnWriteNode):
+            return CopyOnWriteNode(value)
+        return _private_copy(value)
+
+    def set(self, key, value):
+        if value is not None:
+            value = _private_copy(value)
+            with self.lock:
+                self.values[key] = value
+
+
+def start_request_memo():
+    """Install a fresh memo for the current thread's request"""
+    _local.memo = RequestMemo()
+    return _local.memo
+
+
+def end_request_memo():
+    """Remove (and return) the current thread's memo, if present"""
+    memo = current_memo()
+    _local.memo = None
+    return memo
+
+
+def current_memo():
+    return getattr(_local, 'memo', None)
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls for the same key: while one thread (the
+    "leader") is running `do(key, fn)`, other threads calling it with that
+    key wait for, and share, its result (or exception). Counts how many
+    calls were made ("fetches") and how many were saved ("coalesced")"""
+    class Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result, self.error = None, None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.fetches, self.coalesced = 0, 0
+
+    def _join(self, keys):
+        """Returns the calls this thread must make and those it must wait
+        for"""
+        with self.lock:
+            lead = [key for key in keys if key not in self.calls]
+            follow = dict((key, self.calls[key]) for key in keys
+                          if key in self.calls)
+            for key in lead:
+                self.calls[key] = self.Call()
+            self.fetches += len(lead)
+            self.coalesced += len(follow)
+            return lead, follow
+
+    def do_many(self, keys, fn):
+        """Like `do`, but for several keys at once: `fn` is called with those
+        keys which aren't already in progress, returning a dict of their
+        results. Returns a dict of all results and the set of keys whose
+        results are shared (i.e. from other threads)"""
+        lead, follow = self._join(keys)
+        results = {}
+        if lead:
+            calls = dict((key, self.calls[key]) for key in lead)
+            try:
+                results = fn(lead)
+                for key in lead:
+                    calls[key].result = results[key]
+            except Exception as err:
+                for call in calls.values():
+                    call.error = err
+                raise
+            finally:
+                with self.lock:
+                    for key in lead:
+                        del self.calls[key]
+                for call in calls.values():
+                    call.done.set()
+
+        for key, call in follow.items():
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            results[key] = call.result
+        return results, set(follow)
+
+    def do(self, key, fn):
+        """Returns fn's result and whether this thread was the leader (i.e.
+        whether the result is its own rather than shared)"""
+        results, shared = self.do_many([key], lambda keys: {key: fn()})
+        return results[key], key not in shared
+
+    def stats(self):
+        with self.lock:
+            return {'fetches': self.fetches, 'coalesced': self.coalesced,
+                    'in_flight': len(self.calls)}
+
+
+_flights = SingleFlight()
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def flight_stats():
+    """How many API fetches this process has made and how many identical,
+    concurrent fetches were coalesced into them"""
+    return _flights.stats()
 
 
 class ApiReader(object):
@@ -12,14 +166,62 @@ class ApiReader(object):
     def __init__(self):
         self.cache = caches['api_cache']
         self.client = api_client.ApiClient()
+        # Captured here (rather than looked up per call) so that worker
+        # threads spawned during the request share it
+        self.memo = current_memo()
+
+    def _cache_get(self, cache_key):
+        """Check the request memo before falling back to the cache"""
+        if self.memo is not None:
+            value = self.memo.get(cache_key)
+            if value is not None:
+                return value
+        value = self.cache.get(cache_key)
+        if self.memo is not None:
+            self.memo.set(cache_key, value)
+        return value
+
+    def _timeouts(self, timeout):
+        """The hard timeout (when the cache drops an entry) and soft timeout
+        (after which it's stale, so refreshed in the background) of an entry.
+        Entries which never expire are never stale"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.cache.default_timeout
+        if timeout is None or not settings.API_CACHE_STALE_TIMEOUT:
+            return timeout, None
+        return timeout + settings.API_CACHE_STALE_TIMEOUT, timeout
+
+    def _store(self, cache_key, value, timeout=DEFAULT_TIMEOUT):
+        hard, soft = self._timeouts(timeout)
+        self.cache.set(cache_key, value, hard)
+        if soft is not None:
+            self.cache.set(_cache_key([cache_key, 'fresh']), True, soft)
+
+    def _cache_set(self, cache_key, value, timeout=DEFAULT_TIMEOUT):
+        self._store(cache_key, value, timeout)
+        if self.memo is not None:
+            self.memo.set(cache_key, value)
+
+    def generation(self, part=generations.ALL_PARTS):
+        """The part's current generation (see generations.token), read from
+        the generations cache only once per request"""
+        if self.memo is None:
+            return generations.token(part)
+        memo_key = _cache_key(['generation', part])
+        value = self.memo.get(memo_key)
+        if value is None:
+            value = generations.token(part)
+            self.memo.set(memo_key, value)
+        return value
 
     def all_regulations_versions(self):
         """ Get all versions, for all regulations. """
-        return self._get(['all_regulations_versions'], 'regulation')
+        return self._get(['all_regulations_versions', self.generation()],
+                         'regulation')
 
     def regversions(self, label):
         return self._get(
-            ['regversions', label],
+            ['regversions', label, self.generation(label)],
             'regulation/%s' % label)
 
     def cache_root_and_interps(self, reg_tree, version, is_root=True):
@@ -30,81 +232,246 @@ class ApiReader(object):
         if is_root or reg_tree.get('title'):
             tree_id = '-'.join(reg_tree['label'])
             cache_key = _cache_key(['regulation', tree_id, version])
-            self.cache.set(cache_key, reg_tree)
+            self.cache.set(cache_key, reg_tree,
+                           settings.API_CACHE_VERSIONED_TIMEOUT)
 
         for child in reg_tree['children']:
             if child.get('node_type') == 'interp':
                 self.cache_root_and_interps(child, version, False)
 
+    def tree_paths(self, root_label, version, root):
+        """Map each of the nodes of this (cached) root tree to its position
+        within it (see tree_builder.build_tree_paths). The mapping is cached
+        alongside the tree, so it's only built once"""
+        paths_key = _cache_key(['regulation-paths', root_label, version])
+        paths = self.cache.get(paths_key)
+        if paths is None:
+            paths = tree_builder.build_tree_paths(root)
+            self.cache.set(paths_key, paths,
+                           settings.API_CACHE_VERSIONED_TIMEOUT)
+        return paths
+
+    def subtree_from_root(self, label, version):
+        """Try to find the requested node within an already-cached root tree
+        rather than asking the API for it. Any node found is cached under its
+        own key, so later requests don't need to search for it again. The
+        root is read from the cache (rather than the request memo), so the
+        node is as the API returned it"""
+        root_label = label.split('-')[0]
+        if root_label == label:
+            return None
+        root = self.cache.get(_cache_key(['regulation', root_label, version]))
+        if root is None:
+            return None
+        path = self.tree_paths(root_label, version, root).get(label)
+        if path is None:
+            return None
+        node = tree_builder.node_at_path(root, path)
+        self.cache.set(_cache_key(['regulation', label, version]), node,
+                       settings.API_CACHE_VERSIONED_TIMEOUT)
+        return node
+
     def regulation(self, label, version):
         cache_key = _cache_key(['regulation', label, version])
-        cached = self.cache.get(cache_key)
+        cached = self._cache_get(cache_key)
+        if cached is None:
+            cached = self.subtree_from_root(label, version)
 
         if cached is not None:
-            return cached
-        else:
-            regulation = self.client.get('regulation/%s/%s' % (label, version))
+            return materialize(cached)
+
+        def store(regulation):
             # Add the tree to the cache
             if regulation:
                 self.cache_root_and_interps(regulation, version)
-                return regulation
+        regulation, shared = self._fetch(
+            'regulation/%s/%s' % (label, version), {}, store)
+        if regulation:
+            if shared:
+                regulation = (self._cache_get(cache_key) or
+                              copy.deepcopy(regulation))
+            elif self.memo is not None:
+                self.memo.set(cache_key, regulation)
+            return materialize(regulation)
+
+    def _fetch(self, api_suffix, api_params, store):
+        """Request from the API, coalescing with identical requests already
+        in progress in this process. `store` is called with the leader's
+        result. Returns the result and whether it's shared with other
+        threads"""
+        flight_key = (api_suffix, tuple(sorted(api_params.items())))
+
+        def fetch():
+            with timing.timer('api'):
+                element = self.client.get(api_suffix, api_params)
+            store(element)
+            return element
+        element, leader = _flights.do(flight_key, fetch)
+        return element, not leader
+
+    def _refresh(self, cache_key, api_suffix, api_params, timeout):
+        """Re-fetch a stale entry in the background. Only one refresh of each
+        key runs (per process) at a time"""
+        with _refreshing_lock:
+            if cache_key in _refreshing:
+                return
+            _refreshing.add(cache_key)
+
+        def store(element):
+            # Don't replace what we have with nothing (e.g. a layer in the
+            # old format, which has no data at the new format's suffix)
+            if element is not None:
+                self._store(cache_key, element, timeout)
+
+        def refresh():
+            try:
+                self._fetch(api_suffix, api_params, store)
+            except Exception:
+                logger.exception("Error refreshing %s", api_suffix)
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(cache_key)
+        executor.get_executor().submit(refresh)
+
+    def _revalidate(self, cache_key, api_suffix, api_params, timeout):
+        """If this cached entry is stale (past its soft timeout), refresh it
+        in the background"""
+        _, soft = self._timeouts(timeout)
+        if soft is not None and \
+                self._cache_get(_cache_key([cache_key, 'fresh'])) is None:
+            self._refresh(cache_key, api_suffix, api_params, timeout)
 
-    def _get(self, cache_key_elements, api_suffix, api_params={}):
-        """ Retrieve from the cache whenever possible, or get from the API """
+    def _get(self, cache_key_elements, api_suffix, api_params={},
+             timeout=DEFAULT_TIMEOUT):
+        """ Retrieve from the cache whenever possible, or get from the API.
+        Stale entries are served while being refreshed; concurrent misses
+        for the same data share a single request """
         cache_key = _cache_key(cache_key_elements)
-        cached = self.cache.get(cache_key)
+        cached = self._cache_get(cache_key)
 
         if cached is not None:
+            self._revalidate(cache_key, api_suffix, api_params, timeout)
             return cached
-        else:
-            element = self.client.get(api_suffix, api_params)
-            self.cache.set(cache_key, element)
-            return element
 
-    def layer(self, layer_name, doc_type, label_id, version=None):
+        element, shared = self._fetch(
+            api_suffix, api_params,
+            lambda element: self._cache_set(cache_key, element, timeout))
+        if shared:
+            # Don't share (mutable) data between requests
+            element = self._cache_get(cache_key) or copy.deepcopy(element)
+        return element
+
+    def _layer_location(self, layer_name, doc_type, label_id, version):
         """When retrieving layer data, we cheat a bit -- we always retrieve
         layer data corresponding to the "root" of the document, rather than
         only a subnode. We also must convert to the API format, where any
-        version information is prefixed to doc_id"""
+        version information is prefixed to doc_id. Returns the cache key
+        elements and API suffix"""
         root = label_id.split('-')[0]
         if version is None:
             doc_id = root
         else:
             doc_id = '{}/{}'.format(version, root)
-        result = self._get(
-            ('layer', layer_name, doc_type, root, str(version)),
-            'layer/{}/{}/{}'.format(layer_name, doc_type, doc_id))
-        # To remove - also try the old format for CFR layers; the API may not
-        # have been updated
+        return (('layer', layer_name, doc_type, root, str(version)),
+                'layer/{}/{}/{}'.format(layer_name, doc_type, doc_id))
+
+    @staticmethod
+    def _layer_timeout(version):
+        """Only layers of a specific version are immutable"""
+        if version is None:
+            return DEFAULT_TIMEOUT
+        return settings.API_CACHE_VERSIONED_TIMEOUT
+
+    def _old_layer_suffix(self, layer_name, doc_type, label_id, version):
+        """To remove - the old format for CFR layers; the API may not have
+        been updated"""
+        root = label_id.split('-')[0]
+        return 'layer/{}/{}/{}'.format(layer_name, root, version)
+
+    def layer(self, layer_name, doc_type, label_id, version=None):
+        key, suffix = self._layer_location(layer_name, doc_type, label_id,
+                                           version)
+        timeout = self._layer_timeout(version)
+        result = self._get(key, suffix, timeout=timeout)
         if result is None and doc_type == 'cfr':
-            result = self._get(
-                ('layer', layer_name, doc_type, root, str(version)),
-                'layer/{}/{}/{}'.format(layer_name, root, version))
+            result = self._get(key, self._old_layer_suffix(
+                layer_name, doc_type, label_id, version), timeout=timeout)
         return result
 
+    def _fetch_many(self, suffixes):
+        """Request each distinct suffix from the API (together); returns a
+        dict from suffix to its data"""
+        #   Keyed as in _fetch (without params), to coalesce with those
+        keys = [(suffix, ()) for suffix in OrderedDict.fromkeys(suffixes)]
+        if not keys:
+            return {}
+
+        def fetch(keys):
+            with timing.timer('api'):
+                data = self.client.get_many([suffix for suffix, _ in keys])
+            return dict(zip(keys, data))
+        results, shared = _flights.do_many(keys, fetch)
+        # Don't share (mutable) data between requests
+        return dict((key[0], copy.deepcopy(data) if key in shared else data)
+                    for key, data in results.items())
+
+    def layers(self, layer_args):
+        """Retrieve several layers at once. `layer_args` is a list of
+        (layer_name, doc_type, label_id, version) tuples; layer data is
+        returned in the same order. Anything not already cached is requested
+        from the API together; as with `_get`, stale entries are served while
+        being refreshed"""
+        locations = [self._layer_location(*args) for args in layer_args]
+        results = [self._cache_get(_cache_key(key)) for key, _ in locations]
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        for args, (key, suffix), result in zip(layer_args, locations,
+                                               results):
+            if result is not None:
+                self._revalidate(_cache_key(key), suffix, {},
+                                 self._layer_timeout(args[3]))
+
+        fetched = self._fetch_many([locations[idx][1] for idx in missing])
+        old_format = [idx for idx in missing
+                      if fetched[locations[idx][1]] is None and
+                      layer_args[idx][1] == 'cfr']
+        old_fetched = self._fetch_many(
+            [self._old_layer_suffix(*layer_args[idx]) for idx in old_format])
+
+        for idx in missing:
+            key, suffix = locations[idx]
+            result = fetched[suffix]
+            if idx in old_format:
+                result = old_fetched[self._old_layer_suffix(*layer_args[idx])]
+            self._cache_set(_cache_key(key), result,
+                            self._layer_timeout(layer_args[idx][3]))
+            results[idx] = result
+        return results
+
     def diff(self, label, older, newer):
         """ End point for diffs. """
         return self._get(
             ['diff', label, older, newer],
-            "diff/%s/%s/%s" % (label, older, newer))
+            "diff/%s/%s/%s" % (label, older, newer),
+            timeout=settings.API_CACHE_VERSIONED_TIMEOUT)
 
     def notices(self, part=None):
         """ End point for notice searching. Right now just a list. """
         if part:
             return self._get(
-                ['notices', part],
+                ['notices', part, self.generation(part)],
                 'notice',
                 {'part': part})
         else:
             return self._get(
-                ['notices'],
+                ['notices', self.generation()],
                 'notices')
 
     def notice(self, fr_document_number):
         """ End point for retrieving a single notice. """
         return self._get(
             ['notice', fr_document_number],
-            'notice/%s' % fr_document_number)
+            'notice/%s' % fr_document_number,
+            timeout=settings.API_CACHE_VERSIONED_TIMEOUT)
 
     def search(self, query, version=None, regulation=None, page=0):
         """Search via the API. Never cache these (that's the duty of the search
@@ -0,0 +1,96 @@
+"""Work out which sections (and subterps) of a regulation need to be
+re-rendered when moving from one version to another, so that exports can be
+updated incrementally."""
+from regulations.generator import api_reader
+from regulations.generator.generator import LayerCreator, get_diff_json
+from regulations.generator.section_url import SectionUrl
+from regulations.generator.toc import fetch_toc
+
+
+def layer_sources():
+    return sorted(set(layer_class.data_source
+                      for layer_class in LayerCreator.LAYERS.values()))
+
+
+def fetch_layers(part, version):
+    """Data source name -> that layer's data (or {}) for this version"""
+    sources = layer_sources()
+    layers = api_reader.ApiReader().layers(
+        [(source, 'cfr', part, version) for source in sources])
+    return dict((source, layer or {})
+                for source, layer in zip(sources, layers))
+
+
+def changed_labels(part, older, newer):
+    """Labels whose text, title or structure changed (per the diff), plus
+    labels whose layer data (citations, definitions, interpretations,
+    formatting, etc.) differs between the versions"""
+    labels = set(get_diff_json(part, older, newer) or {})
+    old_layers = fetch_layers(part, older)
+    new_layers = fetch_layers(part, newer)
+    for source in layer_sources():
+        old, new = old_layers[source], new_layers[source]
+        for label_id in set(old) | set(new):
+            if old.get(label_id) != new.get(label_id):
+                labels.add(label_id)
+    return labels
+
+
+def references(layers):
+    """Pairs of (label_id, referenced label_id) for each citation, use of a
+    defined term and inline interpretation"""
+    for label_id, citations in layers.get('internal-citations', {}).items():
+        for citation in citations:
+            yield label_id, '-'.join(citation['citation'])
+    for label_id, terms in layers.get('terms', {}).items():
+        if label_id != 'referenced':
+            for term in terms:
+                yield label_id, term['ref'].split(':', 1)[-1]
+    for label_id, interps in layers.get('interpretations', {}).items():
+        for interp in interps:
+            yield label_id, interp['reference']
+
+
+def prefixes(label_id):
+    """1234-5-a -> 1234, 1234-5, 1234-5-a"""
+    parts = label_id.split('-')
+    return ['-'.join(parts[:idx + 1]) for idx in range(len(parts))]
+
+
+def neighbors(toc):
+    """Label id -> the index and title of the TOC entries before and after
+    it, which navigation links to"""
+    entries = [None] + [('-'.join(el['index']), el.get('title'))
+                        for el in toc] + [None]
+    return dict((entries[idx][0], (entries[idx - 1], entries[idx + 1]))
+                for idx in range(1, len(entries) - 1))
+
+
+def affected_sections(part, older, newer):
+    """Label ids of the newer version's sections/subterps which may render
+    differently than they did in the older version: those containing
+    changes, those which cite, use definitions from or include
+    interpretations of changed labels and those whose previous/next
+    navigation changed"""
+    changed = changed_labels(part, older, newer)
+    section_url = SectionUrl()
+
+    def section_of(label_id):
+        return section_url.view_label_id(label_id.split('-'), newer)
+
+    sections = set(section_of(label_id) for label_id in changed)
+    #   Referencing a label which contains a change (e.g. an interpretation
+    #   with a modified paragraph) also counts
+    containing = set(prefix for label_id in changed
+                     for prefix in prefixes(label_id))
+    for label_id, referenced in references(fetch_layers(part, newer)):
+        if referenced in containing:
+            sections.add(section_of(label_id))
+
+    old_neighbors = neighbors(fetch_toc(part, older, flatten=True))
+    new_neighbors = neighbors(fetch_toc(part, newer, flatten=True))
+    for label_id, around in new_neighbors.items():
+        if old_neighbors.get(label_id) != around:
+            sections.add(label_id)
+
+    return sections & set(new_neighbors)
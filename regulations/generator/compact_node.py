@@ -0,0 +1,133 @@
+"""Regulation nodes are dicts, which HTMLBuilder then annotates with a dozen
+or so derived fields. For a large part, that's a lot of (per-node) dict
+overhead. CompactNode stores the fields every node has (or gains) in slots;
+anything else goes in a small dict of extras. It behaves like a dict for
+the code and templates which read and annotate nodes. As with
+CopyOnWriteNode, a tree's children are only converted when first accessed,
+so reading one branch of a large tree doesn't pay to convert the rest. See
+settings.COMPACT_TREES"""
+from django.conf import settings
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:     # pragma: no cover (Python 2)
+    from collections import Mapping, MutableMapping
+
+
+class CompactNode(MutableMapping):
+    #   Fields from the API, then those added by HTMLBuilder & co.
+    FIELDS = (
+        'label', 'text', 'children', 'node_type', 'title', 'child_labels',
+        'label_id', 'header', 'is_collapsed', 'indexes', 'html_label',
+        'markup_id', 'full_id', 'tree_level', 'human_label', 'list_level',
+        'marked_up', 'template_name', 'section_header', 'header_children',
+        'par_children', 'header_markup', 'sortable', 'paragraph_marker',
+        'interp')
+    #   Prefixed: Django's templates treat a missing attribute which is
+    #   named in dir() as an error
+    _SLOTS = dict((field, '_' + field) for field in FIELDS)
+    #   _source_children: children not yet converted (see compact_tree)
+    __slots__ = tuple('_' + field for field in FIELDS) + (
+        '_extra', '_source_children')
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        self._source_children = None
+        self.update(*args, **kwargs)
+
+    def _thaw(self):
+        if self._source_children is not None:
+            self._children = [compact_tree(child)
+                              for child in self._source_children]
+            self._source_children = None
+
+    def __getitem__(self, key):
+        if key == 'children':
+            self._thaw()
+        if key in self._SLOTS:
+            try:
+                return getattr(self, self._SLOTS[key])
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key == 'children':
+            self._source_children = None
+        if key in self._SLOTS:
+            setattr(self, self._SLOTS[key], value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key == 'children':
+            self._source_children = None
+        if key in self._SLOTS:
+            try:
+                delattr(self, self._SLOTS[key])
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._SLOTS:
+            return hasattr(self, self._SLOTS[key])
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        if key == 'children':
+            self._thaw()
+        if key in self._SLOTS:
+            return getattr(self, self._SLOTS[key], default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, self._SLOTS[field]):
+                yield field
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        return CompactNode(self)
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self._extra = None
+        self._source_children = None
+        self.update(state)
+
+    def __repr__(self):
+        return 'CompactNode({!r})'.format(dict(self))
+
+
+def compact_tree(node):
+    """Copy a tree of (dict) nodes into CompactNodes. Only the root is
+    copied now; each node's children are copied when first accessed, so the
+    original tree mustn't be modified in the meantime"""
+    compact = CompactNode(node)
+    compact._source_children = compact.get('children')
+    return compact
+
+
+def materialize(tree):
+    """The tree, as nodes of the configured type"""
+    if (settings.COMPACT_TREES and isinstance(tree, Mapping)
+            and not isinstance(tree, CompactNode)):
+        return compact_tree(tree)
+    return tree
@@ -0,0 +1,116 @@
+"""A bounded pool of worker threads, shared by everything in this process
+which needs to make API requests concurrently (e.g. fetching layers)."""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class ExecutorStats(object):
+    """Counters describing how work has queued for the pool. "Depth" is the
+    number of tasks submitted but not yet started; "wait" is the time
+    between a task's submission and its start. "Serial" counts the calls
+    made one after another (from within a worker) rather than in the pool"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.serial = 0
+        self.submitted = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def enqueued(self):
+        with self.lock:
+            self.submitted += 1
+            self.depth += 1
+            self.max_depth = max(self.depth, self.max_depth)
+
+    def dequeued(self, wait):
+        with self.lock:
+            self.depth -= 1
+            self.started += 1
+            self.total_wait += wait
+            self.max_wait = max(wait, self.max_wait)
+
+    def ran_serially(self, count):
+        with self.lock:
+            self.serial += count
+
+    def as_dict(self):
+        with self.lock:
+            mean_wait = self.total_wait / self.started if self.started else 0
+            return {'serial': self.serial,
+                    'submitted': self.submitted, 'depth': self.depth,
+                    'max_depth': self.max_depth, 'started': self.started,
+                    'mean_wait': mean_wait, 'max_wait': self.max_wait}
+
+
+_stats = ExecutorStats()
+
+
+def get_executor():
+    """Created lazily (and re-created after a fork, as worker threads don't
+    survive one)"""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(settings.API_WORKERS)
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def stats():
+    return _stats.as_dict()
+
+
+def in_worker():
+    return getattr(_local, 'in_worker', False)
+
+
+def _run(fn, args, enqueued_at):
+    _stats.dequeued(time.time() - enqueued_at)
+    _local.in_worker = True
+    try:
+        return fn(*args)
+    finally:
+        _local.in_worker = False
+
+
+def submit(fn, *args):
+    """Call fn(*args) on the shared pool, returning its Future. As with
+    map_ordered, anything fn runs concurrently is run serially instead, so
+    the task never waits on the pool it occupies"""
+    _stats.enqueued()
+    return get_executor().submit(_run, fn, args, time.time())
+
+
+def map_ordered(fn, args):
+    """Call fn on each arg using the shared pool; results are returned in the
+    same order as args, regardless of which finishes first. Any exception is
+    re-raised. If called from one of the pool's own workers, the calls are
+    made serially instead, as waiting on the (bounded) pool from within it
+    could deadlock"""
+    args = list(args)
+    if len(args) < 2:
+        return [fn(arg) for arg in args]
+    if in_worker():
+        _stats.ran_serially(len(args))
+        return [fn(arg) for arg in args]
+
+    executor = get_executor()
+    futures = []
+    for arg in args:
+        _stats.enqueued()
+        futures.append(executor.submit(_run, fn, (arg,), time.time()))
+    return [future.result() for future in futures]
@@ -0,0 +1,67 @@
+"""Data specific to a version of a regulation (its tree, layers, diffs) never
+changes, so can be cached indefinitely. Lists of versions and notices (and
+the pages which display them) do change as new versions are published, so
+their cache keys include a "generation" token for the regulation. Bumping
+that token (see the bump_generation command) effectively invalidates them
+without flushing everything else."""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.urlresolvers import Resolver404, resolve
+
+
+#   The generation of data which spans all regulations (e.g. the list of
+#   all regulations); bumped along with each part's
+ALL_PARTS = 'all'
+
+
+def _cache():
+    return caches[settings.GENERATIONS_CACHE]
+
+
+def _key(part):
+    return 'generation-{}'.format(part)
+
+
+def _new_token():
+    return uuid.uuid4().hex[:8]
+
+
+def token(part=ALL_PARTS):
+    """The current generation of this regulation part. If we've never seen
+    one, start a new generation"""
+    cache, key = _cache(), _key(part)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _new_token(), None)
+        # Another process may have won the race; in any event, re-read
+        value = cache.get(key, '0')
+    return value
+
+
+def bump(part):
+    """Start a new generation of this part (and so of all parts)"""
+    cache = _cache()
+    cache.set(_key(part), _new_token(), None)
+    if part != ALL_PARTS:
+        cache.set(_key(ALL_PARTS), _new_token(), None)
+
+
+def request_part(request):
+    """The regulation part a request refers to (via its URL's label_id), if
+    any"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+    label_id = match.kwargs.get('label_id')
+    return label_id.split('-')[0] if label_id else None
+
+
+def request_token(request):
+    """Generation of the part a request refers to; if it doesn't refer to a
+    specific part, that of all parts"""
+    return token(request_part(request) or ALL_PARTS)
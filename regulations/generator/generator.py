@@ -1,11 +1,10 @@
 from importlib import import_module
 import logging
 import re
-from threading import Thread
 
 from django.conf import settings
 
-from regulations.generator import api_reader
+from regulations.generator import api_reader, timing
 from regulations.generator.layers.base import LayerBase
 from regulations.generator.layers.layers_applier import (
     InlineLayersApplier, ParagraphLayersApplier, SearchReplaceLayersApplier)
@@ -36,53 +35,40 @@ class LayerCreator(object):
 
         self.api = api_reader.ApiReader()
 
-    def get_layer_json(self, layer_name, doc_type, label_id, version=None):
-        """Hit the API to retrieve layer data"""
-        return self.api.layer(layer_name, doc_type, label_id, version)
+    def get_layers_json(self, layer_names, doc_type, label_id, version=None):
+        """Retrieve data for several layers at once, in the same order as
+        their names. The API is asked for all of them together"""
+        return self.api.layers([(layer_name, doc_type, label_id, version)
+                                for layer_name in layer_names])
 
     def add_layers(self, layer_names, doc_type, label_id, sectional=False,
                    version=None):
-        """Request a list of layers. As this might spawn multiple HTTP
-        requests, we wrap the requests in threads so they can proceed
-        concurrently."""
+        """Request a list of layers. Their data is retrieved in a single
+        batch, rather than layer-by-layer."""
         # This doesn't deal with sectional interpretations yet.
         # we'll have to do that.
-        layer_names = set(l for l in layer_names
-                          if l.lower() in LayerCreator.LAYERS)
-        results = []
-        procs = []
-
-        def one_layer(layer_name):
-            layer_class = LayerCreator.LAYERS[layer_name]
-            api_name = layer_class.data_source
-            applier_type = layer_class.layer_type
-            layer_json = self.get_layer_json(api_name, doc_type, label_id,
-                                             version)
-            results.append((api_name, applier_type, layer_class, layer_json))
-
-        #   Spawn threads
-        for layer_name in layer_names:
-            proc = Thread(target=one_layer, args=(layer_name,))
-            procs.append(proc)
-            proc.start()
-
-        #   Join them (once their work is done)
-        for proc in procs:
-            proc.join()
-
-        for api_name, applier_type, layer_class, layer_json in results:
-            if layer_json is None:
-                logging.warning("No data for %s %s %s %s", api_name, doc_type,
-                                label_id, version)
-            else:
-                layer = layer_class(layer_json)
-
-                if sectional and hasattr(layer, 'sectional'):
-                    layer.sectional = sectional
-                if hasattr(layer, 'version'):
-                    layer.version = version
-
-                self.appliers[applier_type].add_layer(layer)
+        layer_classes = [LayerCreator.LAYERS[l]
+                         for l in sorted(set(layer_names))
+                         if l.lower() in LayerCreator.LAYERS]
+        api_names = [layer_class.data_source for layer_class in layer_classes]
+        with timing.timer('layers'):
+            layer_jsons = self.get_layers_json(api_names, doc_type, label_id,
+                                               version)
+
+            for layer_class, api_name, layer_json in zip(
+                    layer_classes, api_names, layer_jsons):
+                if layer_json is None:
+                    logging.warning("No data for %s %s %s %s", api_name,
+                                    doc_type, label_id, version)
+                else:
+                    layer = layer_class(layer_json)
+
+                    if sectional and hasattr(layer, 'sectional'):
+                        layer.sectional = sectional
+                    if hasattr(layer, 'version'):
+                        layer.version = version
+
+                    self.appliers[layer_class.layer_type].add_layer(layer)
 
     def get_appliers(self):
         """ Return the appliers. """
@@ -96,18 +82,26 @@ class DiffLayerCreator(LayerCreator):
         super(DiffLayerCreator, self).__init__()
         self.newer_version = newer_version
 
-    def get_layer_json(self, layer_name, doc_type, label_id, version):
-        """Diffs contain layer data from _two_ documents, each corresponding
-        to one of the versions we're comparing. This data is then combined
-        before displaying"""
-        older_layer = self.api.layer(layer_name, doc_type, label_id, version)
-        newer_layer = self.api.layer(layer_name, doc_type, label_id,
-                                     self.newer_version)
-
+    @staticmethod
+    def combine_layers(older_layer, newer_layer):
         layer_json = dict(newer_layer)  # copy
         layer_json.update(older_layer)  # older layer takes precedence
         return layer_json
 
+    def get_layers_json(self, layer_names, doc_type, label_id, version):
+        """Diffs contain layer data from _two_ documents, each corresponding
+        to one of the versions we're comparing. This data is then combined
+        before displaying. Layers for both versions are requested in the
+        same batch"""
+        layer_jsons = self.api.layers(
+            [(layer_name, doc_type, label_id, layer_version)
+             for layer_version in (version, self.newer_version)
+             for layer_name in layer_names])
+        older_layers = layer_jsons[:len(layer_names)]
+        newer_layers = layer_jsons[len(layer_names):]
+        return [self.combine_layers(older, newer)
+                for older, newer in zip(older_layers, newer_layers)]
+
 
 def get_regulation(regulation, version):
     """ Get the regulation JSON tree. Manipulate the label a bit for easier
@@ -7,8 +7,8 @@ from itertools import takewhile
 
 from six.moves import filter, filterfalse
 
-from regulations.generator import node_types
-from regulations.generator.layers.layers_applier import LayersApplier
+from regulations.generator import node_types, timing
+from regulations.generator.layers.layers_applier import SpliceLayersApplier
 from regulations.generator.layers.internal_citation import (
     InternalCitationLayer)
 from regulations.apps import RegulationsConfig
@@ -32,12 +32,13 @@ class HTMLBuilder(object):
         pass
 
     def generate_html(self):
-        if self.diff_applier:
-            self.diff_applier.tree_changes(self.tree)
-        for layer in self.p_applier.layers.values():
-            if hasattr(layer, 'preprocess_root'):   # @todo - remove
-                layer.preprocess_root(self.tree)
-        self.process_node(self.tree)
+        with timing.timer('html'):
+            if self.diff_applier:
+                self.diff_applier.tree_changes(self.tree)
+            for layer in self.p_applier.layers.values():
+                if hasattr(layer, 'preprocess_root'):   # @todo - remove
+                    layer.preprocess_root(self.tree)
+            self.process_node(self.tree)
 
     def list_level(self, parts, node_type):
         return len(parts) - 2
@@ -81,21 +82,22 @@ class HTMLBuilder(object):
         node['list_level'] = self.list_level(node['label'], node['node_type'])
 
         if len(node['text']):
-            inline_elements = self.inline_applier.get_layer_pairs(
+            inline_pairs = self.inline_applier.get_offset_pairs(
                 node['label_id'], node['text'])
             search_elements = self.search_applier.get_layer_pairs(
                 node['label_id'])
 
+            # Always start from the source text so that processing a
+            # (shared) node a second time doesn't double-apply layers
+            text = node['text']
             if self.diff_applier:
-                node['marked_up'] = self.diff_applier.apply_diff(
-                    node['text'], node['label_id'])
+                text = self.diff_applier.apply_diff(text, node['label_id'])
 
-            layers_applier = LayersApplier()
-            layers_applier.enqueue_from_list(inline_elements)
+            layers_applier = SpliceLayersApplier()
+            layers_applier.enqueue_offsets(inline_pairs, node['text'])
             layers_applier.enqueue_from_list(search_elements)
 
-            node['marked_up'] = layers_applier.apply_layers(
-                node.get('marked_up', node['text']))
+            node['marked_up'] = layers_applier.apply_layers(text)
             node['marked_up'] = flatten_links(node['marked_up'])
 
         node = self.p_applier.apply_layers(node)
@@ -2,7 +2,8 @@ from itertools import takewhile
 
 from cached_property import cached_property
 
-from regulations.generator.layers.tree_builder import make_label_sortable
+from regulations.generator.layers.tree_builder import (
+    make_label_sortable, sort_keys)
 
 
 def sort_regtext_label(label):
@@ -46,6 +47,10 @@ class Label(object):
 
     @cached_property
     def sort_key(self):
+        # Many Labels share the same parts
+        return sort_keys.get(('Label', tuple(self.parts)), self._sort_key)
+
+    def _sort_key(self):
         if not self.is_interp:
             return tuple(sort_regtext_label(self.parts))
         else:
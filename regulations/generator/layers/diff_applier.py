@@ -1,5 +1,6 @@
 import copy
-from collections import Counter, deque, namedtuple
+from collections import (
+    Counter, OrderedDict, defaultdict, deque, namedtuple)
 
 from regulations.generator.layers import tree_builder
 
@@ -25,20 +26,50 @@ class DiffApplier(object):
         self.label_requested = label_requested
 
     def deconstruct_text(self, original):
-        self.oq = [deque([c]) for c in original]
+        """Start marking up `original`. Rather than a queue per character,
+        we only track the markup placed before and after the (few)
+        positions an edit touches, then splice them into `original` in one
+        pass (see get_text)"""
+        self.original = original
+        self.before = defaultdict(list)     # in order of insertion
+        self.after = defaultdict(list)
+
+    @property
+    def oq(self):
+        """Each character's queue of markup, as a list of deques"""
+        return [deque(self.text_around(pos, c))
+                for pos, c in enumerate(self.original)]
+
+    def _position(self, pos):
+        # Mirror list indexing, e.g. deleting the empty range starting at 0
+        return pos + len(self.original) if pos < 0 else pos
 
     def insert_text(self, pos, new_text):
-        if pos == len(self.oq):
-            self.oq[pos-1].extend(['<ins>', new_text, '</ins>'])
+        if pos == len(self.original) and pos > 0:
+            self.after[pos - 1].extend(['<ins>', new_text, '</ins>'])
         else:
-            self.oq[pos].appendleft('<ins>' + new_text + '</ins>')
+            self.before[self._position(pos)].append(
+                '<ins>' + new_text + '</ins>')
 
     def delete_text(self, start, end):
-        self.oq[start].appendleft('<del>')
-        self.oq[end-1].append('</del>')
+        self.before[self._position(start)].append('<del>')
+        self.after[self._position(end - 1)].append('</del>')
+
+    def text_around(self, pos, char):
+        """The character at `pos` with its markup. Later markup placed
+        before a character comes first"""
+        return (list(reversed(self.before.get(pos, ())))
+                + [char] + self.after.get(pos, []))
 
     def get_text(self):
-        return ''.join([''.join(d) for d in self.oq])
+        pieces, prev = [], 0
+        for pos in sorted(set(self.before) | set(self.after)):
+            pieces.append(self.original[prev:pos])
+            # Insertions into empty text have no character to surround
+            pieces.extend(self.text_around(pos, self.original[pos:pos + 1]))
+            prev = pos + 1
+        pieces.append(self.original[prev:])
+        return ''.join(pieces)
 
     def delete_all(self, text):
         """ Mark all the text passed in as deleted. """
@@ -88,17 +119,27 @@ class DiffApplier(object):
         for node in tree_hash.values():
             self.set_child_labels(node)
 
+        # Added nodes are grafted onto their parents (whether in the tree
+        # or themselves added), each parent's new children all at once
+        queued = dict(adds.queue)
+        new_children = OrderedDict()
+        orphans = []
         for label, node in adds.queue:
             p_label = '-'.join(tree_builder.parent_label(node))
             if tree_builder.parent_in_tree(p_label, tree_hash):
-                tree_builder.add_node_to_tree(node, p_label, tree_hash)
-                adds.delete(label)
+                parent = tree_hash[p_label]
+            elif p_label in queued:
+                parent = queued[p_label]
             else:
-                parent = adds.find(p_label)
-                if parent:
-                    tree_builder.add_child(parent[1], node)
-                else:
-                    original.update(node)
+                orphans.append(node)
+                continue
+            new_children.setdefault(p_label, (parent, []))[1].append(node)
+
+        for parent, children in new_children.values():
+            tree_builder.add_children(parent, children)
+        # After grafting, as this copies the node's list of children
+        for node in orphans:
+            original.update(node)
 
     def is_child_of_requested(self, label):
         """ Return true if the label is a child of the requested label.  """
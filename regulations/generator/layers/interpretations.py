@@ -1,9 +1,12 @@
 from django.http import HttpRequest
+from django.template import loader
+from django.utils.encoding import force_text
 
 #   Don't import PartialInterpView or utils directly; causes an import cycle
 from regulations import generator, views
+from regulations.generator import timing
 from regulations.generator.layers.base import LayerBase
-from regulations.generator.node_types import label_to_text
+from regulations.generator.node_types import INTERP, label_to_text
 from regulations.generator.section_url import SectionUrl
 
 
@@ -19,15 +22,88 @@ class InterpretationsLayer(LayerBase):
         self.section_url = SectionUrl()
         self.root_interp_label = None
         self.partial_view = None
+        self.markup = {}
 
     def preprocess_root(self, root):
         """The root label will allow us to use a single set of layer
         appliers and grab all interp data at once."""
         self.root_interp_label = '-'.join(root['label'] + ['Interp'])
         view_class = views.partial_interp.PartialInterpView
-        self.partial_view = view_class.as_view(
-            inline=True, appliers=view_class.mk_appliers(
-                self.root_interp_label, self.version))
+        appliers = view_class.mk_appliers(self.root_interp_label,
+                                          self.version)
+        self.partial_view = view_class.as_view(inline=True, appliers=appliers)
+        with timing.timer('interp'):
+            self.markup = self.render_interps(
+                self.references_within('-'.join(root['label'])), appliers)
+
+    def references_within(self, label_id):
+        """All of the interpretations referenced by this node or its
+        descendants, in order, without duplicates"""
+        references = []
+        for text_index in sorted(self.layer):
+            if text_index == label_id or text_index.startswith(
+                    label_id + '-'):
+                for layer_element in self.layer[text_index] or []:
+                    if layer_element['reference'] not in references:
+                        references.append(layer_element['reference'])
+        return references
+
+    def request(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        return request
+
+    def render_interps(self, references, appliers):
+        """Rather than running a PartialInterpView per interpretation, build
+        the HTML for all of them in one pass (sharing layer appliers) and
+        render each with PartialInterpView's template. Returns a dict of
+        reference -> markup (text); anything missing will be rendered via
+        the view"""
+        if not references:
+            return {}
+        #   Fetching the root interpretation caches its descendants, so the
+        #   references can be pulled from the cache
+        generator.generator.get_tree_paragraph(self.root_interp_label,
+                                               self.version)
+        trees = {}
+        for reference in references:
+            tree = generator.generator.get_tree_paragraph(reference,
+                                                          self.version)
+            if tree is not None:
+                trees[reference] = tree
+        if not trees:
+            return {}
+
+        #   A node which has already been built (e.g. the same node returned
+        #   for two references) mustn't be marked up a second time
+        unbuilt = []
+        for reference in references:
+            tree = trees.get(reference)
+            if tree is not None and 'marked_up' not in tree and \
+                    not any(tree is other for other in unbuilt):
+                unbuilt.append(tree)
+        views.partial.generate_html({
+            'label': self.root_interp_label.split('-'), 'text': '',
+            'node_type': INTERP, 'children': unbuilt}, appliers)
+
+        template = loader.get_template(
+            views.partial_interp.PartialInterpView.template_name)
+        request = self.request()
+        return dict(
+            (reference, template.render({
+                'label_id': reference, 'version': self.version,
+                'inline': True,
+                'c': {'node_type': INTERP, 'children': [tree]}}, request))
+            for reference, tree in trees.items())
+
+    def render_interp(self, reference):
+        """Fall back to rendering an interpretation via the view. As with
+        render_interps, returns text"""
+        with timing.timer('interp'):
+            response = self.partial_view(self.request(), label_id=reference,
+                                         version=self.version)
+            response.render()
+        return force_text(response.content, response.charset)
 
     def apply_layer(self, text_index):
         """Return a pair of field-name + interpretation if one applies."""
@@ -43,16 +119,12 @@ class InterpretationsLayer(LayerBase):
             for layer_element in self.layer[text_index]:
                 reference = layer_element['reference']
 
-                request = HttpRequest()
-                request.method = 'GET'
-                response = self.partial_view(request, label_id=reference,
-                                             version=self.version)
-                response.render()
-
                 interp = {
                     'label_id': reference,
-                    'markup': response.content,
+                    'markup': self.markup.get(reference),
                 }
+                if interp['markup'] is None:
+                    interp['markup'] = self.render_interp(reference)
 
                 ref_parts = reference.split('-')
                 interp['section_id'] = self.section_url.interp(
@@ -1,3 +1,5 @@
+from bisect import bisect_right, insort
+from collections import deque
 import re
 
 from six.moves.queue import PriorityQueue
@@ -72,6 +74,199 @@ class LayersApplier(object):
         return self.text
 
 
+class SpliceLayersApplier(object):
+    """ Applies the same (original, replacement, locations) elements as
+    LayersApplier, with the same results, but without rewriting the whole
+    text once per element. Matches are found among the text's visible
+    (non-tag) characters; each replacement is recorded as markup to insert
+    at an offset (or a span of text to swap out) and the marked-up text is
+    assembled in a single pass at the end. The rare inputs whose results
+    depend on LayersApplier's repeated re-scanning and unescaping (HTML
+    entities, stray angle brackets, replacements which add visible text where
+    later elements could match it) are handed to LayersApplier instead. """
+    HTML_TAG_REGEX = LayersApplier.HTML_TAG_REGEX
+    # Tags, then text, then tags
+    WRAPPING_REGEX = re.compile(r'^((?:<[^>]*?>)*)([^<]*)((?:<[^>]*?>)*)$')
+
+    def __init__(self):
+        self.elements = []
+        self.offset_pairs = []
+        self.offsets_text = None
+
+    def enqueue_from_list(self, elements_list):
+        for le in elements_list:
+            self.enqueue(le)
+
+    def enqueue(self, layer_element):
+        original, replacement, locations = layer_element
+        self.elements.append((original, replacement, locations))
+
+    def enqueue_offsets(self, layer_pairs, original_text):
+        """ Inline layers identify what to replace by its (start, end) offset
+        within the node's original text. If that's the text we're marking up,
+        these are applied directly; otherwise, they're converted to
+        locations, as LayersApplier requires. """
+        self.offset_pairs.extend(layer_pairs)
+        self.offsets_text = original_text
+
+    def offsets_to_locations(self):
+        self.enqueue_from_list(InlineLayersApplier.to_locations(
+            self.offset_pairs, self.offsets_text))
+        self.offset_pairs = []
+
+    def apply_layers(self, original_text):
+        if self.offset_pairs and (original_text != self.offsets_text or
+                                  '<' in original_text):
+            self.offsets_to_locations()
+        text = self.splice(original_text)
+        if text is None:
+            self.offsets_to_locations()
+            applier = LayersApplier()
+            applier.enqueue_from_list(self.elements)
+            text = applier.apply_layers(original_text)
+        return text
+
+    def split_markup(self, text):
+        """Separate text into its visible characters and a dict of offset (in
+        the visible characters) -> tags at that offset"""
+        visible, markup = [], {}
+        offset, index = 0, 0
+        for match in self.HTML_TAG_REGEX.finditer(text):
+            visible.append(text[index:match.start()])
+            offset += match.start() - index
+            markup.setdefault(offset, deque()).append(match.group(0))
+            index = match.end()
+        visible.append(text[index:])
+        return ''.join(visible), markup
+
+    @staticmethod
+    def replaceable(start, end, boundaries, removed_starts, removed):
+        """Text can be replaced if it neither crosses a tag nor falls within
+        text that's already been swapped out"""
+        idx = bisect_right(boundaries, start)
+        if idx < len(boundaries) and boundaries[idx] < end:
+            return False
+        if removed_starts:
+            idx = bisect_right(removed_starts, start) - 1
+            return idx < 0 or removed[removed_starts[idx]] < end
+        return True
+
+    def matches(self, visible, original, *args):
+        """Find (possibly overlapping), replaceable occurrences of original"""
+        start = visible.find(original)
+        while start != -1:
+            end = start + len(original)
+            if self.replaceable(start, end, *args):
+                yield start, end
+            start = visible.find(original, start + 1)
+
+    def sorted_elements(self):
+        """Longest first, as with LayersApplier. Inline layer pairs with the
+        same original and replacement are grouped, as they can be applied
+        together"""
+        elements = [((-len(o), o, r, 0, l), o, r, l, None)
+                    for o, r, l in self.elements]
+        grouped = {}
+        for original, replacement, offset in self.offset_pairs:
+            grouped.setdefault((original, replacement), []).append(
+                tuple(offset))
+        for (original, replacement), offsets in grouped.items():
+            offsets.sort()
+            elements.append(((-len(original), original, replacement, 1,
+                              offsets), original, replacement, None, offsets))
+        elements.sort(key=lambda el: el[0])
+        return [el[1:] for el in elements]
+
+    def splice(self, text):
+        """Returns the marked-up text, or None if we can't guarantee the same
+        results as LayersApplier"""
+        elements = self.sorted_elements()
+        if not elements:
+            return text
+        if '&' in text or any('&' in r or not o for o, r, _, _ in elements):
+            return None
+        visible, markup = self.split_markup(text)
+        if '<' in visible:
+            return None
+
+        boundaries = sorted(markup)
+        removed, removed_starts, removed_texts = {}, [], []
+
+        for original, replacement, locations, offsets in elements:
+            if any(original in t for t in removed_texts):
+                return None
+            wrapping = self.WRAPPING_REGEX.match(replacement)
+            if wrapping and wrapping.group(2) == original:
+                prefix, suffix = wrapping.group(1), wrapping.group(3)
+                if not prefix and not suffix:
+                    continue
+            else:
+                segments = self.HTML_TAG_REGEX.split(replacement)
+                if (len(segments) < 2 or segments[0] or segments[-1] or
+                        '<' in ''.join(segments)):
+                    return None
+                removed_texts.append(''.join(segments))
+                prefix, suffix = None, None
+
+            spans, last_end = [], 0
+            if offsets is not None:
+                for start, end in offsets:
+                    if (start >= last_end and
+                            visible[start:end] == original and
+                            self.replaceable(start, end, boundaries,
+                                             removed_starts, removed)):
+                        spans.append((start, end))
+                        last_end = end
+                candidates = []
+            else:
+                candidates = self.matches(visible, original, boundaries,
+                                          removed_starts, removed)
+            locations = set(locations or [])
+            for idx, (start, end) in enumerate(candidates):
+                if locations and idx not in locations:
+                    continue
+                # As with LayersApplier.replace_all, text after the last tag
+                # is left alone
+                if not locations and (not boundaries or
+                                      end > boundaries[-1]):
+                    break
+                if start < last_end:
+                    if locations:   # overlapping replacements; undefined
+                        return None
+                    continue
+                spans.append((start, end))
+                last_end = end
+
+            # Markup added at an offset goes after whatever's already there
+            # when opening, before it when closing
+            for start, end in spans:
+                if prefix is None:
+                    markup.setdefault(start, deque()).append(replacement)
+                    removed[start] = end
+                    insort(removed_starts, start)
+                    new_boundaries = (start, end)
+                else:
+                    new_boundaries = []
+                    if prefix:
+                        markup.setdefault(start, deque()).append(prefix)
+                        new_boundaries.append(start)
+                    if suffix:
+                        markup.setdefault(end, deque()).appendleft(suffix)
+                        new_boundaries.append(end)
+                for offset in new_boundaries:
+                    idx = bisect_right(boundaries, offset)
+                    if not idx or boundaries[idx - 1] != offset:
+                        boundaries.insert(idx, offset)
+
+        chunks, index = [], 0
+        for offset in sorted(markup):
+            chunks.append(visible[index:offset])
+            chunks.extend(markup[offset])
+            index = removed.get(offset, offset)
+        chunks.append(visible[index:])
+        return ''.join(chunks)
+
+
 class LayersBase(object):
     """ Base class which keeps track of multiple laeyrs. """
     def __init__(self):
@@ -103,21 +298,37 @@ class InlineLayersApplier(LayersBase):
         self.original_text_index = None
         self.modified_text = None
 
-    def get_layer_pairs(self, text_index, original_text):
+    def get_offset_pairs(self, text_index, original_text):
+        """ (original, replacement, (start, end)) for each inline layer
+        replacement. See SpliceLayersApplier.enqueue_offsets """
         layer_pairs = []
         for layer in self.layers.values():
             layer_pairs += list(layer.apply_layer(original_text, text_index))
+        return layer_pairs
 
-        # convert from offset-based to a search and replace layer.
+    @staticmethod
+    def to_locations(layer_pairs, original_text):
+        """ Convert from offset-based to a search and replace layer. Each
+        original is only searched for once """
         layer_elements = []
+        locations_by_original = {}
 
         for o, r, offset in layer_pairs:
-            offset_locations = LocationReplace.find_all_offsets(o,
-                                                                original_text)
-            locations = [offset_locations.index(offset)]
+            if o not in locations_by_original:
+                locations_by_original[o] = dict(
+                    (offset, idx) for idx, offset in enumerate(
+                        LocationReplace.find_all_offsets(o, original_text)))
+            offset_locations = locations_by_original[o]
+            if tuple(offset) not in offset_locations:
+                raise ValueError("{} not found at {}".format(o, offset))
+            locations = [offset_locations[tuple(offset)]]
             layer_elements.append((o, r, locations))
         return layer_elements
 
+    def get_layer_pairs(self, text_index, original_text):
+        return self.to_locations(
+            self.get_offset_pairs(text_index, original_text), original_text)
+
 
 class ParagraphLayersApplier(LayersBase):
     """ Handle layers which apply to the whole paragraph. Layers include
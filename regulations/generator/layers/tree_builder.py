@@ -1,5 +1,7 @@
+from collections import OrderedDict
 import itertools
 import logging
+import threading
 
 
 class AddQueue(object):
@@ -50,6 +52,29 @@ def build_tree_hash(tree):
     return tree_hash
 
 
+def build_tree_paths(tree):
+    """ Map each of a tree's nodes' label_ids to the position of that node
+    in the tree: the index of each child walked through from the root.
+    Unlike build_tree_hash, this contains no nodes, so it can be stored
+    (and the nodes found again in another copy of the tree). """
+    paths = {}
+
+    def per_node(node, path):
+        paths[build_label(node)] = path
+        for idx, child in enumerate(node['children']):
+            per_node(child, path + [idx])
+    if tree:
+        per_node(tree, [])
+    return paths
+
+
+def node_at_path(tree, path):
+    """ The node at this position (see build_tree_paths) of the tree. """
+    for idx in path:
+        tree = tree['children'][idx]
+    return tree
+
+
 def parent_label(node):
     """This is not perfect. It can not handle children of subparts, for
     example"""
@@ -101,16 +126,69 @@ def roman_nums():
         i += 1
 
 
+#   The roman numerals we expect as paragraph markers, and the position of
+#   each (for sorting)
+ROMAN_NUMERALS = list(itertools.islice(roman_nums(), 0, 50))
+ROMAN_POSITIONS = dict((numeral, idx + 1)
+                       for idx, numeral in enumerate(ROMAN_NUMERALS))
+
+
+class SortKeyCache(object):
+    """A bounded (least recently used first out) memo of sort keys. The same
+    labels are sorted again and again (as trees are grafted, sidebars and
+    tables of contents built), so we share their (immutable) keys"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # LRU first
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, compute):
+        """The sort key for `key`, calling `compute` if it's not known"""
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                # Move to the most recently used end
+                value = self.entries[key] = self.entries.pop(key)
+                return value
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits,
+                    'misses': self.misses}
+
+
+#   Shared by each kind of sort key; keys start with the kind's name
+sort_keys = SortKeyCache(20000)
+
+
 def make_label_sortable(label, roman=False):
     """ Make labels sortable, but converting them as appropriate.
     Also, appendices have labels that look like 30(a), we make those
     appropriately sortable. """
+    return sort_keys.get(('make_label_sortable', label, roman),
+                         lambda: _make_label_sortable(label, roman))
+
 
+def _make_label_sortable(label, roman):
     if label.isdigit():
         return (int(label),)
     if roman:
-        romans = list(itertools.islice(roman_nums(), 0, 50))
-        return (1 + romans.index(label),)
+        if label not in ROMAN_POSITIONS:
+            raise ValueError('{} is not a roman numeral'.format(label))
+        return (ROMAN_POSITIONS[label],)
 
     # segment the label piece into component parts
     # e.g. 45Ai33b becomes (45, 'A', 'i', 33, 'b')
@@ -146,8 +224,7 @@ def all_children_are_roman(parent_node):
     """
     Return true if all the children of the parent node have roman labels
     """
-    romans = list(itertools.islice(roman_nums(), 0, 50))
-    roman_children = [c['label'][-1] in romans
+    roman_children = [c['label'][-1] in ROMAN_POSITIONS
                       for c in parent_node['children']]
     return len(roman_children) > 0 and all(roman_children)
 
@@ -156,9 +233,15 @@ def all_children_are_roman(parent_node):
 # Can it be removed or pulled into a shared library?
 def add_child(parent_node, node):
     "Add a child node to a parent, maintaining the order of the children."
+    add_children(parent_node, [node])
+
+
+def add_children(parent_node, nodes):
+    """Add several child nodes to a parent, ordering the children only once
+    rather than after each addition"""
 
     children = parent_node['children']
-    children.append(node)
+    children.extend(nodes)
     child_labels = set('-'.join(c['label']) for c in children)
     order = parent_node.get('child_labels', [])
 
@@ -169,6 +252,7 @@ def add_child(parent_node, node):
     else:   # Explicit sort order not present/doesn't match nodes
         logging.warning(
             "No child_labels field. Guessing at child order (probably wrong)")
+        roman_children = None
         for c in parent_node['children']:
             if c['node_type'].upper() == 'INTERP':
                 if c['label'][-1] == 'Interp':
@@ -188,7 +272,9 @@ def add_child(parent_node, node):
                     sortable = prefix_length + sortable
                 c['sortable'] = sortable
             elif c['node_type'].upper() == 'APPENDIX':
-                roman_children = all_children_are_roman(parent_node)
+                # The same for each child
+                if roman_children is None:
+                    roman_children = all_children_are_roman(parent_node)
                 c['sortable'] = make_label_sortable(c['label'][-1],
                                                     roman=roman_children)
 
@@ -0,0 +1,143 @@
+"""Enumerate the pages of the site for each regulation and version known to
+the API, e.g. to pre-render or warm them. Pages are described by the name
+of their URL pattern and its arguments rather than by path so that callers
+can tell what each page contains."""
+from collections import namedtuple, OrderedDict
+from itertools import combinations
+
+from django.core.urlresolvers import reverse
+
+from regulations.generator import api_reader
+from regulations.generator.toc import fetch_toc
+from regulations.generator.versions import (
+    fetch_regulations_and_future_versions)
+
+
+class Page(namedtuple('Page', ['url_name', 'kwargs'])):
+    """A single page of the site. `kwargs` is a tuple of (name, value)
+    pairs, so that pages are hashable"""
+    @classmethod
+    def of(cls, url_name, **kwargs):
+        return cls(url_name, tuple(sorted(kwargs.items())))
+
+    @property
+    def args(self):
+        return dict(self.kwargs)
+
+    @property
+    def path(self):
+        return reverse(self.url_name, kwargs=self.args)
+
+
+def part_versions(parts=None):
+    """Map each regulation part (or only those requested) to its versions'
+    ids, ordered by effective date"""
+    regulations = fetch_regulations_and_future_versions()
+    result = OrderedDict()
+    for part in sorted(regulations):
+        if parts and part not in parts:
+            continue
+        versions = sorted(regulations[part], key=lambda v: v['by_date'])
+        result[part] = [v['version'] for v in versions]
+    return result
+
+
+def toc_labels(part, version):
+    """Label ids of the sections, appendices and subterps which make up this
+    version of the regulation, in TOC order"""
+    return ['-'.join(el['index'])
+            for el in fetch_toc(part, version, flatten=True)]
+
+
+def is_subterp(label_id):
+    return label_id.endswith('-Interp')
+
+
+def diff_labels(labels, part):
+    """Diffs are displayed per section/appendix, with all interpretations
+    shown together"""
+    diffs = [label for label in labels if not is_subterp(label)]
+    if len(diffs) < len(labels):
+        diffs.append(part + '-Interp')
+    return diffs
+
+
+def partial_page(label_id, version):
+    """The page holding just the content (no chrome) of this section or
+    subterp"""
+    if is_subterp(label_id):
+        return Page.of('partial_subterp_view', label_id=label_id,
+                       version=version)
+    return Page.of('partial_section_view', label_id=label_id,
+                   version=version)
+
+
+def version_pages(part, version, labels=None):
+    """Pages for the whole of a single version of a regulation, plus each of
+    its sections and subterps (or only those in `labels`)"""
+    if labels is None:
+        yield Page.of('chrome_regulation_view', label_id=part,
+                      version=version)
+        yield Page.of('partial_regulation_view', label_id=part,
+                      version=version)
+        labels = toc_labels(part, version)
+    for label_id in labels:
+        if is_subterp(label_id):
+            names = ('chrome_subterp_view', 'partial_subterp_view')
+        else:
+            names = ('chrome_section_view', 'partial_section_view')
+        for url_name in names:
+            yield Page.of(url_name, label_id=label_id, version=version)
+
+
+def diff_pages(part, older, newer, labels=None):
+    """Pages comparing two versions of a regulation, section by section (or
+    only those in `labels`)"""
+    if labels is None:
+        labels = diff_labels(toc_labels(part, newer), part)
+    for label_id in labels:
+        for url_name in ('chrome_section_diff_view',
+                         'partial_section_diff_view'):
+            yield Page.of(url_name, label_id=label_id, version=older,
+                          newer_version=newer)
+
+
+def sxs_pages(part, version):
+    """The section-by-section analyses referenced by this version. Only the
+    partial is listed; the chrome version depends on query parameters"""
+    analyses = api_reader.ApiReader().layer(
+        'analyses', 'cfr', part, version) or {}
+    for label_id in sorted(analyses):
+        for analysis in analyses[label_id]:
+            notice_id, label = analysis['reference']
+            yield Page.of('paragraph_sxs_view', label_id=label,
+                          notice_id=notice_id)
+
+
+def version_pairs(versions, diffs):
+    """Which (older, newer) version pairs to compare: 'all', only 'adjacent'
+    versions or 'none'"""
+    if diffs == 'all':
+        return list(combinations(versions, 2))
+    elif diffs == 'adjacent':
+        return list(zip(versions, versions[1:]))
+    return []
+
+
+def all_pages(parts=None, diffs='all', sxs=True):
+    """Every page of the site for these parts (default: all), without
+    duplicates"""
+    seen = set()
+    for part, versions in part_versions(parts).items():
+        pages = [Page.of('regulation_landing_view', label_id=part)]
+        for version in versions:
+            pages.extend(version_pages(part, version))
+            if sxs:
+                pages.extend(sxs_pages(part, version))
+        for older, newer in version_pairs(versions, diffs):
+            pages.extend(diff_pages(part, older, newer))
+
+        for page in pages:
+            if page not in seen:
+                seen.add(page)
+                yield page
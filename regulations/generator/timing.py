@@ -0,0 +1,80 @@
+"""Per-request timings of the phases of rendering a page (API fetches, layer
+construction, HTML building, etc.). Timings are only collected while a
+request is being timed (see ServerTimingMiddleware); otherwise `timer` does
+almost nothing."""
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import timeit
+
+
+_local = threading.local()
+
+
+class RequestTimings(object):
+    """Total duration and count of each named phase. Phases may nest within
+    other phases (API fetches happen while building layers); a phase nested
+    within itself (e.g. HTMLBuilder.process_node's recursion, or an
+    interpretation rendered inside a section) is only counted once"""
+    def __init__(self):
+        self.started = timeit.default_timer()
+        self.phases = OrderedDict()
+        self.active = set()
+
+    def add(self, name, seconds):
+        total, count = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + seconds, count + 1)
+
+    def elapsed(self):
+        return timeit.default_timer() - self.started
+
+    def as_dict(self):
+        """Phase name -> {"ms": total milliseconds, "count": count}"""
+        return OrderedDict(
+            (name, OrderedDict([('ms', round(total * 1000, 3)),
+                                ('count', count)]))
+            for name, (total, count) in self.phases.items())
+
+    def header(self, total_name='total'):
+        """Format as a Server-Timing header value"""
+        metrics = ['{};dur={:.3f};desc="{} calls"'.format(
+                   name, total * 1000, count)
+                   for name, (total, count) in self.phases.items()]
+        metrics.append('{};dur={:.3f}'.format(
+            total_name, self.elapsed() * 1000))
+        return ', '.join(metrics)
+
+
+def start_request_timings():
+    """Start timing the current thread's request"""
+    _local.timings = RequestTimings()
+    return _local.timings
+
+
+def end_request_timings():
+    """Stop timing the current thread's request, returning its timings, if
+    present"""
+    timings = current_timings()
+    _local.timings = None
+    return timings
+
+
+def current_timings():
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def timer(name):
+    """Time the wrapped block as (part of) the phase `name`"""
+    timings = current_timings()
+    if timings is None or name in timings.active:
+        yield
+        return
+
+    timings.active.add(name)
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        timings.add(name, timeit.default_timer() - start)
+        timings.active.discard(name)
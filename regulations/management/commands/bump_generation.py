@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from regulations.generator import generations
+
+
+class Command(BaseCommand):
+    help = ('Invalidate cached lists of versions and notices (and the pages '
+            'showing them) for regulations, e.g. after publishing a new '
+            'version. Cached data specific to a version is kept')
+
+    def add_arguments(self, parser):
+        parser.add_argument('parts', nargs='*',
+                            help='Regulation parts (e.g. 1005); if none, '
+                                 'only data spanning all regulations')
+
+    def handle(self, *args, **options):
+        for part in options['parts'] or [generations.ALL_PARTS]:
+            generations.bump(part)
+            self.stdout.write('New generation for {}: {}'.format(
+                part, generations.token(part)))
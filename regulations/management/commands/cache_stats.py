@@ -0,0 +1,57 @@
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from regulations.cache_backends import published_stats
+
+
+#   Limits which apply to each process separately, so aren't summed
+PER_PROCESS = ('max_bytes',)
+
+
+def combine(stats):
+    """Sum each of the (possibly nested) counts across processes. Per-process
+    limits are reported as their maximum"""
+    total = {}
+    for process_stats in stats:
+        for name, value in process_stats.items():
+            if isinstance(value, dict):
+                total[name] = combine([total.get(name, {}), value])
+            elif name in PER_PROCESS:
+                total[name] = max(total.get(name, 0), value)
+            else:
+                total[name] = total.get(name, 0) + value
+    return total
+
+
+class Command(BaseCommand):
+    help = ('Print the hit, miss, eviction and size statistics of caches '
+            'which track them (e.g. api_cache), as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*',
+                            help='Caches to report on (default: all)')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or sorted(settings.CACHES)
+        unknown = set(aliases) - set(settings.CACHES)
+        if unknown:
+            raise CommandError('Unknown cache(s): {}'.format(
+                ', '.join(sorted(unknown))))
+
+        results = {}
+        for alias in aliases:
+            cache = caches[alias]
+            if getattr(cache, 'stats_file', None):
+                # In-memory caches, whose stats are published by each
+                # process using them
+                processes = published_stats(cache.stats_file)
+                results[alias] = {'processes': processes,
+                                  'total': combine(processes.values())}
+            elif hasattr(cache, 'stats'):
+                results[alias] = cache.stats()
+            else:
+                results[alias] = None
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
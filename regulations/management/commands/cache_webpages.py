@@ -1,17 +1,36 @@
 from django.core.management.base import BaseCommand
-from eregs_cache import EregsCache
-import sys
+
+from regulations.management.commands.eregs_cache import EregsCache
 
 
 class Command(BaseCommand):
-    args = ("<url where eregulations is located> <optional- comma seperated "
-            "list of regulation locations to be parsed >")
     help = 'call every page in eregulations allowing the pages to be cached'
 
-    def handle(self, *args, **options):
-
-        regulations_arg = None
-        if len(sys.argv) > 3:
-            regulations_arg = sys.argv[3]
+    def add_arguments(self, parser):
+        parser.add_argument('url',
+                            help='URL where eregulations is located')
+        parser.add_argument('regulations', nargs='?',
+                            help='optional, comma separated list of '
+                                 'regulations to warm')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Requests to make at once')
+        parser.add_argument('--rate', type=float,
+                            help='Maximum requests per second')
+        parser.add_argument('--checkpoint',
+                            help='File recording warmed pages; pages listed '
+                                 'there are skipped')
+        parser.add_argument('--diffs', default='adjacent',
+                            choices=('all', 'adjacent', 'none'),
+                            help='Which pairs of versions to warm diffs of')
+        parser.add_argument('--no-sxs', action='store_false', dest='sxs',
+                            help="Don't warm section-by-section analyses")
 
-        EregsCache(sys.argv[2], regulations_arg)
+    def handle(self, *args, **options):
+        parts = None
+        if options['regulations']:
+            #   Accept paths (e.g. /1005) as well as part numbers
+            parts = [reg.strip('/').split('/')[-1]
+                     for reg in options['regulations'].split(',')]
+        EregsCache(options['url'], parts, options['concurrency'],
+                   options['rate'], options['checkpoint'], options['diffs'],
+                   options['sxs'], out=self.stdout).run()
@@ -1,133 +1,166 @@
-from BeautifulSoup import BeautifulSoup
-import requests
-import threading
+"""Warm a running eRegulations site's caches by requesting each of its
+pages. Pages are listed from the API (see regulations.generator.sitemap)
+rather than by scraping the site's HTML."""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
 import sys
+import threading
 import time
+import timeit
 
-from six.moves.urllib_parse import urlparse
-
-
-class EregsCache():
-
-    @staticmethod
-    def write(msg):
-        sys.stdout.write(msg + "\n")
-
-    @staticmethod
-    def write_error(msg):
-        sys.stderr.write(msg + "\n")
-
-    def access_url(self, *args):
-
-        try:
-            req = requests.get(args[0])
-
-            status_txt = "Cached"
-            if req.status_code != 200:
-                status_txt = "Failed"
-
-            msg = "{0} (status {1}): {2}".format(
-                status_txt, str(req.status_code), req.url)
-            self.write(msg)
-        except Exception as err:
-            self.write_error("Failed: " + args[0])
-            self.write_error(str(err))
-
-    def get_main_reg_list(self):
-        try:
-            regulations_links = []
-            html = requests.get(self.full_url).text
-            soup = BeautifulSoup(html)
-            reg_list = soup.find("ul", {"class": "reg-list"})
-
-            for link in reg_list.findAll("li"):
-                regulations_links.append(link.find("a")["href"])
-
-            return regulations_links
-
-        except Exception as err:
-            self.write_error("Main Page Failed To Load")
-            self.write_error(str(err))
-
-    # figure out the partial path depending on root location of eregs
-    def get_partial_url(self,  href):
-
-        href = href.split("/")
-
-        if self.full_url != self.base_url:
-            href[1] += "/partial"
-        else:
-            href[0] += "/partial"
-
-        href = '/'.join(href)
-
-        href = href.split("#")[0]
-
-        return self.base_url + href
-
-    def __init__(self, eregs_url, regulations=None):
-        """ kick off calling regulations website for caching purposes
-
-            Keyword arguments:
-            eregs_url -- full web url to main regulations page
-            regulations -- (optional) list of regulation paths to be processed
-        """
-
-        url = urlparse(eregs_url)
-        self.base_url = url.scheme + "://" + url.netloc
-        self.full_url = eregs_url
-
-        self.write("Base Url:" + self.base_url)
-        self.write("eRegs location:" + self.full_url)
-
+import requests
+from requests.adapters import HTTPAdapter
+
+from regulations.generator import sitemap
+
+
+class RateLimiter(object):
+    """Spaces out calls to `wait` (across threads) so that no more than
+    `rate` happen per second. A rate of None means no limit"""
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint(object):
+    """Records each successfully warmed path (one per line) so that an
+    interrupted run can pick up where it left off"""
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self.done = set()
+        self.lock = threading.Lock()
+        if file_name and os.path.exists(file_name):
+            with open(file_name) as f:
+                self.done = set(line.strip() for line in f if line.strip())
+
+    def record(self, path):
+        with self.lock:
+            if self.file_name:
+                with open(self.file_name, 'a') as f:
+                    f.write(path + '\n')
+            self.done.add(path)
+
+
+class LatencyStats(object):
+    """Response times (in seconds) and statuses of each path requested.
+    Paths are requested from several threads, so access is locked"""
+    def __init__(self):
+        self.results = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, path, status, seconds):
+        with self.lock:
+            self.results.append((seconds, path, status))
+            if status != 200:
+                self.errors += 1
+
+    def error_count(self):
+        with self.lock:
+            return self.errors
+
+    def summary(self, slowest=10):
+        with self.lock:
+            times = sorted(self.results)
+            errors = self.errors
+        if not times:
+            return OrderedDict([('requests', 0)])
+
+        def percentile(pct):
+            return times[min(len(times) - 1, int(len(times) * pct))][0]
+        return OrderedDict([
+            ('requests', len(times)),
+            ('errors', errors),
+            ('mean_s', sum(t[0] for t in times) / len(times)),
+            ('p50_s', percentile(0.5)),
+            ('p95_s', percentile(0.95)),
+            ('max_s', times[-1][0]),
+            ('slowest', [OrderedDict([('path', path), ('status', status),
+                                      ('seconds', seconds)])
+                         for seconds, path, status
+                         in reversed(times[-slowest:])])])
+
+
+class EregsCache(object):
+    """Request every page of the site at `eregs_url` (the root of the
+    eRegulations app), `concurrency` at a time and no more than `rate` per
+    second"""
+    #   Seconds between progress reports
+    PROGRESS_INTERVAL = 10
+
+    def __init__(self, eregs_url, parts=None, concurrency=4, rate=None,
+                 checkpoint=None, diffs='adjacent', sxs=True, timeout=60,
+                 out=sys.stdout):
+        self.base_url = eregs_url.rstrip('/')
+        self.parts = parts
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.checkpoint = Checkpoint(checkpoint)
+        self.diffs, self.sxs = diffs, sxs
+        self.timeout = timeout
+        self.out = out
+        self.stats = LatencyStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def write(self, msg):
+        self.out.write(msg + "\n")
+
+    def paths(self):
+        """Paths of the pages yet to be warmed"""
+        pages = sitemap.all_pages(self.parts, self.diffs, self.sxs)
+        return [page.path for page in pages
+                if page.path not in self.checkpoint.done]
+
+    def access_url(self, path):
+        self.limiter.wait()
+        start = timeit.default_timer()
         try:
-            if not regulations:
-                regulations_links = self.get_main_reg_list()
-            else:
-                regulations_links = regulations.split(",")
-
-            for link in regulations_links:
-                self.write("Getting NAV links from " + self.base_url + link)
-
-                reg_nav = requests.get(self.base_url+link).text
-                soup = BeautifulSoup(reg_nav)
-                reg_soup = soup.findAll("a")
-
-                for a in reg_soup:
-                    if 'data-section-id' in a:
-                        partial = self.get_partial_url(a["href"])
-
-                        thread_count = len(threading.enumerate())
-
-                        # process 5 web pages at time. Some servers hate a lot
-                        # of requests at once.  slow it down so the threads
-                        # can catch up if there are too many threads being
-                        # processed, end process and exit out
-                        if thread_count <= 5:
-                            threading.Thread(target=self.access_url,
-                                             args=(partial, )).start()
-                        elif thread_count >= 12:
-                            self.write("URLs currently at " + str(thread_count)
-                                       + ". Server too slow")
-                            self.write("Shutting down")
-                            raise Exception("Thread Count Too High")
-                        else:
-                            self.write("Currently Processing "
-                                       + str(thread_count) + " Urls")
-                            self.write("Waiting...")
-                            time.sleep(thread_count * 2)
-
-                # let the threads catch up before doing the next batch
-                if len(threading.enumerate()) > 1:
-                    time.sleep(len(threading.enumerate()) * 2)
-
-        except Exception as err:
-            self.write_error(str(err))
-
-
-if __name__ == "__main__":
-    regulations_arg = None
-    if len(sys.argv) > 3:
-        regulations_arg = sys.argv[3]
-
-    EregsCache(sys.argv[1], regulations_arg)
+            status = self.session.get(self.base_url + path,
+                                      timeout=self.timeout).status_code
+        except requests.RequestException as err:
+            self.write("Failed: {} ({})".format(path, err))
+            status = None
+        self.stats.add(path, status, timeit.default_timer() - start)
+        if status == 200:
+            self.checkpoint.record(path)
+        elif status is not None:
+            self.write("Failed (status {}): {}".format(status, path))
+        return status
+
+    def run(self):
+        """Warm everything, reporting progress as we go. Returns a summary
+        of response times"""
+        paths = self.paths()
+        self.write("Warming {} pages ({} already done)".format(
+            len(paths), len(self.checkpoint.done)))
+        started = last_report = timeit.default_timer()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            futures = [executor.submit(self.access_url, path)
+                       for path in paths]
+            for done, _ in enumerate(as_completed(futures), 1):
+                now = timeit.default_timer()
+                if now - last_report >= self.PROGRESS_INTERVAL:
+                    last_report = now
+                    self.write("{}/{} pages, {:.1f}/s, {} errors".format(
+                        done, len(paths), done / (now - started),
+                        self.stats.error_count()))
+        summary = self.stats.summary()
+        self.write(json.dumps(summary, indent=2))
+        return summary
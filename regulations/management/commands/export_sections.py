@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from regulations.export import SectionExport
+from regulations.views.reg_landing import get_versions
+
+
+class Command(BaseCommand):
+    help = ("Write a regulation's sections as static HTML, re-rendering only "
+            "those affected since the last export")
+
+    def add_arguments(self, parser):
+        parser.add_argument('part')
+        parser.add_argument('--reg-version', dest='reg_version',
+                            help='Version to export (default: the current '
+                                 'version)')
+        parser.add_argument('--output', default=settings.OFFLINE_OUTPUT_DIR,
+                            help='Directory to write to (default: '
+                                 'settings.OFFLINE_OUTPUT_DIR)')
+        parser.add_argument('--full', action='store_true',
+                            help='Re-render every section')
+        parser.add_argument('--no-compress', action='store_false',
+                            dest='compress',
+                            help="Don't write precompressed .gz/.br files")
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set --output or settings.OFFLINE_OUTPUT_DIR')
+
+        version = options['reg_version']
+        if not version:
+            current, _ = get_versions(options['part']) or (None, None)
+            if not current:
+                raise CommandError('No versions of {}'.format(
+                    options['part']))
+            version = current['version']
+
+        export = SectionExport(options['output'], options['part'])
+        previous = export.manifest['version']
+        results = export.export(version, options['full'],
+                                options['compress'])
+        self.stdout.write('{} {} -> {}: {} rendered, {} unchanged, '
+                          '{} deleted, {} failed'.format(
+                              options['part'], previous, version,
+                              len(results['rendered']),
+                              len(results['unchanged']),
+                              len(results['deleted']),
+                              len(results['failed'])))
+        for label_id in results['failed']:
+            self.stderr.write('Failed: {}'.format(label_id))
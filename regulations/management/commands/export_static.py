@@ -0,0 +1,46 @@
+from multiprocessing import cpu_count
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from regulations import export
+from regulations.generator import sitemap
+
+
+class Command(BaseCommand):
+    help = ('Render every regulation, section, subterp, diff and '
+            'section-by-section page and write them as static HTML files')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.OFFLINE_OUTPUT_DIR,
+                            help='Directory to write to (default: '
+                                 'settings.OFFLINE_OUTPUT_DIR)')
+        parser.add_argument('--part', action='append', dest='parts',
+                            help='Only export this regulation (repeatable)')
+        parser.add_argument('--diffs', default='all',
+                            choices=('all', 'adjacent', 'none'),
+                            help='Which pairs of versions to export diffs of')
+        parser.add_argument('--no-sxs', action='store_false', dest='sxs',
+                            help="Don't export section-by-section analyses")
+        parser.add_argument('--no-compress', action='store_false',
+                            dest='compress',
+                            help="Don't write precompressed .gz/.br files")
+        parser.add_argument('--processes', type=int, default=cpu_count())
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set --output or settings.OFFLINE_OUTPUT_DIR')
+
+        pages = sitemap.all_pages(options['parts'], options['diffs'],
+                                  options['sxs'])
+        written, failed = 0, 0
+        for page, file_name in export.export_pages(
+                options['output'], pages, options['processes'],
+                options['compress']):
+            if file_name:
+                written += 1
+            else:
+                failed += 1
+                self.stderr.write('Failed: {}'.format(page.path))
+        self.stdout.write('Wrote {} pages to {} ({} failed)'.format(
+            written, options['output'], failed))
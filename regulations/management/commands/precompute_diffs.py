@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from regulations.generator import sitemap
+from regulations.views.diff import DiffRenderer
+
+
+class Command(BaseCommand):
+    help = ('Render every section of the diffs between versions of '
+            'regulations into the long-term cache, so that no visitor waits '
+            'for a diff section to render. Sections already stored are '
+            'skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--part', action='append', dest='parts',
+                            help='Only this regulation (repeatable)')
+        parser.add_argument('--diffs', default='adjacent',
+                            choices=('all', 'adjacent'),
+                            help='Which pairs of versions to render diffs of')
+
+    def handle(self, *args, **options):
+        versions = sitemap.part_versions(options['parts'])
+        for part, part_versions in versions.items():
+            for older, newer in sitemap.version_pairs(part_versions,
+                                                      options['diffs']):
+                results = DiffRenderer(part, older, newer).render_all()
+                self.stdout.write('{} {} -> {}: {} rendered, {} failed'.format(
+                    part, older, newer, len(results['rendered']),
+                    len(results['failed'])))
+                for label_id in results['failed']:
+                    self.stderr.write('Failed: {}'.format(label_id))
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from regulations.benchmarks import suite
+
+
+class Command(BaseCommand):
+    help = ('Time HTML generation against a synthetic regulation of the '
+            'requested size, printing the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sections', type=int, default=20)
+        parser.add_argument('--paragraphs', type=int, default=10,
+                            help='Paragraphs per section')
+        parser.add_argument('--terms', type=int, default=20,
+                            help='Number of defined terms')
+        parser.add_argument('--citations', type=int, default=3,
+                            help='Internal citations per paragraph')
+        parser.add_argument('--interps', type=int, default=10,
+                            help='Number of sections with interpretations')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Times to run each benchmark')
+        parser.add_argument('--only', action='append',
+                            choices=suite.Benchmarks.names(),
+                            help='Run only this benchmark (repeatable)')
+        parser.add_argument('--output', help='Write results to this file')
+
+    def handle(self, *args, **options):
+        scale = dict((key, options[key]) for key in (
+            'sections', 'paragraphs', 'terms', 'citations', 'interps',
+            'seed'))
+        results = {'scale': scale, 'results': suite.run(
+            options['repeat'], options['only'], **scale)}
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
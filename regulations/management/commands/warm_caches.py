@@ -0,0 +1,56 @@
+from collections import OrderedDict
+import json
+from multiprocessing import cpu_count
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from regulations import warm
+from regulations.generator import sitemap
+
+
+class Command(BaseCommand):
+    help = ('Fill the API and page caches by rendering every page '
+            'in-process (no web server needed), printing throughput and '
+            'cache growth as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--part', action='append', dest='parts',
+                            help='Only warm this regulation (repeatable)')
+        parser.add_argument('--diffs', default='adjacent',
+                            choices=('all', 'adjacent', 'none'),
+                            help='Which pairs of versions to warm diffs of')
+        parser.add_argument('--no-sxs', action='store_false', dest='sxs',
+                            help="Don't warm section-by-section analyses")
+        parser.add_argument('--processes', type=int, default=cpu_count())
+        parser.add_argument('--host',
+                            help='Host the site is served as; part of the '
+                                 'page caches\' keys (default: first of '
+                                 'ALLOWED_HOSTS)')
+        parser.add_argument('--https', action='store_true', dest='secure',
+                            help='The site is served over https')
+
+    def handle(self, *args, **options):
+        before = warm.cache_sizes()
+        start = timeit.default_timer()
+        pages = sitemap.all_pages(options['parts'], options['diffs'],
+                                  options['sxs'])
+        warmed, failed = 0, 0
+        for page, status, _ in warm.warm_pages(
+                pages, options['processes'], options['host'],
+                options['secure']):
+            if status == 200:
+                warmed += 1
+            else:
+                failed += 1
+                self.stderr.write(
+                    'Failed ({}): {}'.format(status, page.path))
+        elapsed = timeit.default_timer() - start
+
+        self.stdout.write(json.dumps(OrderedDict([
+            ('pages', warmed),
+            ('failed', failed),
+            ('seconds', elapsed),
+            ('pages_per_second', (warmed + failed) / elapsed),
+            ('cache_growth', warm.growth(before, warm.cache_sizes())),
+        ]), indent=2))
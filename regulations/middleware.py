@@ -0,0 +1,138 @@
+import json
+import logging
+import threading
+import timeit
+
+from django.conf import settings
+from django.middleware.cache import (
+    CacheMiddleware, FetchFromCacheMiddleware, UpdateCacheMiddleware)
+from django.utils.decorators import decorator_from_middleware_with_args
+
+from regulations.generator import (
+    api_client, api_reader, executor, generations, timing)
+from regulations.generator.layers import tree_builder
+
+
+logger = logging.getLogger(__name__)
+
+
+class ApiMemoMiddleware(object):
+    """Gives each request its own memo of API responses, so that the many
+    requests for the same TOC, meta layer, versions, etc. made while
+    rendering a single page deserialize the cached data only once"""
+    HEADER = 'X-Api-Memo-Hits'
+
+    def process_request(self, request):
+        api_reader.start_request_memo()
+
+    def process_response(self, request, response):
+        memo = api_reader.end_request_memo()
+        if memo is not None and settings.DEBUG:
+            response[self.HEADER] = str(memo.hits)
+        return response
+
+
+def process_stats():
+    """Counters kept by this process (since it started) of the worker pool,
+    API connection reuse, coalesced API fetches and label sort keys"""
+    return {'executor': executor.stats(),
+            'connections': api_client.pool_stats(),
+            'fetches': api_reader.flight_stats(),
+            'sort_keys': tree_builder.sort_keys.stats()}
+
+
+class ServerTimingMiddleware(object):
+    """When settings.SERVER_TIMING is on, time the phases of each request
+    (see regulations.generator.timing) and report them in a Server-Timing
+    header. With settings.SERVER_TIMING_LOG, they're also logged, as JSON,
+    along with the process's counters (see process_stats)"""
+    HEADER = 'Server-Timing'
+
+    def process_request(self, request):
+        if settings.SERVER_TIMING:
+            timing.start_request_timings()
+
+    def process_template_response(self, request, response):
+        """Templates are rendered after the view returns; time that too"""
+        timings = timing.current_timings()
+        if timings is not None:
+            start = timeit.default_timer()
+
+            def rendered(response):
+                timings.add('render', timeit.default_timer() - start)
+            response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        timings = timing.end_request_timings()
+        if timings is not None:
+            response[self.HEADER] = timings.header()
+            if settings.SERVER_TIMING_LOG:
+                logger.info(json.dumps({
+                    'path': request.path,
+                    'status': response.status_code,
+                    'total_ms': round(timings.elapsed() * 1000, 3),
+                    'phases': timings.as_dict(),
+                    'process': process_stats()}))
+        return response
+
+
+class GenerationKeyMixin(object):
+    """Page cache middleware whose cache keys include the generation of the
+    regulation being requested (see regulations.generator.generations), so
+    that bumping it invalidates pages listing that regulation's versions.
+    Django's cache middleware reads `key_prefix` as it goes; ours depends on
+    the request being processed (per thread)"""
+    def __init__(self, *args, **kwargs):
+        self._local = threading.local()
+        super(GenerationKeyMixin, self).__init__(*args, **kwargs)
+
+    @property
+    def key_prefix(self):
+        return getattr(self._local, 'key_prefix', self._key_prefix)
+
+    @key_prefix.setter
+    def key_prefix(self, value):
+        self._key_prefix = value
+
+    def use_generation(self, request):
+        # Computed once, so the response is stored where it was looked for
+        if not hasattr(request, '_cache_generation'):
+            request._cache_generation = generations.request_token(request)
+        self._local.key_prefix = '{}.{}'.format(self._key_prefix,
+                                                request._cache_generation)
+
+
+class GenerationUpdateCacheMiddleware(GenerationKeyMixin,
+                                      UpdateCacheMiddleware):
+    def process_response(self, request, response):
+        self.use_generation(request)
+        return super(GenerationUpdateCacheMiddleware,
+                     self).process_response(request, response)
+
+
+class GenerationFetchFromCacheMiddleware(GenerationKeyMixin,
+                                         FetchFromCacheMiddleware):
+    def process_request(self, request):
+        self.use_generation(request)
+        return super(GenerationFetchFromCacheMiddleware,
+                     self).process_request(request)
+
+
+class GenerationCacheMiddleware(GenerationKeyMixin, CacheMiddleware):
+    def process_request(self, request):
+        self.use_generation(request)
+        return super(GenerationCacheMiddleware,
+                     self).process_request(request)
+
+    def process_response(self, request, response):
+        self.use_generation(request)
+        return super(GenerationCacheMiddleware,
+                     self).process_response(request, response)
+
+
+def generation_cache_page(timeout, cache=None):
+    """Like django.views.decorators.cache.cache_page, but keyed by the
+    requested regulation's generation"""
+    return decorator_from_middleware_with_args(GenerationCacheMiddleware)(
+        cache_timeout=timeout, cache_alias=cache, key_prefix=None)
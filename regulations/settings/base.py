@@ -109,10 +109,12 @@ TEMPLATES = [
 # Note order:
 # https://docs.djangoproject.com/en/1.8/topics/cache/#the-per-site-cache
 MIDDLEWARE_CLASSES = (
-    'django.middleware.cache.UpdateCacheMiddleware',
+    'regulations.middleware.ServerTimingMiddleware',
+    'regulations.middleware.GenerationUpdateCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
+    'regulations.middleware.GenerationFetchFromCacheMiddleware',
+    'regulations.middleware.ApiMemoMiddleware',
 )
 
 ROOT_URLCONF = 'regulations.urls'
@@ -127,6 +129,53 @@ INSTALLED_APPS = (
 # The base URL for the API that we use to access layers and the regulation.
 API_BASE = os.environ.get('EREGS_API_BASE', '')
 
+# Requests to the API share a pooled, keep-alive session. Connections kept
+# open per API host:
+API_POOL_SIZE = 10
+# (connect, read) timeouts, in seconds
+API_TIMEOUT = (3.05, 30)
+# Connection errors and 5xx responses are retried this many times, with a
+# jittered, exponential backoff starting from API_BACKOFF seconds
+API_RETRIES = 3
+API_BACKOFF = 0.25
+# If the API can return several resources in one response, the path of that
+# endpoint (relative to API_BASE). It'll receive each resource's path as a
+# repeated "path" parameter, and should respond with a JSON object mapping
+# each path to its data (or null). Without it, resources are fetched
+# individually
+API_BATCH_ENDPOINT = os.environ.get('EREGS_API_BATCH_ENDPOINT')
+# Otherwise, they're fetched concurrently by this many threads, shared by
+# all requests in the process
+API_WORKERS = 8
+# API data specific to a version (its tree, layers, diffs) never changes, so
+# is cached without expiring. Lists of versions and notices do change; their
+# cache keys include a per-regulation "generation", changed by the
+# bump_generation command (see regulations.generator.generations)
+API_CACHE_VERSIONED_TIMEOUT = None
+# Other API data expires from the cache after its TIMEOUT. For this many
+# seconds more, it may still be served (stale) while being re-fetched in the
+# background, rather than making the request wait on the API
+API_CACHE_STALE_TIMEOUT = 3600
+
+# When a section of a diff between two versions is first viewed, also render
+# every other section of that diff in the background, storing them in
+# eregs_longterm_cache. Only worthwhile if that cache actually stores things.
+# Diffs can also be rendered ahead of time with the precompute_diffs command
+DIFF_PRECOMPUTE = os.environ.get('EREGS_DIFF_PRECOMPUTE', '') == 'true'
+
+# Build regulation trees from compact, slot-based nodes (see
+# regulations.generator.compact_node) rather than dicts, to reduce the memory
+# held by each worker while rendering large regulations
+COMPACT_TREES = os.environ.get('EREGS_COMPACT_TREES', '') == 'true'
+
+# Time the phases of rendering each page (API fetches, layers, HTML
+# building, template rendering, etc.), reporting them in a Server-Timing
+# response header. With SERVER_TIMING_LOG, also log them (as JSON) to the
+# regulations.middleware logger, along with the process's counters of its
+# worker pool, API connections, coalesced fetches and sort key cache
+SERVER_TIMING = os.environ.get('EREGS_SERVER_TIMING', '') == 'true'
+SERVER_TIMING_LOG = os.environ.get('EREGS_SERVER_TIMING_LOG', '') == 'true'
+
 # When we generate an full HTML version of the regulation, we want to write it
 # out somewhere. This is where.
 OFFLINE_OUTPUT_DIR = ''
@@ -167,7 +216,8 @@ CACHES = {
         },
     },
     'api_cache': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Like LocMemCache, but keeps regulation trees unpickled
+        'BACKEND': 'regulations.cache_backends.FrozenTreeCache',
         'LOCATION': 'api_cache_memory',
         'TIMEOUT': 3600,
         'OPTIONS': {
@@ -176,8 +226,53 @@ CACHES = {
     },
     'regs_gov_cache': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+    },
+    # Must be shared by all processes, and should not be evicted
+    'eregs_generations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/tmp/eregs_generations',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
 }
+GENERATIONS_CACHE = 'eregs_generations'
+
+# When serving from several hosts, generations must be shared by all of them
+# (otherwise bump_generation has to be run on each host), e.g. via memcached:
+# EREGS_GENERATIONS_CACHE_BACKEND=django.core.cache.backends.memcached.\
+# MemcachedCache and EREGS_GENERATIONS_CACHE_LOCATION=host:11211
+if os.environ.get('EREGS_GENERATIONS_CACHE_BACKEND'):
+    CACHES['eregs_generations'] = {
+        'BACKEND': os.environ['EREGS_GENERATIONS_CACHE_BACKEND'],
+        'LOCATION': os.environ.get('EREGS_GENERATIONS_CACHE_LOCATION', ''),
+        'TIMEOUT': None,
+    }
+
+# Rather than each process keeping its own copy of the API data, share it
+# between all of the processes on a host via a database at this path
+if os.environ.get('EREGS_SHARED_API_CACHE'):
+    CACHES['api_cache'] = {
+        'BACKEND': 'regulations.cache_backends.SharedTreeCache',
+        'LOCATION': os.environ['EREGS_SHARED_API_CACHE'],
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_BYTES': 512 * 1024 * 1024,
+        },
+    }
+# Or keep it in memory, but bounded by the bytes it holds (here, in MB)
+# rather than its number of entries
+elif os.environ.get('EREGS_API_CACHE_MB'):
+    CACHES['api_cache'] = {
+        'BACKEND': 'regulations.cache_backends.BudgetedTreeCache',
+        'LOCATION': 'api_cache_memory',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_BYTES': int(os.environ['EREGS_API_CACHE_MB']) * 1024 * 1024,
+            'STATS_FILE': os.environ.get('TMPDIR', '/tmp') + '/api_cache_stats',
+        },
+    }
 
 CACHE_MIDDLEWARE_ALIAS = 'default'
 CACHE_MIDDLEWARE_KEY_PREFIX = 'eregs'
@@ -2,6 +2,11 @@ import tempfile
 import os
 import shutil
 
+from django.conf import settings
+from django.test import override_settings
+from mock import Mock, patch
+
+from regulations.generator import api_client
 from regulations.generator.api_client import ApiClient
 from unittest import TestCase
 
@@ -20,3 +25,84 @@ class ClientTest(TestCase):
         results = client.get('notice')
         shutil.rmtree(tmp_root)
         self.assertEqual(["example"], results['results'])
+
+    def test_get_many_local_filesystem(self):
+        """Missing files are treated as not found"""
+        tmp_root = tempfile.mkdtemp() + os.sep
+        for name in ('a', 'b'):
+            with open(tmp_root + name, 'w') as f:
+                f.write('{"name": "%s"}' % name)
+        client = ApiClient()
+        client.base_url = tmp_root
+        results = client.get_many(['b', 'missing', 'a'])
+        shutil.rmtree(tmp_root)
+        self.assertEqual([{'name': 'b'}, None, {'name': 'a'}], results)
+
+    @patch('regulations.generator.api_client.get_session')
+    def test_get_many_batch_endpoint(self, get_session):
+        response = get_session.return_value.get.return_value
+        response.status_code = 200
+        response.json.return_value = {'layer/a': {'a': 1}, 'layer/c': None}
+        client = ApiClient()
+        client.base_url = 'http://example.com/'
+
+        with override_settings(API_BATCH_ENDPOINT='batch'):
+            self.assertEqual([None, {'a': 1}, None],
+                             client.get_many(['layer/b', 'layer/a',
+                                              'layer/c']))
+        self.assertEqual(1, get_session.return_value.get.call_count)
+        args, kwargs = get_session.return_value.get.call_args
+        self.assertEqual(('http://example.com/batch',), args)
+        self.assertEqual({'path': ['layer/b', 'layer/a', 'layer/c']},
+                         kwargs['params'])
+
+    @patch('regulations.generator.api_client.ApiClient.get')
+    def test_get_many_no_batch_endpoint(self, get):
+        get.side_effect = lambda suffix: {'suffix': suffix}
+        client = ApiClient()
+        client.base_url = 'http://example.com/'
+        with override_settings(API_BATCH_ENDPOINT=None):
+            self.assertEqual([{'suffix': 'x'}, {'suffix': 'y'}],
+                             client.get_many(['x', 'y']))
+        self.assertEqual(2, get.call_count)
+
+    @patch('regulations.generator.api_client.get_session')
+    def test_http_uses_shared_session(self, get_session):
+        """Requests go through the shared session, with timeouts"""
+        response = get_session.return_value.get.return_value
+        response.status_code = 200
+        response.json.return_value = {'some': 'json'}
+        client = ApiClient()
+        client.base_url = 'http://example.com/'
+
+        self.assertEqual({'some': 'json'}, client.get('notice', {'a': 'b'}))
+        args, kwargs = get_session.return_value.get.call_args
+        self.assertEqual(('http://example.com/notice',), args)
+        self.assertEqual({'a': 'b'}, kwargs['params'])
+        self.assertEqual(settings.API_TIMEOUT, kwargs['timeout'])
+
+        response.status_code = 404
+        self.assertIsNone(client.get('notice'))
+
+    def test_get_session_is_shared(self):
+        session = api_client.get_session()
+        self.assertIs(session, api_client.get_session())
+        adapter = session.get_adapter('http://example.com/')
+        self.assertEqual(settings.API_RETRIES, adapter.max_retries.total)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertTrue(isinstance(adapter.max_retries,
+                                   api_client.JitteredRetry))
+
+    def test_jittered_backoff(self):
+        retry = api_client.JitteredRetry(total=5, backoff_factor=1)
+        for _ in range(3):
+            retry = retry.increment('GET', '/')
+        for _ in range(20):
+            self.assertTrue(0 <= retry.get_backoff_time() <= 4)
+
+    @patch('regulations.generator.api_client._session')
+    def test_pool_stats(self, session):
+        pool = Mock(num_connections=2, num_requests=7)
+        adapter = session.adapters.values.return_value = [Mock()]
+        adapter[0].poolmanager.pools = {'key': pool}
+        self.assertEqual({'hits': 5, 'misses': 2}, api_client.pool_stats())
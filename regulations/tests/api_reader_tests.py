@@ -1,8 +1,13 @@
+import threading
+import time
 from unittest import TestCase
 
+from django.test import override_settings
 from mock import patch
 
+from regulations.generator import api_reader
 from regulations.generator.api_reader import ApiReader
+from regulations.generator.compact_node import CompactNode
 
 
 class ClientTest(TestCase):
@@ -18,6 +23,26 @@ class ClientTest(TestCase):
         self.assertTrue('label-here' in param)
         self.assertTrue('date-here' in param)
 
+    @override_settings(COMPACT_TREES=True)
+    @patch('regulations.generator.api_reader.api_client')
+    def test_regulation_compact(self, api_client):
+        tree = {'text': 'root', 'label': ['1027'], 'children': [
+            {'text': 'a', 'children': [], 'label': ['1027', '1']}]}
+        api_client.ApiClient.return_value.get.return_value = tree
+        self.assertIsInstance(ApiReader().regulation('1027', 'compact'),
+                              CompactNode)
+
+        api_reader.start_request_memo()
+        try:
+            first = ApiReader().regulation('1027-1', 'compact')
+            self.assertIsInstance(first, CompactNode)
+            self.assertEqual(tree['children'][0], first)
+            second = ApiReader().regulation('1027-1', 'compact')
+            self.assertIsInstance(second, CompactNode)
+            self.assertIsNot(first, second)
+        finally:
+            api_reader.end_request_memo()
+
     @patch('regulations.generator.api_reader.api_client')
     def test_layer(self, api_client):
         to_return = {'example': 1}
@@ -52,6 +77,39 @@ class ClientTest(TestCase):
         param = get.call_args[0][0]
         self.assertIn('layer-here/preamble/lablab', param)
 
+    @patch('regulations.generator.api_reader.api_client')
+    def test_layers(self, api_client):
+        get_many = api_client.ApiClient.return_value.get_many
+        get_many.side_effect = lambda suffixes: [
+            {'suffix': s} if 'old' not in s else None for s in suffixes]
+        reader = ApiReader()
+        reader.cache.set('layer-cached-cfr-111-ver', {'cached': True})
+
+        results = reader.layers([('cached', 'cfr', '111-2', 'ver'),
+                                 ('l1', 'cfr', '111-2', 'ver'),
+                                 ('l1', 'cfr', '111-3', 'ver'),
+                                 ('l2', 'preamble', '111', None),
+                                 ('old', 'cfr', '111', 'ver')])
+        self.assertEqual([{'cached': True},
+                          {'suffix': 'layer/l1/cfr/ver/111'},
+                          {'suffix': 'layer/l1/cfr/ver/111'},
+                          {'suffix': 'layer/l2/preamble/111'},
+                          None], results)
+        self.assertEqual(2, get_many.call_count)
+        self.assertEqual(
+            ['layer/l1/cfr/ver/111', 'layer/l2/preamble/111',
+             'layer/old/cfr/ver/111'],
+            get_many.call_args_list[0][0][0])
+        # Fall back to the old format for missing CFR layers
+        self.assertEqual(['layer/old/111/ver'],
+                         get_many.call_args_list[1][0][0])
+
+        # Now cached
+        self.assertEqual(
+            [{'suffix': 'layer/l1/cfr/ver/111'}],
+            reader.layers([('l1', 'cfr', '111-4', 'ver')]))
+        self.assertEqual(2, get_many.call_count)
+
     @patch('regulations.generator.api_reader.api_client')
     def test_notices(self, api_client):
         to_return = {'example': 1}
@@ -187,3 +245,283 @@ class ClientTest(TestCase):
         self.assertEqual(1, get.call_count)
         self.assertEqual(second, {'text': 'parent', 'label': ['1024'],
                                   'children': []})
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_request_memo(self, api_client):
+        """Within a request, repeated reads share the deserialized data"""
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'label': ['1111'], 'children': []}
+        memo = api_reader.start_request_memo()
+        try:
+            first = ApiReader().regulation('1111', 'ver')
+            second = ApiReader().regulation('1111', 'ver')
+            self.assertEqual(first, second)
+            self.assertEqual(1, memo.hits)
+
+            get.return_value = {'versions': []}
+            first = ApiReader().regversions('1111')
+            self.assertEqual(first, ApiReader().regversions('1111'))
+            # The versions, and the generation they're keyed by
+            self.assertEqual(3, memo.hits)
+            self.assertEqual(2, get.call_count)
+        finally:
+            self.assertIs(memo, api_reader.end_request_memo())
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_request_memo_copies(self, api_client):
+        """One consumer's changes to memoized data aren't seen by the next
+        consumer in the same request"""
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'text': 'root', 'label': ['1112'], 'children': [
+            {'text': 'a', 'label': ['1112', '1'], 'children': []}]}
+        memo = api_reader.start_request_memo()
+        try:
+            first = ApiReader().regulation('1112', 'ver')
+            first['marked_up'] = 'Marked'
+            first['children'][0]['text'] = 'Changed'
+            first['children'].append({'label': ['1112', '2']})
+            second = ApiReader().regulation('1112', 'ver')
+            self.assertEqual({'text': 'root', 'label': ['1112'], 'children': [
+                {'text': 'a', 'label': ['1112', '1'], 'children': []}]},
+                second)
+
+            get.return_value = {'1112-1': [{'text': 'a'}]}
+            layer = ApiReader().layer('terms', 'cfr', '1112', 'ver')
+            layer['1112-1'][0]['text'] = 'Changed'
+            layer['1112-2'] = []
+            self.assertEqual({'1112-1': [{'text': 'a'}]},
+                             ApiReader().layer('terms', 'cfr', '1112', 'ver'))
+            self.assertEqual(2, memo.hits)
+        finally:
+            api_reader.end_request_memo()
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_subtree_from_root(self, api_client):
+        """Once the root tree is cached, descendants come from it"""
+        paragraph = {'text': 'a', 'children': [], 'label': ['1025', '1', 'a']}
+        interp = {'text': 'i', 'children': [], 'node_type': 'interp',
+                  'label': ['1025', '1', 'Interp']}
+        section = {'text': 's', 'children': [paragraph],
+                   'label': ['1025', '1']}
+        root = {'text': 'root', 'label': ['1025'], 'children': [
+            section, {'text': '', 'label': ['1025', 'Interp'],
+                      'node_type': 'interp', 'children': [interp]}]}
+        get = api_client.ApiClient.return_value.get
+        get.return_value = root
+        reader = ApiReader()
+
+        self.assertEqual(root, reader.regulation('1025', 'ver'))
+        self.assertEqual(paragraph, reader.regulation('1025-1-a', 'ver'))
+        self.assertEqual(section, reader.regulation('1025-1', 'ver'))
+        self.assertEqual(interp, reader.regulation('1025-1-Interp', 'ver'))
+        self.assertEqual(1, get.call_count)
+
+        # Different version; nothing cached
+        get.return_value = paragraph
+        reader.regulation('1025-1-a', 'other')
+        self.assertEqual(2, get.call_count)
+        # Not in the tree
+        get.return_value = None
+        self.assertIsNone(reader.regulation('1025-2', 'ver'))
+        self.assertEqual(3, get.call_count)
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_subtree_paths_cached(self, api_client):
+        root = {'text': 'root', 'label': ['1026'], 'children': [
+            {'text': 'a', 'children': [], 'label': ['1026', '1']},
+            {'text': 'b', 'children': [], 'label': ['1026', '2']}]}
+        api_client.ApiClient.return_value.get.return_value = root
+        ApiReader().regulation('1026', 'ver')
+
+        with patch('regulations.generator.api_reader.tree_builder'
+                   '.build_tree_paths') as build_tree_paths:
+            build_tree_paths.return_value = {'1026-1': [0], '1026-2': [1]}
+            self.assertEqual(root['children'][0],
+                             ApiReader().regulation('1026-1', 'ver'))
+            self.assertEqual(root['children'][1],
+                             ApiReader().regulation('1026-2', 'ver'))
+            self.assertEqual(1, build_tree_paths.call_count)
+        self.assertEqual(1, api_client.ApiClient.return_value.get.call_count)
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_subtree_from_modified_root(self, api_client):
+        """Subtrees are found in the cached root, not in a copy of it which
+        has already been modified during the request"""
+        child = {'text': 'a', 'children': [], 'label': ['1028', '1']}
+        api_client.ApiClient.return_value.get.return_value = {
+            'text': 'root', 'label': ['1028'], 'children': [dict(child)]}
+        api_reader.start_request_memo()
+        try:
+            modified = ApiReader().regulation('1028', 'ver')
+            modified['children'][0]['marked_up'] = 'Marked'
+            modified['children'][0]['text'] = 'Changed'
+            self.assertEqual(child, ApiReader().regulation('1028-1', 'ver'))
+        finally:
+            api_reader.end_request_memo()
+        self.assertEqual(child, ApiReader().regulation('1028-1', 'ver'))
+
+    @patch('regulations.generator.api_reader.generations')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_regversions_generation(self, api_client, generations):
+        """Lists of versions are cached per generation"""
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'versions': []}
+        generations.token.return_value = 'gen1'
+        ApiReader().regversions('1027')
+        ApiReader().regversions('1027')
+        self.assertEqual(1, get.call_count)
+        generations.token.assert_called_with('1027')
+
+        generations.token.return_value = 'gen2'
+        ApiReader().regversions('1027')
+        self.assertEqual(2, get.call_count)
+
+    @patch('regulations.generator.api_reader.generations')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_generation_memoized(self, api_client, generations):
+        """Within a request, each part's generation is only read once"""
+        api_client.ApiClient.return_value.get.return_value = {'versions': []}
+        generations.token.return_value = 'gen1'
+        api_reader.start_request_memo()
+        try:
+            ApiReader().regversions('1029')
+            ApiReader().regversions('1029')
+            ApiReader().notices('1029')
+            self.assertEqual(1, generations.token.call_count)
+            ApiReader().all_regulations_versions()
+            self.assertEqual(2, generations.token.call_count)
+        finally:
+            api_reader.end_request_memo()
+
+    @patch('regulations.generator.api_reader.executor')
+    @patch('regulations.generator.api_reader.generations')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_stale_while_revalidate(self, api_client, generations, executor):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'versions': [1]}
+        generations.token.return_value = 'stale'
+        submit = executor.get_executor.return_value.submit
+        reader = ApiReader()
+        reader.cache.delete('regversions-1028-stale')
+        self.assertEqual({'versions': [1]}, reader.regversions('1028'))
+
+        # Soft expiry: served stale while one refresh is scheduled
+        reader.cache.delete('regversions-1028-stale-fresh')
+        get.return_value = {'versions': [1, 2]}
+        self.assertEqual({'versions': [1]}, reader.regversions('1028'))
+        self.assertEqual({'versions': [1]}, reader.regversions('1028'))
+        self.assertEqual(1, get.call_count)
+        self.assertEqual(1, submit.call_count)
+
+        submit.call_args[0][0]()    # run the refresh
+        self.assertEqual(2, get.call_count)
+        self.assertEqual({'versions': [1, 2]}, reader.regversions('1028'))
+        self.assertEqual(1, submit.call_count)
+
+    @patch('regulations.generator.api_reader.executor')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_stale_layers(self, api_client, executor):
+        """Batched layers are revalidated as individual reads are"""
+        get = api_client.ApiClient.return_value.get
+        get_many = api_client.ApiClient.return_value.get_many
+        get_many.return_value = [{'1029': ['old']}]
+        submit = executor.get_executor.return_value.submit
+        reader = ApiReader()
+        reader.cache.delete('layer-terms-preamble-1029-None')
+        args = [('terms', 'preamble', '1029', None)]
+        self.assertEqual([{'1029': ['old']}], reader.layers(args))
+        self.assertEqual([{'1029': ['old']}], reader.layers(args))
+        self.assertFalse(submit.called)
+
+        # Soft expiry: served stale while one refresh is scheduled
+        reader.cache.delete('layer-terms-preamble-1029-None-fresh')
+        get.return_value = {'1029': ['new']}
+        self.assertEqual([{'1029': ['old']}], reader.layers(args))
+        self.assertEqual([{'1029': ['old']}], reader.layers(args))
+        self.assertEqual(1, submit.call_count)
+        self.assertEqual(1, get_many.call_count)
+
+        submit.call_args[0][0]()    # run the refresh
+        self.assertEqual('layer/terms/preamble/1029', get.call_args[0][0])
+        self.assertEqual([{'1029': ['new']}], reader.layers(args))
+        self.assertEqual(1, submit.call_count)
+
+
+class SingleFlightTest(TestCase):
+    def test_coalesces(self):
+        flights = api_reader.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 'result'
+
+        def follow():
+            results.append(flights.do('key', fetch))
+
+        leader = threading.Thread(target=follow)
+        leader.start()
+        started.wait()
+        # Count the threads waiting on the leader's call
+        done, waiting = flights.calls['key'].done, []
+
+        def wait():
+            waiting.append(1)
+            return done.__class__.wait(done)
+        done.wait = wait
+
+        followers = [threading.Thread(target=follow) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        while len(waiting) < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([('result', True)] + [('result', False)] * 3,
+                         results)
+        self.assertEqual({'fetches': 1, 'coalesced': 3, 'in_flight': 0},
+                         flights.stats())
+
+    def test_errors(self):
+        flights = api_reader.SingleFlight()
+
+        def fail():
+            raise ValueError()
+        self.assertRaises(ValueError, flights.do, 'key', fail)
+        self.assertEqual(('ok', True), flights.do('key', lambda: 'ok'))
+
+    def test_do_many(self):
+        flights = api_reader.SingleFlight()
+        # Another thread is already fetching "b"
+        call = flights.calls['b'] = api_reader.SingleFlight.Call()
+        call.result = 'B'
+        call.done.set()
+
+        results, shared = flights.do_many(
+            ['a', 'b'], lambda keys: dict((key, key.upper()) for key in keys))
+        self.assertEqual({'a': 'A', 'b': 'B'}, results)
+        self.assertEqual(set(['b']), shared)
+        self.assertEqual(['b'], list(flights.calls))
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_regulation_coalesced(self, api_client):
+        """A tree already being fetched by another thread is shared, but
+        not the same object"""
+        tree = {'text': 'root', 'label': ['1029'], 'children': []}
+        key = ('regulation/1029/joined', ())
+        call = api_reader._flights.calls[key] = api_reader.SingleFlight.Call()
+        call.result = tree
+        call.done.set()
+        try:
+            result = ApiReader().regulation('1029', 'joined')
+        finally:
+            del api_reader._flights.calls[key]
+        self.assertEqual(tree, result)
+        self.assertIsNot(tree, result)
+        self.assertFalse(api_client.ApiClient.return_value.get.called)
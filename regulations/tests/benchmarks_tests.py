@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from regulations.benchmarks import suite
+from regulations.benchmarks.synthetic import SyntheticRegulation
+
+
+class SyntheticRegulationTests(TestCase):
+    def test_offsets_line_up(self):
+        reg = SyntheticRegulation(sections=3, paragraphs=4, terms=5)
+        texts = dict(('-'.join(node['label']), node['text'])
+                     for node in reg.paragraphs_with_text())
+        self.assertEqual(3 * 4 + 3, len(texts))
+        for label_id, refs in reg.layers['terms'].items():
+            if label_id == 'referenced':
+                continue
+            for ref in refs:
+                start, end = ref['offsets'][0]
+                self.assertEqual(ref['ref'].split(':')[0],
+                                 texts[label_id][start:end])
+        for label_id, cites in reg.layers['internal-citations'].items():
+            for cite in cites:
+                start, end = cite['offsets'][0]
+                self.assertEqual(u'\xa7 {}.{}'.format(*cite['citation']),
+                                 texts[label_id][start:end])
+
+    def test_deterministic(self):
+        self.assertEqual(SyntheticRegulation(seed=3).tree,
+                         SyntheticRegulation(seed=3).tree)
+
+
+class SuiteTests(TestCase):
+    def test_run(self):
+        """A tiny run exercises every benchmark"""
+        results = suite.run(repeat=1, sections=2, paragraphs=2, terms=2,
+                            interps=1)
+        self.assertEqual(suite.Benchmarks.names(), list(results.keys()))
+        memory = results.pop('tree_memory')
+        self.assertTrue(0 < memory['compact_bytes'] < memory['dict_bytes'])
+        for result in results.values():
+            self.assertEqual(1, result['repeat'])
+            self.assertTrue(0 <= result['min_ms'] <= result['max_ms'])
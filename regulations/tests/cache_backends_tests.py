@@ -0,0 +1,368 @@
+import copy
+import os
+import pickle
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+from regulations.cache_backends import (
+    BudgetedTreeCache, ByteBudget, CopyOnWriteNode, EncodedNode,
+    FrequencySketch, FrozenTreeCache, SharedTreeCache, decode_tree,
+    encode_tree, is_tree, key_prefix, process_exists, published_stats)
+
+
+def mk_tree():
+    return {'label': ['1', '2'], 'text': 'root', 'children': [
+        {'label': ['1', '2', 'a'], 'text': 'a', 'children': [
+            {'label': ['1', '2', 'a', '1'], 'text': 'a1', 'children': []}]},
+        {'label': ['1', '2', 'b'], 'text': 'b', 'children': []}]}
+
+
+class CopyOnWriteNodeTests(TestCase):
+    def test_lazy_children(self):
+        frozen = mk_tree()
+        node = CopyOnWriteNode(frozen)
+        # Not yet copied
+        self.assertIs(node._fields['children'], frozen['children'])
+        child = node['children'][0]
+        self.assertTrue(isinstance(child, CopyOnWriteNode))
+        self.assertIsNot(node['children'], frozen['children'])
+        self.assertIs(child._fields['children'], frozen['children'][0][
+            'children'])
+
+    def test_modifications_dont_leak(self):
+        frozen = mk_tree()
+        node = CopyOnWriteNode(frozen)
+        node['marked_up'] = 'Marked'
+        node['children'][0]['text'] = 'Changed'
+        node['children'][0]['children'].append({'label': ['x']})
+        node.get('children').pop()
+        self.assertEqual(mk_tree(), frozen)
+
+    def test_replace_children(self):
+        frozen = mk_tree()
+        node = CopyOnWriteNode(frozen)
+        node['children'] = []
+        self.assertEqual([], node['children'])
+        node = CopyOnWriteNode(frozen)
+        node.update({'children': ['something']})
+        self.assertEqual(['something'], node['children'])
+        self.assertEqual(mk_tree(), frozen)
+
+    def test_copies(self):
+        frozen = mk_tree()
+        for duplicate in (copy.deepcopy(CopyOnWriteNode(frozen)),
+                          pickle.loads(pickle.dumps(CopyOnWriteNode(frozen))),
+                          CopyOnWriteNode(frozen).copy()):
+            self.assertEqual(mk_tree(), duplicate)
+            self.assertEqual(dict, type(duplicate))
+            duplicate['children'].append('new')
+        self.assertEqual(mk_tree(), frozen)
+
+    def test_views(self):
+        frozen = mk_tree()
+        node = CopyOnWriteNode(frozen)
+        view = node.view()
+        self.assertIsNot(view, node)
+        self.assertIs(view._fields['children'], frozen['children'])
+        node['children'][0]['text'] = 'Changed'
+        view = node.view()
+        self.assertEqual('Changed', view['children'][0]['text'])
+        view['children'][0]['text'] = 'Changed again'
+        self.assertEqual('Changed', node['children'][0]['text'])
+        self.assertEqual(mk_tree(), frozen)
+
+    def test_dict_conversions_dont_leak(self):
+        frozen = mk_tree()
+        for duplicate in (dict(CopyOnWriteNode(frozen)),
+                          dict(CopyOnWriteNode(frozen).items()),
+                          dict(**CopyOnWriteNode(frozen))):
+            self.assertEqual(mk_tree(), duplicate)
+            duplicate['children'][0]['text'] = 'Changed'
+            duplicate['children'][0]['children'].append('new')
+            duplicate['children'].pop()
+        self.assertEqual(mk_tree(), frozen)
+
+    def test_nested_fields_copied(self):
+        frozen = mk_tree()
+        frozen['interp'] = {'labels': ['1-2-Interp']}
+        node = CopyOnWriteNode(frozen)
+        node['label'].append('Interp')
+        node['interp']['labels'].append('1-2-a-Interp')
+        node['children'][0]['label'][-1] = 'ZZ'
+        view = node.view()
+        expected = mk_tree()
+        expected['interp'] = {'labels': ['1-2-Interp']}
+        self.assertEqual(expected, frozen)
+
+        view['label'].pop()
+        self.assertEqual(['1', '2', 'Interp'], node['label'])
+
+
+class FrozenTreeCacheTests(TestCase):
+    def setUp(self):
+        self.cache = FrozenTreeCache('frozen-tests', {})
+        self.cache.clear()
+
+    def test_is_tree(self):
+        self.assertTrue(is_tree(mk_tree()))
+        self.assertFalse(is_tree({'label': ['1']}))
+        self.assertFalse(is_tree([]))
+
+    def test_trees_not_pickled(self):
+        tree = mk_tree()
+        self.cache.set('key', tree)
+        tree['children'] = []   # caller's changes aren't stored
+        stored = self.cache._cache[self.cache.make_key('key')]
+        self.assertEqual(mk_tree(), stored)
+
+        result = self.cache.get('key')
+        self.assertTrue(isinstance(result, CopyOnWriteNode))
+        self.assertEqual(mk_tree(), result)
+        result['children'][1]['text'] = 'Changed'
+        self.assertEqual(mk_tree(), self.cache.get('key'))
+
+    def test_nested_fields_not_shared(self):
+        self.cache.set('key', mk_tree())
+        result = self.cache.get('key')
+        result['label'].append('Interp')
+        result['children'][0]['label'][-1] = 'ZZ'
+        self.assertEqual(mk_tree(), self.cache.get('key'))
+
+    def test_views_stored_as_trees(self):
+        self.cache.set('key', mk_tree())
+        view = self.cache.get('key')
+        view['children'][0]['text'] = 'Changed'
+        self.cache.set('changed', view)
+        stored = self.cache._cache[self.cache.make_key('changed')]
+        self.assertEqual(dict, type(stored))
+        self.assertEqual('Changed', self.cache.get('changed')[
+            'children'][0]['text'])
+        self.assertEqual(mk_tree(), self.cache.get('key'))
+
+    def test_other_values(self):
+        self.cache.set('layer', {'1-2': [{'text': 'a'}]})
+        self.assertTrue(isinstance(
+            self.cache._cache[self.cache.make_key('layer')], bytes))
+        value = self.cache.get('layer')
+        value['1-2'].append('x')
+        self.assertEqual({'1-2': [{'text': 'a'}]}, self.cache.get('layer'))
+
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(3, self.cache.incr('counter', 2))
+        self.assertEqual(3, self.cache.get('counter'))
+
+    def test_expiry(self):
+        self.cache.set('key', mk_tree(), timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual('default', self.cache.get('key', 'default'))
+
+
+class EncodedTreeTests(TestCase):
+    def test_round_trip(self):
+        encoded = encode_tree(mk_tree())
+        node = decode_tree(encoded)
+        self.assertTrue(isinstance(node, EncodedNode))
+        # Children are still encoded
+        self.assertTrue(isinstance(node._fields['children'][0], bytes))
+        self.assertEqual(mk_tree(), node)
+        self.assertTrue(isinstance(node['children'][0], EncodedNode))
+
+        node['children'][0]['children'].append('new')
+        self.assertEqual(mk_tree(), decode_tree(encoded))
+        self.assertEqual(mk_tree(), copy.deepcopy(decode_tree(encoded)))
+
+
+class SharedTreeCacheTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_cache(self, **options):
+        return SharedTreeCache(os.path.join(self.tmpdir, 'cache.db'),
+                               {'OPTIONS': options})
+
+    def test_trees(self):
+        self.cache.set('key', mk_tree())
+        result = self.cache.get('key')
+        self.assertTrue(isinstance(result, EncodedNode))
+        self.assertEqual(mk_tree(), result)
+        result['children'][1]['text'] = 'Changed'
+        # Visible to other instances (i.e. processes)
+        self.assertEqual(mk_tree(), self.make_cache().get('key'))
+
+    def test_other_values(self):
+        self.cache.set('layer', {'1-2': [{'text': 'a'}]})
+        self.assertEqual({'1-2': [{'text': 'a'}]}, self.cache.get('layer'))
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(3, self.cache.incr('counter', 2))
+        self.cache.delete('counter')
+        self.assertIsNone(self.cache.get('counter'))
+
+    def test_expiry(self):
+        self.cache.set('key', mk_tree(), timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'value'))
+
+    @patch('regulations.cache_backends.time')
+    def test_eviction(self, time):
+        time.time.return_value = 100
+        size = len(pickle.dumps('a' * 100, pickle.HIGHEST_PROTOCOL))
+        cache = self.make_cache(MAX_BYTES=size * 3, ACCESS_RESOLUTION=0)
+        for key in ('a', 'b', 'c'):
+            time.time.return_value += 1
+            cache.set(key, key * 100)
+        time.time.return_value += 1
+        cache.get('a')
+        time.time.return_value += 1
+        cache.set('d', 'd' * 100)
+
+        self.assertIsNone(cache.get('b'))
+        for key in ('a', 'c', 'd'):
+            self.assertEqual(key * 100, cache.get(key))
+        stats = cache.stats()
+        self.assertEqual(3, stats['entries'])
+        self.assertEqual(size * 3, stats['bytes'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(4, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+        cache.clear()
+        self.assertEqual(0, cache.stats()['bytes'])
+
+    def test_too_large(self):
+        cache = self.make_cache(MAX_BYTES=100)
+        cache.set('key', 'small')
+        cache.set('key', 'x' * 500)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(0, cache.stats()['bytes'])
+
+        cache.set('key', 'small')
+        self.assertFalse(cache.add('key', 'x' * 500))
+        self.assertEqual('small', cache.get('key'))
+
+
+class FrequencySketchTests(TestCase):
+    def test_estimate(self):
+        sketch = FrequencySketch(64)
+        for _ in range(3):
+            sketch.increment('a')
+        sketch.increment('b')
+        self.assertTrue(sketch.estimate('a') >= 3)
+        self.assertTrue(sketch.estimate('b') >= 1)
+
+    def test_aging(self):
+        sketch = FrequencySketch(4)
+        for _ in range(20):
+            sketch.increment('a')
+        self.assertEqual(15, sketch.estimate('a'))
+        for _ in range(20):
+            sketch.increment('b')
+        # Counts were halved when we passed 40 increments
+        self.assertTrue(sketch.estimate('a') < 15)
+
+
+class ByteBudgetTests(TestCase):
+    def test_key_prefix(self):
+        self.assertEqual('regulation', key_prefix(':1:regulation-1234-v1'))
+        self.assertEqual('layer', key_prefix('layer-terms-cfr-1234-v1'))
+
+    def test_lru(self):
+        budget = ByteBudget(300)
+        for key in ('a', 'b', 'c'):
+            self.assertEqual((True, []), budget.admit(key, 100))
+        budget.record_get('a', True)
+        self.assertEqual((True, ['b']), budget.admit('d', 100))
+        self.assertEqual(['c', 'a', 'd'], list(budget.entries))
+        # Replacing an entry frees its space first
+        self.assertEqual((True, []), budget.admit('c', 100))
+
+    def test_admission(self):
+        budget = ByteBudget(1000)
+        for idx in range(10):
+            key = 'regversions-{}'.format(idx)
+            budget.admit(key, 100)
+            for _ in range(3):
+                budget.record_get(key, True)
+        # A large, unpopular entry isn't allowed to displace them
+        self.assertEqual((False, []), budget.admit('regulation-1', 500))
+        budget.record_get('regulation-1', False)
+        self.assertEqual((False, []), budget.admit('regulation-1', 500))
+        for _ in range(3):
+            budget.record_get('regulation-1', False)
+        admitted, victims = budget.admit('regulation-1', 500)
+        self.assertTrue(admitted)
+        self.assertEqual(5, len(victims))
+        # Never larger than the whole budget
+        self.assertEqual((False, []), budget.admit('regulation-2', 1001))
+
+        stats = budget.stats()
+        self.assertEqual(1000, stats['bytes'])
+        self.assertEqual(6, stats['entries'])
+        self.assertEqual({'entries': 1, 'bytes': 500, 'hits': 0,
+                          'misses': 4, 'evictions': 0, 'rejections': 3},
+                         stats['prefixes']['regulation'])
+        self.assertEqual(5, stats['prefixes']['regversions']['evictions'])
+
+
+class BudgetedTreeCacheTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # Stats are kept per cache name
+        self.cache = BudgetedTreeCache(self.id(), {'OPTIONS': {
+            'MAX_BYTES': 10000,
+            'STATS_FILE': os.path.join(self.tmpdir, 'stats')}})
+        self.cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_budget(self):
+        self.cache.set('tree', mk_tree())
+        self.assertEqual(mk_tree(), self.cache.get('tree'))
+        self.assertIsNone(self.cache.get('missing'))
+        self.cache.set('big', 'x' * 20000)
+        self.assertIsNone(self.cache.get('big'))
+        for idx in range(100):
+            self.cache.set('layer-{}'.format(idx), 'x' * 500)
+
+        stats = self.cache.stats()
+        self.assertTrue(stats['bytes'] <= 10000)
+        self.assertEqual(len(self.cache._cache), stats['entries'])
+        self.assertTrue(stats['prefixes']['layer']['evictions'] > 0)
+        self.assertEqual(1, stats['hits'])
+
+        self.cache.clear()
+        self.assertEqual(0, self.cache.stats()['bytes'])
+
+    def test_publish(self):
+        self.cache.get('tree')
+        self.cache.publish_stats()
+        published = published_stats(os.path.join(self.tmpdir, 'stats'))
+        self.assertEqual([os.getpid()], list(published.keys()))
+        self.assertEqual(1, published[os.getpid()]['misses'])
+
+    def test_published_by_exited_processes(self):
+        self.cache.publish_stats()
+        dead = os.path.join(self.tmpdir, 'stats.999999')
+        with open(dead, 'w') as f:
+            f.write('{"misses": 5}')
+        with patch('regulations.cache_backends.process_exists',
+                   lambda pid: pid == os.getpid()):
+            published = published_stats(os.path.join(self.tmpdir, 'stats'))
+        self.assertEqual([os.getpid()], list(published.keys()))
+        self.assertFalse(os.path.exists(dead))
+
+    def test_process_exists(self):
+        self.assertTrue(process_exists(os.getpid()))
+        child = subprocess.Popen(['true'])
+        child.wait()
+        self.assertFalse(process_exists(child.pid))
@@ -0,0 +1,35 @@
+import json
+from unittest import TestCase
+
+from django.core.management import call_command
+from django.test import override_settings
+from six import StringIO
+
+from regulations.management.commands import cache_stats
+
+
+class CacheStatsTests(TestCase):
+    def test_combine(self):
+        self.assertEqual(
+            {'hits': 3, 'prefixes': {'layer': {'hits': 3},
+                                     'regulation': {'hits': 0}}},
+            cache_stats.combine([
+                {'hits': 1, 'prefixes': {'layer': {'hits': 1}}},
+                {'hits': 2, 'prefixes': {'layer': {'hits': 2},
+                                         'regulation': {'hits': 0}}}]))
+        # Each process has its own budget
+        self.assertEqual(
+            {'bytes': 300, 'max_bytes': 200},
+            cache_stats.combine([{'bytes': 100, 'max_bytes': 200},
+                                 {'bytes': 200, 'max_bytes': 200}]))
+
+    @override_settings(CACHES={
+        'budget': {'BACKEND': 'regulations.cache_backends.BudgetedTreeCache',
+                   'LOCATION': 'cache-stats-tests'},
+        'dummy': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_command(self):
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertIsNone(results['dummy'])
+        self.assertEqual(0, results['budget']['hits'])
@@ -23,7 +23,7 @@ class DiffApplierTest(TestCase):
     def test_deconstruct_text(self):
         da = self.create_diff_applier()
 
-        self.assertTrue('oq' in da.__dict__)
+        self.assertTrue(hasattr(da, 'oq'))
 
         deque_list = [
             deque(['a']), deque(['b']),
@@ -65,6 +65,29 @@ class DiffApplierTest(TestCase):
         new_text = da.get_text()
         self.assertEquals('<del>ac</del>bd<ins>AAB</ins>', new_text)
 
+    def test_apply_diff_changes_overlapping(self):
+        """Markup at the same position nests as if each were pushed onto
+        the front of that character's queue"""
+        da = diff_applier.DiffApplier({}, None)
+        new_text = da.apply_diff_changes('abcdef', [
+            ['insert', 2, 'X'], ['delete', 2, 4],
+            [['delete', 1, 3], ['insert', 3, 'Y']], ['insert', 6, 'Z']])
+        self.assertEqual(
+            'a<del>b<del><ins>X</ins>c</del><ins>Y</ins>d</del>ef<ins>Z</ins>',
+            new_text)
+
+    def test_apply_diff_changes_empty_text(self):
+        da = diff_applier.DiffApplier({}, None)
+        self.assertEqual('<ins>new</ins>',
+                         da.apply_diff_changes('', [['insert', 0, 'new']]))
+
+    def test_apply_diff_changes_untouched(self):
+        da = diff_applier.DiffApplier({}, None)
+        self.assertEqual('abcd', da.apply_diff_changes('abcd', []))
+        self.assertEqual(
+            'ab<ins>X</ins>cd',
+            da.apply_diff_changes('abcd', [['insert', 2, 'X']]))
+
     def test_apply_diff_title(self):
         diff = {'204': {'title': [('delete', 0, 2), ('insert', 4, 'AAC')],
                         'text':  [('delete', 0, 2), ('insert', 4, 'AAB')],
@@ -156,6 +179,42 @@ class DiffApplierTest(TestCase):
 
         da.add_nodes_to_tree(tree, adds)
 
+    def test_add_nodes_empty_tree_with_children(self):
+        """An added section, not in the original tree, keeps the paragraphs
+        added to it"""
+        def mk_node(*label):
+            return {'label': list(label), 'node_type': REGTEXT,
+                    'children': []}
+        tree = {}
+        adds = tree_builder.AddQueue()
+        adds.insert_all([('204-2', mk_node('204', '2')),
+                         ('204-2-b', mk_node('204', '2', 'b')),
+                         ('204-2-a', mk_node('204', '2', 'a')),
+                         ('204-2-a-1', mk_node('204', '2', 'a', '1'))])
+
+        diff_applier.DiffApplier({}, None).add_nodes_to_tree(tree, adds)
+        self.assertEqual(['204', '2'], tree['label'])
+        self.assertEqual([['204', '2', 'a'], ['204', '2', 'b']],
+                         [c['label'] for c in tree['children']])
+        self.assertEqual([['204', '2', 'a', '1']],
+                         [c['label'] for c in tree['children'][0]['children']])
+
+    def test_add_many_nodes(self):
+        """Many children added to the same parent are all put in order"""
+        def mk_node(*label):
+            return {'label': list(label), 'node_type': REGTEXT,
+                    'children': []}
+        tree = mk_node('204', '2')
+        tree['children'] = [mk_node('204', '2', str(i))
+                            for i in range(1, 100, 2)]
+        adds = tree_builder.AddQueue()
+        adds.insert_all([('204-2-' + str(i), mk_node('204', '2', str(i)))
+                         for i in range(100, 0, -2)])
+
+        diff_applier.DiffApplier({}, None).add_nodes_to_tree(tree, adds)
+        self.assertEqual([str(i) for i in range(1, 101)],
+                         [c['label'][-1] for c in tree['children']])
+
     def test_add_nodes_child_ops(self):
         """If we don't know the correct order of children, attempt to use data
         from `child_ops`"""
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from mock import Mock, patch
+from six import StringIO
+
+from regulations.generator.sitemap import Page
+from regulations.management.commands import eregs_cache
+
+
+class RateLimiterTests(TestCase):
+    @patch('regulations.management.commands.eregs_cache.time')
+    def test_wait(self, time):
+        time.time.return_value = 100
+        limiter = eregs_cache.RateLimiter(4)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual([0.25, 0.5],
+                         [call[0][0] for call in time.sleep.call_args_list])
+
+    @patch('regulations.management.commands.eregs_cache.time')
+    def test_no_limit(self, time):
+        limiter = eregs_cache.RateLimiter()
+        limiter.wait()
+        limiter.wait()
+        self.assertFalse(time.sleep.called)
+
+
+class EregsCacheTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def warmer(self):
+        warmer = eregs_cache.EregsCache(
+            'http://example.com/eregs/', checkpoint=self.checkpoint,
+            out=StringIO())
+        warmer.session = Mock()
+        warmer.session.get.side_effect = lambda url, timeout: Mock(
+            status_code=404 if url.endswith('/5678') else 200)
+        return warmer
+
+    @patch('regulations.management.commands.eregs_cache.sitemap')
+    def test_run_resumes(self, sitemap):
+        sitemap.all_pages.return_value = [
+            Page.of('regulation_landing_view', label_id=label_id)
+            for label_id in ('1234', '5678', '9012')]
+
+        summary = self.warmer().run()
+        self.assertEqual(3, summary['requests'])
+        self.assertEqual(1, summary['errors'])
+
+        # Only the failed page is retried
+        warmer = self.warmer()
+        self.assertEqual(['/5678'], warmer.paths())
+        summary = warmer.run()
+        self.assertEqual(1, summary['requests'])
+        with open(self.checkpoint) as f:
+            self.assertEqual(['/1234', '/9012'], sorted(f.read().split()))
+
+    def test_summary(self):
+        stats = eregs_cache.LatencyStats()
+        for idx in range(10):
+            stats.add('/{}'.format(idx), 200, idx)
+        summary = stats.summary(slowest=2)
+        self.assertEqual(4.5, summary['mean_s'])
+        self.assertEqual(5, summary['p50_s'])
+        self.assertEqual(9, summary['max_s'])
+        self.assertEqual(['/9', '/8'],
+                         [s['path'] for s in summary['slowest']])
+
+    def test_stats_from_threads(self):
+        stats = eregs_cache.LatencyStats()
+        checkpoint = eregs_cache.Checkpoint(self.checkpoint)
+
+        def add(thread):
+            for idx in range(200):
+                path = '/{}/{}'.format(thread, idx)
+                stats.add(path, 500 if idx % 2 else 200, 0.1)
+                checkpoint.record(path)
+        threads = [threading.Thread(target=add, args=(thread,))
+                   for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = stats.summary()
+        self.assertEqual(1600, summary['requests'])
+        self.assertEqual(800, summary['errors'])
+        self.assertEqual(800, stats.error_count())
+        self.assertEqual(1600, len(checkpoint.done))
+        with open(self.checkpoint) as f:
+            self.assertEqual(1600, len(f.read().split()))
@@ -0,0 +1,57 @@
+import random
+import threading
+import time
+from unittest import TestCase
+
+from mock import patch
+
+from regulations.generator import executor
+
+
+class ExecutorTests(TestCase):
+    def test_map_ordered(self):
+        """Results match the order of the arguments, not of completion"""
+        def slow_square(x):
+            time.sleep(random.uniform(0, 0.01))
+            return x * x
+        self.assertEqual([x * x for x in range(20)],
+                         executor.map_ordered(slow_square, range(20)))
+
+    def test_map_ordered_shares_executor(self):
+        threads = executor.map_ordered(
+            lambda _: threading.current_thread(), range(4))
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertIs(executor.get_executor(), executor.get_executor())
+
+    def test_map_ordered_exceptions(self):
+        def explode(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+        self.assertRaises(ValueError, executor.map_ordered, explode, range(5))
+
+    def test_map_ordered_nested(self):
+        """Calls from within a worker don't wait on the pool"""
+        def outer(x):
+            self.assertTrue(executor.in_worker())
+            return executor.map_ordered(lambda y: x + y, range(3))
+        self.assertEqual([[0, 1, 2], [1, 2, 3]],
+                         executor.map_ordered(outer, range(2)))
+        self.assertFalse(executor.in_worker())
+
+    @patch('regulations.generator.executor._stats', executor.ExecutorStats())
+    def test_stats(self):
+        executor.map_ordered(lambda x: x, range(5))
+        stats = executor.stats()
+        self.assertEqual(5, stats['submitted'])
+        self.assertEqual(5, stats['started'])
+        self.assertEqual(0, stats['depth'])
+        self.assertTrue(1 <= stats['max_depth'] <= 5)
+        self.assertTrue(0 <= stats['mean_wait'] <= stats['max_wait'])
+        self.assertEqual(0, stats['serial'])
+
+        executor.map_ordered(
+            lambda x: executor.map_ordered(lambda y: y, range(3)), range(2))
+        stats = executor.stats()
+        self.assertEqual(7, stats['submitted'])
+        self.assertEqual(6, stats['serial'])
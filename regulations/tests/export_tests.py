@@ -0,0 +1,146 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django.http import HttpResponse
+from mock import patch
+
+from regulations import export
+from regulations.generator.sitemap import Page
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_output_file(self):
+        self.assertEqual(
+            os.path.join(self.output_dir, '1234', 'v1', 'index.html'),
+            export.output_file(self.output_dir, '/1234/v1'))
+
+    def test_write_file(self):
+        file_name = os.path.join(self.output_dir, 'a', 'b', 'index.html')
+        export.write_file(file_name, b'content')
+        with open(file_name, 'rb') as f:
+            self.assertEqual(b'content', f.read())
+        with gzip.open(file_name + '.gz') as f:
+            self.assertEqual(b'content', f.read())
+
+    def test_batches(self):
+        pages = [Page.of('p', label_id=str(i), version='v1') for i in range(3)]
+        pages += [Page.of('p', label_id='1', version='v2'),
+                  Page.of('landing', label_id='1')]
+        self.assertEqual([3, 1, 1], [len(batch)
+                                     for batch in export.batches(pages)])
+        self.assertEqual([2, 1, 1, 1], [len(batch) for batch
+                                        in export.batches(pages, size=2)])
+
+    @patch('regulations.export.render')
+    def test_export_pages(self, render):
+        def response(path):
+            if path == '/1234':
+                return HttpResponse('landing')
+            return HttpResponse(status=404)
+        render.side_effect = response
+        pages = [Page.of('regulation_landing_view', label_id='1234'),
+                 Page.of('chrome_section_view', label_id='1234-1',
+                         version='v1')]
+
+        results = dict(export.export_pages(self.output_dir, pages,
+                                           compress=False))
+        file_name = os.path.join(self.output_dir, '1234', 'index.html')
+        self.assertEqual({pages[0]: file_name, pages[1]: None}, results)
+        self.assertFalse(os.path.exists(file_name + '.gz'))
+
+
+class SectionExportTests(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    @patch('regulations.export.changes')
+    @patch('regulations.export.sitemap.toc_labels')
+    @patch('regulations.export.render')
+    def test_export(self, render, toc_labels, changes):
+        contents = {}
+        render.side_effect = lambda path: HttpResponse(contents[path])
+
+        toc_labels.return_value = ['1234-1', '1234-2', '1234-Subpart-Interp']
+        contents.update({'/partial/1234-1/v1': 'one',
+                         '/partial/1234-2/v1': 'two',
+                         '/partial/1234-Subpart-Interp/v1': 'interp'})
+        results = export.SectionExport(self.output_dir, '1234').export('v1')
+        self.assertEqual(['1234-1', '1234-2', '1234-Subpart-Interp'],
+                         results['rendered'])
+
+        # In v2, 1234-1 is re-rendered with the same content, 1234-2 has
+        # changed, 1234-3 is new and the subterp is gone
+        toc_labels.return_value = ['1234-1', '1234-2', '1234-3']
+        changes.affected_sections.return_value = set(['1234-1', '1234-2'])
+        contents.update({'/partial/1234-1/v2': 'one',
+                         '/partial/1234-2/v2': 'new two',
+                         '/partial/1234-3/v2': 'three'})
+        section_export = export.SectionExport(self.output_dir, '1234')
+        results = section_export.export('v2')
+        changes.affected_sections.assert_called_with('1234', 'v1', 'v2')
+        self.assertEqual(['1234-2', '1234-3'], results['rendered'])
+        self.assertEqual(['1234-1'], results['unchanged'])
+        self.assertEqual(['1234-Subpart-Interp.html'], results['deleted'])
+
+        directory = os.path.join(self.output_dir, '1234')
+        self.assertEqual(
+            ['1234-1.html', '1234-2.html', '1234-3.html', 'manifest.json'],
+            sorted(name for name in os.listdir(directory)
+                   if not name.endswith('.gz')))
+        with open(os.path.join(directory, '1234-2.html')) as f:
+            self.assertEqual('new two', f.read())
+        manifest = export.SectionExport(self.output_dir, '1234').manifest
+        self.assertEqual('v2', manifest['version'])
+        self.assertEqual('v2', manifest['files']['1234-1.html']['version'])
+
+        # Nothing to do when already up to date
+        results = section_export.export('v2')
+        self.assertEqual([], results['rendered'] + results['unchanged'])
+
+    @patch('regulations.export.changes')
+    @patch('regulations.export.sitemap.toc_labels')
+    @patch('regulations.export.render')
+    def test_export_retries_failures(self, render, toc_labels, changes):
+        """A section which fails to render is retried on the next export,
+        even if the version hasn't changed"""
+        contents = {}
+        render.side_effect = lambda path: HttpResponse(
+            contents.get(path), status=200 if path in contents else 500)
+        toc_labels.return_value = ['1234-1', '1234-2']
+        contents.update({'/partial/1234-1/v1': 'one',
+                         '/partial/1234-2/v1': 'two'})
+        export.SectionExport(self.output_dir, '1234').export('v1')
+
+        # In v2, 1234-2 changes but fails to render; 1234-1 is unaffected
+        changes.affected_sections.return_value = set(['1234-2'])
+        results = export.SectionExport(self.output_dir, '1234').export('v2')
+        self.assertEqual(['1234-2'], results['failed'])
+        manifest = export.SectionExport(self.output_dir, '1234').manifest
+        self.assertEqual('v2', manifest['version'])
+        self.assertEqual('v2', manifest['files']['1234-1.html']['version'])
+        self.assertEqual('v1', manifest['files']['1234-2.html']['version'])
+
+        contents['/partial/1234-2/v2'] = 'new two'
+        results = export.SectionExport(self.output_dir, '1234').export('v2')
+        self.assertEqual(['1234-2'], results['rendered'])
+        with open(os.path.join(self.output_dir, '1234', '1234-2.html')) as f:
+            self.assertEqual('new two', f.read())
+        manifest = export.SectionExport(self.output_dir, '1234').manifest
+        self.assertEqual('v2', manifest['files']['1234-2.html']['version'])
+
+        # And then, nothing more to do
+        results = export.SectionExport(self.output_dir, '1234').export('v2')
+        self.assertEqual([], results['rendered'] + results['unchanged'] +
+                         results['failed'])
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from mock import patch
+
+from regulations.generator import changes
+
+
+class ChangesTests(TestCase):
+    def test_prefixes(self):
+        self.assertEqual(['1234', '1234-5', '1234-5-a'],
+                         changes.prefixes('1234-5-a'))
+
+    def test_references(self):
+        layers = {
+            'internal-citations': {'1234-1-a': [{'citation': ['1234', '2']}]},
+            'terms': {'1234-3': [{'ref': 'term:1234-1-b'}],
+                      'referenced': {'term:1234-1-b': {}}},
+            'interpretations': {'1234-4': [{'reference': '1234-4-Interp'}]}}
+        self.assertEqual(
+            set([('1234-1-a', '1234-2'), ('1234-3', '1234-1-b'),
+                 ('1234-4', '1234-4-Interp')]),
+            set(changes.references(layers)))
+
+    def test_neighbors(self):
+        toc = [{'index': ['1234', '1'], 'title': 'One'},
+               {'index': ['1234', '2'], 'title': 'Two'}]
+        self.assertEqual(
+            {'1234-1': (None, ('1234-2', 'Two')),
+             '1234-2': (('1234-1', 'One'), None)},
+            changes.neighbors(toc))
+
+    @patch('regulations.generator.changes.fetch_layers')
+    @patch('regulations.generator.changes.get_diff_json')
+    def test_changed_labels(self, get_diff_json, fetch_layers):
+        get_diff_json.return_value = {'1234-1-a': {'op': 'modified'}}
+        old = dict((source, {}) for source in changes.layer_sources())
+        new = dict((source, {}) for source in changes.layer_sources())
+        old['terms'] = {'1234-2': [{'ref': 'a:1234-1'}]}
+        new['terms'] = {'1234-2': [{'ref': 'a:1234-1'}],
+                        '1234-3': [{'ref': 'a:1234-1'}]}
+        fetch_layers.side_effect = [old, new]
+        self.assertEqual(set(['1234-1-a', '1234-3']),
+                         changes.changed_labels('1234', 'v1', 'v2'))
+
+    @patch('regulations.generator.changes.fetch_toc')
+    @patch('regulations.generator.changes.fetch_layers')
+    @patch('regulations.generator.changes.changed_labels')
+    def test_affected_sections(self, changed_labels, fetch_layers,
+                               fetch_toc):
+        changed_labels.return_value = set(['1234-2-a', '1234-5-c'])
+        fetch_layers.return_value = {
+            'internal-citations': {
+                '1234-3-b': [{'citation': ['1234', '2']}],
+                '1234-4-a': [{'citation': ['1234', '2', 'b']}]}}
+        old_toc = [{'index': ['1234', str(i)], 'title': str(i)}
+                   for i in range(1, 6)]
+        new_toc = old_toc[:4] + [{'index': ['1234', '6'], 'title': '6'}]
+        fetch_toc.side_effect = lambda part, version, flatten: (
+            old_toc if version == 'v1' else new_toc)
+
+        self.assertEqual(
+            # 2 changed; 3 cites (a parent of) a change, but 4 doesn't; 4
+            # and 6 are next to a new section. 5 isn't in the new TOC
+            set(['1234-2', '1234-3', '1234-4', '1234-6']),
+            changes.affected_sections('1234', 'v1', 'v2'))
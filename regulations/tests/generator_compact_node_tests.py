@@ -0,0 +1,111 @@
+import pickle
+
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+
+from regulations.generator.compact_node import (
+    CompactNode, compact_tree, materialize)
+from regulations.generator.html_builder import CFRHTMLBuilder
+from regulations.generator.layers.layers_applier import (
+    InlineLayersApplier, ParagraphLayersApplier, SearchReplaceLayersApplier)
+
+
+def mknode(label, text='', children=None):
+    return {'label': label.split('-'), 'text': text, 'node_type': 'regtext',
+            'children': children or []}
+
+
+class CompactNodeTests(SimpleTestCase):
+    def test_mapping(self):
+        node = CompactNode(label=['1', '2'], children=[])
+        node['text'] = 'Some text'
+        node['custom'] = 'extra'
+        self.assertEqual('Some text', node['text'])
+        self.assertEqual('extra', node['custom'])
+        self.assertIn('custom', node)
+        self.assertNotIn('title', node)
+        self.assertNotIn('other', node)
+        self.assertIsNone(node.get('title'))
+        self.assertEqual('default', node.get('other', 'default'))
+        self.assertRaises(KeyError, lambda: node['title'])
+        self.assertRaises(KeyError, lambda: node['other'])
+        self.assertEqual(['label', 'text', 'children', 'custom'], list(node))
+        self.assertEqual(4, len(node))
+        self.assertEqual({'label': ['1', '2'], 'text': 'Some text',
+                          'children': [], 'custom': 'extra'}, node)
+
+        del node['custom']
+        self.assertEqual('Some text', node.pop('text'))
+        self.assertEqual({'label': ['1', '2'], 'children': []}, dict(node))
+        self.assertRaises(KeyError, node.__delitem__, 'title')
+
+    def test_copy_and_pickle(self):
+        node = CompactNode(mknode('1-2', 'text'), custom=True)
+        for copied in (node.copy(), pickle.loads(pickle.dumps(node))):
+            self.assertIsInstance(copied, CompactNode)
+            self.assertEqual(node, copied)
+
+    def test_template_lookups(self):
+        """Missing keys render as they would for a dict"""
+        template = Template('{{ node.text }}|{{ node.header }}|'
+                            '{{ node.custom }}')
+        node = CompactNode(mknode('1-2', 'text'))
+        self.assertEqual('text||', template.render(Context({'node': node})))
+
+    def test_compact_tree(self):
+        tree = mknode('1-2', children=[mknode('1-2-a', children=[
+            mknode('1-2-a-1')])])
+        compact = compact_tree(tree)
+        self.assertEqual(tree, compact)
+        self.assertIsInstance(compact['children'][0]['children'][0],
+                              CompactNode)
+
+    def test_compact_tree_lazy(self):
+        """Children are only converted when accessed, and changes to them
+        don't reach the original tree"""
+        tree = mknode('1-2', children=[
+            mknode('1-2-a', children=[mknode('1-2-a-1')]), mknode('1-2-b')])
+        compact = compact_tree(tree)
+        self.assertIs(tree['children'], compact._children)
+        child = compact['children'][0]
+        self.assertIsInstance(child, CompactNode)
+        self.assertIsNot(tree['children'], compact._children)
+        self.assertIs(tree['children'][0]['children'], child._children)
+
+        child['text'] = 'Changed'
+        child['children'][0]['marked_up'] = 'Marked'
+        compact.get('children').pop()
+        self.assertEqual(mknode('1-2', children=[
+            mknode('1-2-a', children=[mknode('1-2-a-1')]), mknode('1-2-b')]),
+            tree)
+
+        # Replacing children before they're converted
+        compact = compact_tree(tree)
+        compact['children'] = ['replaced']
+        self.assertEqual(['replaced'], compact['children'])
+        self.assertEqual(2, len(tree['children']))
+
+    def test_materialize(self):
+        tree = mknode('1-2')
+        with override_settings(COMPACT_TREES=False):
+            self.assertIs(tree, materialize(tree))
+        with override_settings(COMPACT_TREES=True):
+            compact = materialize(tree)
+            self.assertIsInstance(compact, CompactNode)
+            self.assertIs(compact, materialize(compact))
+            self.assertIsNone(materialize(None))
+
+    def test_html_builder(self):
+        """HTMLBuilder annotates CompactNodes as it would dicts"""
+        tree = mknode('1-2', '(a) Text', children=[
+            mknode('1-2-a', '(a) Text'), mknode('1-2-b', 'More')])
+        results = []
+        for node in (tree, compact_tree(tree)):
+            builder = CFRHTMLBuilder(InlineLayersApplier(),
+                                     ParagraphLayersApplier(),
+                                     SearchReplaceLayersApplier())
+            builder.tree = node
+            builder.generate_html()
+            results.append(node)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual('1-2-b', results[1]['children'][1]['markup_id'])
@@ -0,0 +1,31 @@
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from regulations.generator import generations
+
+
+@override_settings(CACHES={'generations': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'generations-tests'}}, GENERATIONS_CACHE='generations')
+class GenerationsTests(SimpleTestCase):
+    def test_bump(self):
+        part, everything = generations.token('1234'), generations.token()
+        other = generations.token('5678')
+        self.assertEqual(part, generations.token('1234'))
+
+        generations.bump('1234')
+        self.assertNotEqual(part, generations.token('1234'))
+        self.assertNotEqual(everything, generations.token())
+        self.assertEqual(other, generations.token('5678'))
+
+    def test_request_token(self):
+        request = RequestFactory().get('/1234-5-b/2015-1111')
+        self.assertEqual('1234', generations.request_part(request))
+        self.assertEqual(generations.token('1234'),
+                         generations.request_token(request))
+
+        request = RequestFactory().get('/about')
+        self.assertIsNone(generations.request_part(request))
+        self.assertEqual(generations.token(),
+                         generations.request_token(request))
+        self.assertIsNone(generations.request_part(
+            RequestFactory().get('/not/a/page')))
@@ -0,0 +1,66 @@
+from datetime import datetime
+from unittest import TestCase
+
+from mock import patch
+
+from regulations.generator import sitemap
+
+
+class SitemapTests(TestCase):
+    def test_page_path(self):
+        page = sitemap.Page.of('chrome_section_view', label_id='1234-5',
+                               version='vvv')
+        self.assertEqual('/1234-5/vvv', page.path)
+        self.assertEqual({'label_id': '1234-5', 'version': 'vvv'}, page.args)
+        self.assertEqual(page, sitemap.Page.of(
+            'chrome_section_view', version='vvv', label_id='1234-5'))
+
+    @patch('regulations.generator.sitemap.'
+           'fetch_regulations_and_future_versions')
+    def test_part_versions(self, fetch):
+        fetch.return_value = {
+            '1234': [{'version': 'v2', 'by_date': datetime(2012, 1, 1)},
+                     {'version': 'v1', 'by_date': datetime(2011, 1, 1)}],
+            '5678': [{'version': 'v3', 'by_date': datetime(2013, 1, 1)}]}
+        self.assertEqual({'1234': ['v1', 'v2'], '5678': ['v3']},
+                         sitemap.part_versions())
+        self.assertEqual(['1234'], list(sitemap.part_versions(['1234'])))
+
+    def test_diff_labels(self):
+        self.assertEqual(
+            ['1234-1', '1234-A', '1234-Interp'],
+            sitemap.diff_labels(['1234-1', '1234-A', '1234-Subpart-Interp',
+                                 '1234-Appendices-Interp'], '1234'))
+        self.assertEqual(['1234-1'], sitemap.diff_labels(['1234-1'], '1234'))
+
+    def test_version_pairs(self):
+        versions = ['v1', 'v2', 'v3']
+        self.assertEqual([('v1', 'v2'), ('v1', 'v3'), ('v2', 'v3')],
+                         sitemap.version_pairs(versions, 'all'))
+        self.assertEqual([('v1', 'v2'), ('v2', 'v3')],
+                         sitemap.version_pairs(versions, 'adjacent'))
+        self.assertEqual([], sitemap.version_pairs(versions, 'none'))
+
+    @patch('regulations.generator.sitemap.api_reader')
+    @patch('regulations.generator.sitemap.fetch_toc')
+    @patch('regulations.generator.sitemap.part_versions')
+    def test_all_pages(self, part_versions, fetch_toc, api_reader):
+        part_versions.return_value = {'1234': ['v1', 'v2']}
+        fetch_toc.return_value = [{'index': ['1234', '1']},
+                                  {'index': ['1234', 'Subpart', 'Interp']}]
+        api_reader.ApiReader.return_value.layer.return_value = {
+            '1234-1': [{'reference': ['2012-111', '1234-1']}]}
+
+        paths = [page.path for page in sitemap.all_pages()]
+        self.assertEqual(len(paths), len(set(paths)))
+        for path in ('/1234', '/1234/v1', '/partial/1234/v2', '/1234-1/v1',
+                     '/partial/1234-1/v2', '/1234-Subpart-Interp/v2',
+                     '/partial/1234-Subpart-Interp/v1', '/diff/1234-1/v1/v2',
+                     '/partial/diff/1234-Interp/v1/v2',
+                     '/partial/sxs/1234-1/2012-111'):
+            self.assertIn(path, paths)
+
+        paths = [page.path for page in sitemap.all_pages(diffs='none',
+                                                         sxs=False)]
+        self.assertFalse(any('diff' in path or 'sxs' in path
+                             for path in paths))
@@ -99,9 +99,10 @@ class GeneratorTest(TestCase):
         self.assertTrue(isinstance(p_applier, ParagraphLayersApplier))
         self.assertTrue(isinstance(s_applier, SearchReplaceLayersApplier))
 
-    @patch('regulations.generator.generator.LayerCreator.get_layer_json')
-    def test_add_layers(self, get_layer_json):
-        get_layer_json.return_value = {'layer': 'layer'}
+    @patch('regulations.generator.generator.LayerCreator.get_layers_json')
+    def test_add_layers(self, get_layers_json):
+        get_layers_json.side_effect = lambda names, *args: [
+            {'layer': 'layer'}] * len(names)
 
         creator = generator.LayerCreator()
         creator.add_layers(
@@ -115,3 +116,23 @@ class GeneratorTest(TestCase):
         internal_citation_layer = i.layers['internal']
         self.assertTrue(internal_citation_layer.sectional)
         self.assertEquals(internal_citation_layer.version, 'verver')
+        self.assertEqual(1, get_layers_json.call_count)
+        self.assertEqual(['graphics', 'internal-citations', 'meta'],
+                         get_layers_json.call_args[0][0])
+
+    @patch('regulations.generator.generator.api_reader')
+    def test_diff_get_layers_json(self, api_reader):
+        """Both versions' layers are requested in a single batch, then
+        combined"""
+        layers = api_reader.ApiReader.return_value.layers
+        layers.return_value = [{'a': 1}, {'b': 2}, {'a': 3, 'c': 3}, {}]
+        creator = generator.DiffLayerCreator('newer')
+        self.assertEqual(
+            [{'a': 1, 'c': 3}, {'b': 2}],
+            creator.get_layers_json(['l1', 'l2'], 'cfr', '205-1', 'older'))
+        self.assertEqual(1, layers.call_count)
+        self.assertEqual([('l1', 'cfr', '205-1', 'older'),
+                          ('l2', 'cfr', '205-1', 'older'),
+                          ('l1', 'cfr', '205-1', 'newer'),
+                          ('l2', 'cfr', '205-1', 'newer')],
+                         layers.call_args[0][0])
@@ -23,7 +23,7 @@ class HTMLBuilderTest(TestCase):
         }
 
         inline = Mock()
-        inline.get_layer_pairs.return_value = []
+        inline.get_offset_pairs.return_value = []
         par = Mock()
         par.apply_layers.return_value = node
         sr = Mock()
@@ -32,15 +32,30 @@ class HTMLBuilderTest(TestCase):
         builder = HTMLBuilder(inline, par, sr)
         builder.process_node(node)
 
-        self.assertTrue(inline.get_layer_pairs.called)
+        self.assertTrue(inline.get_offset_pairs.called)
         self.assertEqual("123-aaa",
-                         inline.get_layer_pairs.call_args[0][0])
+                         inline.get_offset_pairs.call_args[0][0])
         self.assertEqual("Text text text.",
-                         inline.get_layer_pairs.call_args[0][1])
+                         inline.get_offset_pairs.call_args[0][1])
 
         self.assertTrue(par.apply_layers.called)
         self.assertEqual(node, par.apply_layers.call_args[0][0])
 
+    def test_process_node_twice(self):
+        """Re-processing a node (e.g. one shared within a request) starts
+        from the original text"""
+        node = {'text': 'Text text.', 'children': [], 'label': ['1', 'a'],
+                'node_type': REGTEXT}
+        inline = Mock()
+        inline.get_offset_pairs.return_value = []
+        sr = Mock()
+        sr.get_layer_pairs.return_value = [('Text', '<b>Text</b>', [0])]
+
+        builder = HTMLBuilder(inline, ParagraphLayersApplier(), sr)
+        builder.process_node(node)
+        builder.process_node(node)
+        self.assertEqual('<b>Text</b> text.', node['marked_up'])
+
     def test_process_node_header(self):
         builder = HTMLBuilder(None, ParagraphLayersApplier(), None)
         node = {'text': '', 'children': [], 'label': ['99', '22'],
@@ -228,10 +243,10 @@ class CFRHTMLBuilderTest(TestCase):
             'label': ['999', '5', 'Interp']
         }
         p.apply_layers.return_value = node
-        inline.get_layer_pairs.return_value = []
+        inline.get_offset_pairs.return_value = []
         sr.get_layer_pairs.return_value = []
         builder.process_node(node)
-        layer_parameters = inline.get_layer_pairs.call_args[0]
+        layer_parameters = inline.get_offset_pairs.call_args[0]
         self.assertEqual('Interpretation with a link', layer_parameters[1])
         self.assertEqual('999-5-Interp', layer_parameters[0])
 
@@ -311,7 +326,7 @@ class CFRHTMLBuilderTest(TestCase):
 class PreambleHTMLBuilderTest(TestCase):
     def setUp(self):
         inline, par, sr = Mock(), Mock(), Mock()
-        inline.get_layer_pairs.return_value = []
+        inline.get_offset_pairs.return_value = []
         par.apply_layers.side_effect = lambda x: x
         sr.get_layer_pairs.return_value = []
 
@@ -355,7 +370,7 @@ class PreambleHTMLBuilderTest(TestCase):
 class CFRChangeHTMLBuilderTests(TestCase):
     def setUp(self):
         inline, par, sr = Mock(), Mock(), Mock()
-        inline.get_layer_pairs.return_value = []
+        inline.get_offset_pairs.return_value = []
         par.apply_layers.side_effect = lambda x: x
         sr.get_layer_pairs.return_value = []
         diffs = DiffApplier({'111-22-a': {'op': 'deleted'}}, '111-22')
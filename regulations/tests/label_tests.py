@@ -21,3 +21,10 @@ class LabelTests(TestCase):
                                   Label('200-20-d-2-ix'),
                                   Label('200-20-d-2-x'),
                                   Label('200-20-d-2-xi')])
+
+    def test_sort_key_shared(self):
+        """Labels with the same parts share a sort key"""
+        first = Label('200-20-d-Interp-1-iv')
+        second = Label(parts=['200', '20', 'd', 'Interp', '1', 'iv'])
+        self.assertEqual((200, 20, 'd', 1, 4), first.sort_key)
+        self.assertIs(first.sort_key, second.sort_key)
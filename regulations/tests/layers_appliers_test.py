@@ -1,3 +1,4 @@
+import random
 from unittest import TestCase
 from regulations.generator.layers import layers_applier
 from regulations.generator.layers import location_replace
@@ -135,3 +136,114 @@ class LayersApplierTest(TestCase):
                   "law. </dfn> state law. <dfn> <a href=\"link_url\">state"
                   "</a> liability. </dfn>")
         self.assertEquals(applier.text, result)
+
+
+class SpliceLayersApplierTest(TestCase):
+    def assert_parity(self, text, elements, fast=True):
+        """The single-pass applier should produce exactly what LayersApplier
+        does. If `fast`, it shouldn't need to fall back to LayersApplier"""
+        old = layers_applier.LayersApplier()
+        old.enqueue_from_list([(o, r, list(l)) for o, r, l in elements])
+        expected = old.apply_layers(text)
+
+        new = layers_applier.SpliceLayersApplier()
+        new.enqueue_from_list(elements)
+        self.assertEqual(expected, new.apply_layers(text))
+        if fast:
+            self.assertEqual(expected, new.splice(text))
+        return expected
+
+    def test_nesting(self):
+        text = '<em>(6)</em> Under state law. State law, states.'
+        result = self.assert_parity(text, [
+            ('state law', '<a href="#1">state law</a>', [0]),
+            ('state', '<dfn>state</dfn>', [0, 1]),
+            ('law', '<b>law</b>', []),
+            ('(6)', '<span class="marker">(6)</span>', [0])])
+        self.assertEqual(
+            '<em><span class="marker">(6)</span></em> Under <a href="#1">'
+            '<dfn>state</dfn> <b>law</b></a>. State <b>law</b>, '
+            '<dfn>state</dfn>s.',
+            result)
+
+    def test_tags_split_matches(self):
+        self.assert_parity('<p>sta<ins>te</ins> state</p>',
+                           [('state', '<a>state</a>', [0]),
+                            ('te', '<i>te</i>', [])])
+
+    def test_removed_text(self):
+        """Replacements which don't keep the original text can't be matched
+        by later elements"""
+        self.assert_parity('<p>![img](url) and img</p>', [
+            ('![img](url)', '<img src="url">', [0]),
+            ('img', '<b>img</b>', [0])])
+
+    def test_no_trailing_replace_all(self):
+        self.assert_parity('No tags: state', [('state', '<a>state</a>', [])])
+        self.assert_parity('state <br> state', [('state', '<a>state</a>', [])])
+
+    def test_fallback(self):
+        self.assert_parity('AT&amp;T state', [('state', '<a>T</a>', [0])],
+                           fast=False)
+        self.assert_parity('1 < 2 state <b>', [('state', '<a>s</a>', [])],
+                           fast=False)
+        self.assert_parity('<b>st</b>', [('st', 'st*', [0]),
+                                         ('t', '<i>t</i>', [0, 1])],
+                           fast=False)
+
+    def test_random_parity(self):
+        rand = random.Random(1234)
+        words = ['state', 'law', 'st', 'a', 'the state', 'state law', '(a)',
+                 '<em>', '</em>', '<ins>', '</ins>', ' ', ' ', '&amp;']
+        replacements = ['<a href="#{0}">{0}</a>', '<span>{0}</span>',
+                        '<img src="{0}">', '<b>Z</b>', '{0}*', '{0}',
+                        '<i>{0}', '<a title="a>b">{0}</a>']
+        for _ in range(500):
+            text = ''.join(rand.choice(words) for _ in range(12))
+            elements = []
+            for _ in range(rand.randint(0, 5)):
+                original = rand.choice(words[:7])
+                locations = rand.choice(
+                    [[], rand.sample(range(4), rand.randint(1, 3))])
+                replacement = rand.choice(replacements).format(original)
+                elements.append((original, replacement, locations))
+            self.assert_parity(text, elements, fast=False)
+
+    def test_offsets(self):
+        """Inline layers' pairs are applied at their offsets"""
+        text = 'state law; state; state'
+        pairs = [('state', '<a>state</a>', (11, 16)),
+                 ('state law', '<b>state law</b>', (0, 9)),
+                 ('state', '<i>state</i>', (0, 5))]
+        applier = layers_applier.SpliceLayersApplier()
+        applier.enqueue_offsets(pairs, text)
+        applier.enqueue(('law', '<em>law</em>', [0]))
+        self.assertEqual(
+            '<b><i>state</i> <em>law</em></b>; <a>state</a>; state',
+            applier.apply_layers(text))
+
+        # Same results as when converted to locations
+        self.assert_parity(text, [('law', '<em>law</em>', [0])] +
+                           layers_applier.InlineLayersApplier.to_locations(
+                               pairs, text))
+
+    def test_offsets_other_text(self):
+        """If the text being marked up isn't the text the offsets refer to
+        (e.g. it contains a diff), the offsets are converted to locations"""
+        text = 'a state, the state'
+        applier = layers_applier.SpliceLayersApplier()
+        applier.enqueue_offsets([('state', '<a>state</a>', (13, 18))], text)
+        self.assertEqual(
+            '<ins>new </ins>a state, the <a>state</a>',
+            applier.apply_layers('<ins>new </ins>' + text))
+
+    def test_to_locations(self):
+        text = 'state law; state; state'
+        pairs = [('state', 'S', (18, 23)), ('state', 'S', [11, 16]),
+                 ('law', 'L', (6, 9))]
+        self.assertEqual(
+            [('state', 'S', [2]), ('state', 'S', [1]), ('law', 'L', [0])],
+            layers_applier.InlineLayersApplier.to_locations(pairs, text))
+        self.assertRaises(ValueError,
+                          layers_applier.InlineLayersApplier.to_locations,
+                          [('state', 'S', (1, 6))], text)
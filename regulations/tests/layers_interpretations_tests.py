@@ -1,4 +1,5 @@
 from mock import Mock, patch
+import six
 from django.conf import settings
 from unittest import TestCase
 
@@ -132,3 +133,79 @@ class InterpretationsLayerTest(TestCase):
         il = InterpretationsLayer({})
         il.preprocess_root(node)
         self.assertEqual(il.root_interp_label, '1234-56-a-Interp')
+
+    def test_references_within(self):
+        il = InterpretationsLayer({
+            '1234-5': [{'reference': '1234-5-Interp'}],
+            '1234-5-a': [{'reference': '1234-5-a-Interp'},
+                         {'reference': '1234-5-Interp'}],
+            '1234-50': [{'reference': '1234-50-Interp'}],
+            '1234-6-b': []})
+        self.assertEqual(['1234-5-Interp', '1234-5-a-Interp'],
+                         il.references_within('1234-5'))
+        self.assertEqual(['1234-5-Interp', '1234-5-a-Interp',
+                          '1234-50-Interp'], il.references_within('1234'))
+
+    @patch('regulations.generator.layers.interpretations.loader')
+    @patch('regulations.generator.layers.interpretations.views')
+    @patch('regulations.generator.layers.interpretations.generator')
+    def test_render_interps(self, generator, views, loader):
+        """Interpretations are built together and rendered without going
+        through the view"""
+        trees = {'1234-5-a-Interp': {'label': ['1234', '5', 'a', 'Interp']}}
+        generator.generator.get_tree_paragraph.side_effect = (
+            lambda label, version: trees.get(label))
+        loader.get_template.return_value.render.return_value = 'markup'
+        il = InterpretationsLayer({}, version='vvvv')
+        il.root_interp_label = '1234-5-Interp'
+
+        markup = il.render_interps(['1234-5-a-Interp', '1234-5-b-Interp'],
+                                   'appliers')
+        self.assertEqual({'1234-5-a-Interp': 'markup'}, markup)
+        root, appliers = views.partial.generate_html.call_args[0]
+        self.assertEqual([trees['1234-5-a-Interp']], root['children'])
+        self.assertEqual('appliers', appliers)
+        context = loader.get_template.return_value.render.call_args[0][0]
+        self.assertEqual('1234-5-a-Interp', context['label_id'])
+        self.assertTrue(context['inline'])
+
+    @patch('regulations.generator.layers.interpretations.loader')
+    @patch('regulations.generator.layers.interpretations.views')
+    @patch('regulations.generator.layers.interpretations.generator')
+    def test_render_interps_built_once(self, generator, views, loader):
+        """Each node is only built once, even if it's returned for several
+        references or was built already"""
+        shared = {'label': ['1234', '5', 'a', 'Interp']}
+        built = {'label': ['1234', '5', 'c', 'Interp'], 'marked_up': 'Done'}
+        trees = {'1234-5-a-Interp': shared, '1234-5-b-Interp': shared,
+                 '1234-5-c-Interp': built}
+        generator.generator.get_tree_paragraph.side_effect = (
+            lambda label, version: trees.get(label))
+        loader.get_template.return_value.render.return_value = 'markup'
+        il = InterpretationsLayer({}, version='vvvv')
+        il.root_interp_label = '1234-5-Interp'
+
+        markup = il.render_interps(sorted(trees), 'appliers')
+        self.assertEqual(sorted(trees), sorted(markup))
+        root, _ = views.partial.generate_html.call_args[0]
+        self.assertEqual(1, len(root['children']))
+        self.assertIs(shared, root['children'][0])
+
+    @patch('regulations.generator.layers.interpretations.generator')
+    @patch('regulations.generator.layers.interpretations.SectionUrl')
+    def test_apply_layer_prerendered(self, su, generator):
+        """Interpretations rendered up front don't go through the view; those
+        which weren't fall back to it"""
+        il = InterpretationsLayer({'200-2': [
+            {'reference': '200-2-Interp'}, {'reference': '200-2-a-Interp'}]})
+        il.markup = {'200-2-Interp': 'batch'}
+        il.partial_view = Mock()
+        il.partial_view.return_value.content = b'view'
+        il.partial_view.return_value.charset = 'utf-8'
+
+        _, data = il.apply_layer('200-2')
+        self.assertEqual(['batch', 'view'],
+                         [interp['markup'] for interp in data['interps']])
+        self.assertTrue(all(isinstance(interp['markup'], six.text_type)
+                            for interp in data['interps']))
+        self.assertEqual(1, il.partial_view.call_count)
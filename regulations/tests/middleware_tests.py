@@ -0,0 +1,107 @@
+import json
+
+from django.http import HttpResponse
+from django.template import Template
+from django.template.response import SimpleTemplateResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from mock import patch
+
+from regulations.generator import api_reader, generations, timing
+from regulations.middleware import (
+    ApiMemoMiddleware, ServerTimingMiddleware, generation_cache_page)
+
+
+class ApiMemoMiddlewareTests(SimpleTestCase):
+    def test_memo_lifecycle(self):
+        middleware = ApiMemoMiddleware()
+        middleware.process_request(None)
+        memo = api_reader.current_memo()
+        self.assertIsNotNone(memo)
+        memo.hits = 3
+
+        with override_settings(DEBUG=True):
+            response = middleware.process_response(None, HttpResponse())
+        self.assertIsNone(api_reader.current_memo())
+        self.assertEqual('3', response[ApiMemoMiddleware.HEADER])
+
+    def test_no_header_in_production(self):
+        middleware = ApiMemoMiddleware()
+        middleware.process_request(None)
+        with override_settings(DEBUG=False):
+            response = middleware.process_response(None, HttpResponse())
+        self.assertFalse(response.has_header(ApiMemoMiddleware.HEADER))
+
+    def test_response_without_request(self):
+        """Responses short-circuited by earlier middleware never hit
+        process_request"""
+        response = ApiMemoMiddleware().process_response(None, HttpResponse())
+        self.assertFalse(response.has_header(ApiMemoMiddleware.HEADER))
+
+
+class ServerTimingMiddlewareTests(SimpleTestCase):
+    def request(self, response):
+        middleware = ServerTimingMiddleware()
+        request = RequestFactory().get('/some/path')
+        middleware.process_request(request)
+        with timing.timer('api'):
+            pass
+        response = middleware.process_template_response(request, response)
+        response.render()
+        return middleware.process_response(request, response)
+
+    @override_settings(SERVER_TIMING=True, SERVER_TIMING_LOG=False)
+    def test_header(self):
+        response = self.request(SimpleTemplateResponse(Template('Hi')))
+        self.assertIsNone(timing.current_timings())
+        header = response[ServerTimingMiddleware.HEADER]
+        self.assertTrue(header.startswith('api;dur='))
+        self.assertIn('render;dur=', header)
+        self.assertIn('total;dur=', header)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        response = self.request(SimpleTemplateResponse(Template('Hi')))
+        self.assertFalse(response.has_header(ServerTimingMiddleware.HEADER))
+
+    @override_settings(SERVER_TIMING=True, SERVER_TIMING_LOG=True)
+    @patch('regulations.middleware.logger')
+    def test_log(self, logger):
+        self.request(SimpleTemplateResponse(Template('Hi')))
+        logged = json.loads(logger.info.call_args[0][0])
+        self.assertEqual('/some/path', logged['path'])
+        self.assertEqual(200, logged['status'])
+        self.assertEqual(['api', 'render'], list(logged['phases'].keys()))
+        self.assertEqual(
+            set(['executor', 'connections', 'fetches', 'sort_keys']),
+            set(logged['process'].keys()))
+        self.assertIn('max_wait', logged['process']['executor'])
+
+
+@override_settings(CACHES={
+    'generations': {'BACKEND': 'django.core.cache.backends.locmem.'
+                               'LocMemCache',
+                    'LOCATION': 'middleware-generations-tests'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+              'LOCATION': 'middleware-pages-tests'}},
+    GENERATIONS_CACHE='generations')
+class GenerationCacheTests(SimpleTestCase):
+    def test_generation_cache_page(self):
+        calls = []
+
+        @generation_cache_page(60, cache='pages')
+        def view(request, label_id, version):
+            calls.append(label_id)
+            return HttpResponse('content')
+
+        def get(path):
+            view(RequestFactory().get(path), *path.split('/')[1:])
+
+        get('/1234-1/v1')
+        get('/1234-1/v1')
+        get('/5678-1/v1')
+        self.assertEqual(['1234-1', '5678-1'], calls)
+
+        generations.bump('1234')
+        get('/1234-1/v1')
+        get('/5678-1/v1')
+        self.assertEqual(['1234-1', '5678-1', '1234-1'], calls)
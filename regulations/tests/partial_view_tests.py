@@ -44,10 +44,11 @@ class PartialParagraphViewTests(TestCase):
 class PartialSectionViewTests(TestCase):
     @patch('regulations.generator.generator.get_tree_paragraph')
     @patch('regulations.views.partial.navigation')
-    @patch('regulations.generator.generator.LayerCreator.get_layer_json')
-    def test_get_context_data(self, get_layer_json, navigation,
+    @patch('regulations.generator.generator.LayerCreator.get_layers_json')
+    def test_get_context_data(self, get_layers_json, navigation,
                               get_tree_paragraph):
-        get_layer_json.return_value = {'layer': 'layer'}
+        get_layers_json.side_effect = lambda names, *args: [
+            {'layer': 'layer'} for _ in names]
         navigation.nav_sections.return_value = None, None
         get_tree_paragraph.return_value = {
             'text': 'Some Text',
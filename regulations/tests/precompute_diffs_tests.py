@@ -0,0 +1,23 @@
+from collections import OrderedDict
+from unittest import TestCase
+
+from django.core.management import call_command
+from mock import patch
+from six import StringIO
+
+
+class PrecomputeDiffsTests(TestCase):
+    @patch('regulations.management.commands.precompute_diffs.DiffRenderer')
+    @patch('regulations.management.commands.precompute_diffs.sitemap'
+           '.part_versions')
+    def test_command(self, part_versions, DiffRenderer):
+        part_versions.return_value = OrderedDict([('1111', ['v1', 'v2',
+                                                            'v3'])])
+        DiffRenderer.return_value.render_all.return_value = {
+            'rendered': ['1111-1'], 'failed': ['1111-2']}
+        out, err = StringIO(), StringIO()
+        call_command('precompute_diffs', stdout=out, stderr=err)
+        self.assertEqual([('1111', 'v1', 'v2'), ('1111', 'v2', 'v3')],
+                         [call[0] for call in DiffRenderer.call_args_list])
+        self.assertIn('1111 v1 -> v2: 1 rendered, 1 failed', out.getvalue())
+        self.assertIn('Failed: 1111-2', err.getvalue())
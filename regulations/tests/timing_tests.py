@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from regulations.generator import timing
+
+
+class TimingTests(TestCase):
+    def tearDown(self):
+        timing.end_request_timings()
+
+    def test_timer_without_request(self):
+        """Outside of a timed request, timers do nothing"""
+        self.assertIsNone(timing.current_timings())
+        with timing.timer('api'):
+            pass
+        self.assertIsNone(timing.current_timings())
+
+    def test_timer(self):
+        timings = timing.start_request_timings()
+        for _ in range(3):
+            with timing.timer('api'):
+                pass
+        with timing.timer('html'):
+            pass
+        self.assertEqual(['api', 'html'], list(timings.phases.keys()))
+        self.assertEqual(3, timings.as_dict()['api']['count'])
+        self.assertIs(timings, timing.end_request_timings())
+        self.assertIsNone(timing.current_timings())
+
+    def test_nesting(self):
+        """Nested phases are counted; a phase nested in itself isn't"""
+        timings = timing.start_request_timings()
+        with timing.timer('html'):
+            with timing.timer('api'):
+                pass
+            with timing.timer('html'):
+                pass
+        self.assertEqual(1, timings.as_dict()['html']['count'])
+        self.assertEqual(1, timings.as_dict()['api']['count'])
+        self.assertEqual(set(), timings.active)
+
+    def test_exceptions(self):
+        timings = timing.start_request_timings()
+        with self.assertRaises(ValueError):
+            with timing.timer('api'):
+                raise ValueError()
+        self.assertEqual(1, timings.as_dict()['api']['count'])
+        self.assertEqual(set(), timings.active)
+
+    def test_header(self):
+        timings = timing.RequestTimings()
+        timings.add('api', 0.012)
+        timings.add('api', 0.002)
+        header = timings.header()
+        self.assertTrue(
+            header.startswith('api;dur=14.000;desc="2 calls", total;dur='))
@@ -37,6 +37,20 @@ class TreeBuilderTest(TestCase):
         self.assertEqual(set(tree_hash.keys()),
                          set(['204-3-a', '204-3', '204']))
 
+    def test_build_tree_paths(self):
+        tree = self.build_tree()
+        tree['children'].append({
+            'text': 'another child', 'label': ['204', '4'],
+            'node_type': REGTEXT,
+            'children': [{'text': 'a', 'label': ['204', '4', 'a'],
+                          'node_type': REGTEXT, 'children': []}]})
+        paths = tree_builder.build_tree_paths(tree)
+        self.assertEqual({'204': [], '204-3': [0], '204-4': [1],
+                          '204-4-a': [1, 0]}, paths)
+        for label_id, path in paths.items():
+            node = tree_builder.node_at_path(tree, path)
+            self.assertEqual(label_id, '-'.join(node['label']))
+
     def test_parent_in_tree(self):
         tree = self.build_tree()
         tree_hash = tree_builder.build_tree_hash(tree)
@@ -68,6 +82,36 @@ class TreeBuilderTest(TestCase):
         sortable = tree_builder.make_label_sortable(label, roman=True)
         self.assertEquals(sortable, (4,))
 
+    def test_make_label_sortable_not_a_roman(self):
+        self.assertRaises(ValueError, tree_builder.make_label_sortable, 'a',
+                          roman=True)
+
+    def test_roman_positions(self):
+        self.assertEqual(50, len(tree_builder.ROMAN_NUMERALS))
+        self.assertEqual(9, tree_builder.ROMAN_POSITIONS['ix'])
+        self.assertEqual(50, tree_builder.ROMAN_POSITIONS['l'])
+
+    def test_sort_key_cache(self):
+        cache = tree_builder.SortKeyCache(2)
+        calls = []
+
+        def compute(value):
+            def fn():
+                calls.append(value)
+                return value
+            return fn
+
+        self.assertEqual(1, cache.get('a', compute(1)))
+        self.assertEqual(2, cache.get('b', compute(2)))
+        self.assertEqual(1, cache.get('a', compute(10)))
+        # 'b' is least recently used, so is displaced
+        self.assertEqual(3, cache.get('c', compute(3)))
+        self.assertEqual(1, cache.get('a', compute(10)))
+        self.assertEqual(20, cache.get('b', compute(20)))
+        self.assertEqual([1, 2, 3, 20], calls)
+        self.assertEqual({'entries': 2, 'hits': 2, 'misses': 4},
+                         cache.stats())
+
     def test_make_label_sortable_not_roman(self):
         label = "iv"
         sortable = tree_builder.make_label_sortable(label)
@@ -136,6 +180,24 @@ class TreeBuilderTest(TestCase):
         tree_builder.add_child(tree, child)
         self.assertEquals(static_tree, tree)
 
+    def test_add_children(self):
+        def mknode(label):
+            return {'label': label.split('-'), 'node_type': REGTEXT,
+                    'children': []}
+        parent = mknode('204-2')
+        parent['children'] = [mknode('204-2-b'), mknode('204-2-d')]
+        tree_builder.add_children(parent, [mknode('204-2-e'),
+                                           mknode('204-2-a'),
+                                           mknode('204-2-c')])
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'],
+                         [c['label'][-1] for c in parent['children']])
+
+        parent['child_labels'] = ['204-2-a', '204-2-c', '204-2-b',
+                                  '204-2-d', '204-2-f', '204-2-e']
+        tree_builder.add_children(parent, [mknode('204-2-f')])
+        self.assertEqual(['a', 'c', 'b', 'd', 'f', 'e'],
+                         [c['label'][-1] for c in parent['children']])
+
     def test_add_child_appendix(self):
         parent = {'children': [
             {'node_type': 'APPENDIX', 'label': ['204', 'A', '1']},
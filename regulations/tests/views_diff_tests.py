@@ -1,9 +1,13 @@
 from unittest import TestCase
 
-from django.test import RequestFactory
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase, override_settings
 from mock import patch
 
+from regulations.generator import executor
+from regulations.generator.api_client import ApiClient
 from regulations.views import diff as views_diff
+from regulations.views.error_handling import MissingContentException
 
 
 class ChromeSectionDiffViewTests(TestCase):
@@ -176,3 +180,142 @@ class PartialSectionDiffViewTests(TestCase):
         self.assert_correct_nav('9898-A', prev='9898-5',
                                 following='9898-Interp')
         self.assert_correct_nav('9898-Interp', prev='9898-A', following=None)
+
+
+@override_settings(CACHES={'eregs_longterm_cache': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'diff-renderer-tests'}}, DIFF_PRECOMPUTE=False)
+@patch('regulations.views.diff.render_section')
+@patch('regulations.views.diff.fetch_toc')
+@patch('regulations.views.diff.generator.get_diff_json')
+class DiffRendererTests(SimpleTestCase):
+    def setUp(self):
+        caches['eregs_longterm_cache'].clear()
+
+    def configure(self, get_diff_json, fetch_toc, render_section):
+        get_diff_json.return_value = {
+            '8888-2': {'op': 'added',
+                       'node': {'title': '8888.2', 'label': ['8888', '2']}},
+            '8888-1-a': {'op': 'modified'}}
+        fetch_toc.return_value = [
+            {'section_id': '8888-1', 'index': ['8888', '1'],
+             'is_section': True}]
+        render_section.side_effect = lambda label_id, versions, diff: {
+            'label': label_id}
+
+    def test_renders_requested_section(self, get_diff_json, fetch_toc,
+                                       render_section):
+        """Only the requested section is rendered; it's then stored"""
+        self.configure(get_diff_json, fetch_toc, render_section)
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertEqual({'label': '8888-2'}, renderer.section('8888-2'))
+        self.assertEqual(['8888-2'], [
+            call[0][0] for call in render_section.call_args_list])
+        toc = renderer.toc()
+        self.assertEqual(['8888-1', '8888-2'],
+                         [el['section_id'] for el in toc])
+        self.assertEqual(['modified', 'added'], [el['op'] for el in toc])
+        self.assertFalse(any('url' in el for el in toc))
+
+        # Other requests are served from the cache
+        get_diff_json.reset_mock()
+        render_section.reset_mock()
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertEqual({'label': '8888-2'}, renderer.section('8888-2'))
+        self.assertEqual(toc, renderer.toc())
+        self.assertFalse(get_diff_json.called)
+        self.assertFalse(render_section.called)
+
+        # Labels outside the table of contents, too
+        for _ in range(2):
+            renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+            self.assertEqual({'label': '8888-1-a'},
+                             renderer.section('8888-1-a'))
+        self.assertEqual(1, render_section.call_count)
+
+        # Other version pairs are separate
+        renderer = views_diff.DiffRenderer('8888', 'old', 'newer')
+        renderer.section('8888-2')
+        self.assertEqual(2, render_section.call_count)
+
+    def test_render_all(self, get_diff_json, fetch_toc, render_section):
+        """Every section of the diff not already stored is rendered"""
+        self.configure(get_diff_json, fetch_toc, render_section)
+        views_diff.DiffRenderer('8888', 'old', 'new').section('8888-2')
+        render_section.reset_mock()
+
+        results = views_diff.DiffRenderer('8888', 'old', 'new').render_all()
+        self.assertEqual({'rendered': ['8888-1'], 'failed': []}, results)
+        self.assertEqual(['8888-1'], [
+            call[0][0] for call in render_section.call_args_list])
+
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertEqual({'label': '8888-1'}, renderer.section('8888-1'))
+        self.assertEqual({'rendered': [], 'failed': []},
+                         renderer.render_all())
+        self.assertEqual(1, render_section.call_count)
+
+    def test_failed_section(self, get_diff_json, fetch_toc, render_section):
+        """A section which can't be rendered doesn't prevent storing the
+        others"""
+        self.configure(get_diff_json, fetch_toc, render_section)
+        render_section.side_effect = [KeyError('node_type'), {'ok': True}]
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertEqual({'rendered': ['8888-2'], 'failed': ['8888-1']},
+                         renderer.render_all())
+        self.assertEqual({'ok': True}, renderer.section('8888-2'))
+
+        render_section.side_effect = KeyError('node_type')
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertRaises(KeyError, renderer.section, '8888-1')
+
+    def test_missing_diff(self, get_diff_json, fetch_toc, render_section):
+        get_diff_json.return_value = None
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertRaises(MissingContentException, renderer.section, '8888-1')
+        self.assertRaises(MissingContentException, renderer.toc)
+
+    @override_settings(DIFF_PRECOMPUTE=True)
+    @patch('regulations.views.diff.executor')
+    def test_precompute(self, executor, get_diff_json, fetch_toc,
+                        render_section):
+        """The first view of a diff renders the rest of it in the
+        background"""
+        self.configure(get_diff_json, fetch_toc, render_section)
+        submit = executor.submit
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertEqual({'label': '8888-2'}, renderer.section('8888-2'))
+        self.assertEqual(1, render_section.call_count)
+        self.assertEqual(1, submit.call_count)
+        # Already being precomputed
+        renderer.section('8888-1-a')
+        self.assertEqual(1, submit.call_count)
+
+        submit.call_args[0][0]()    # run the precompute
+        self.assertEqual(['8888-2', '8888-1-a', '8888-1'], [
+            call[0][0] for call in render_section.call_args_list])
+        renderer.section('8888-1')
+        renderer.section('8888-3')
+        self.assertEqual(1, submit.call_count)
+
+    @override_settings(API_WORKERS=1, API_BASE='http://example.com/',
+                       API_BATCH_ENDPOINT=None)
+    @patch('regulations.generator.executor._executor', None)
+    @patch('regulations.generator.api_client.ApiClient.get')
+    def test_precompute_fetches(self, get, get_diff_json, fetch_toc,
+                                render_section):
+        """Precomputing occupies a worker of the (bounded) pool; the API
+        requests it makes mustn't wait on that pool"""
+        self.configure(get_diff_json, fetch_toc, render_section)
+        get.side_effect = lambda suffix, params={}: {'suffix': suffix}
+        render_section.side_effect = lambda label_id, versions, diff: {
+            'layers': ApiClient().get_many(['a/' + label_id, 'b/' + label_id])}
+        views_diff.DiffRenderer('8888', 'old', 'new').precompute()
+        # The pool's one worker is free again
+        executor.submit(lambda: None).result(timeout=5)
+
+        renderer = views_diff.DiffRenderer('8888', 'old', 'new')
+        self.assertEqual(
+            {'layers': [{'suffix': 'a/8888-1'}, {'suffix': 'b/8888-1'}]},
+            renderer.section('8888-1'))
+        self.assertEqual(2, render_section.call_count)
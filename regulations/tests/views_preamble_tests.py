@@ -39,9 +39,8 @@ class PreambleViewTests(TestCase):
         the template. AJAX/partial=true requests should only get the inner
         context (i.e. no UI-related context)"""
         ApiReader.return_value.preamble.return_value = self._mock_preamble
-        api_reader.ApiReader.return_value.layer.return_value = {
-            '1-c-x': ['something']
-        }
+        api_reader.ApiReader.return_value.layers.side_effect = lambda args: [
+            {'1-c-x': ['something']}] * len(args)
         view = preamble.PreambleView.as_view()
 
         path = '/preamble/1/c/x?layers=meta'
@@ -54,6 +54,12 @@ class UtilsTest(TestCase):
                          ("abc", 123, "def", 456))
         self.assertEqual(utils.make_sortable("123abc456"), (123, "abc", 456))
 
+    def test_to_roman(self):
+        self.assertEqual('i', utils.to_roman(1))
+        self.assertEqual('xiv', utils.to_roman(14))
+        self.assertEqual('l', utils.to_roman(50))
+        self.assertEqual('lxxii', utils.to_roman(72))
+
     @patch('regulations.views.utils.api_reader')
     def test_regulation_meta_404(self, api_reader):
         """We shouldn't crash if meta data isn't available"""
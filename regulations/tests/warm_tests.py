@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import override_settings
+from mock import patch
+
+from regulations import warm
+from regulations.generator.sitemap import Page
+
+
+class WarmTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_size(self):
+        with override_settings(CACHES={
+                'files': {'BACKEND': 'django.core.cache.backends.filebased.'
+                                     'FileBasedCache',
+                          'LOCATION': self.cache_dir},
+                'memory': {'BACKEND': 'regulations.cache_backends.'
+                                      'FrozenTreeCache'},
+                'dummy': {'BACKEND': 'django.core.cache.backends.dummy.'
+                                     'DummyCache'}}):
+            before = warm.cache_sizes(('files', 'memory', 'dummy'))
+            self.assertEqual({'entries': 0, 'bytes': 0}, before['files'])
+            self.assertIsNone(before['dummy'])
+
+            caches['files'].set('key', 'value')
+            caches['memory'].set('key', 'value')
+            caches['memory'].set('tree', {'label': ['1'], 'children': []})
+            after = warm.cache_sizes(('files', 'memory', 'dummy'))
+            self.assertEqual(1, after['files']['entries'])
+            self.assertTrue(after['files']['bytes'] > 0)
+            self.assertEqual(2, after['memory']['entries'])
+
+            growth = warm.growth(before, after)
+            self.assertEqual(after['files'], growth['files'])
+            self.assertIsNone(growth['dummy'])
+
+    @patch('regulations.warm.Client')
+    def test_warm_pages(self, Client):
+        def get(path, secure):
+            if path == '/1234':
+                return HttpResponse('landing')
+            raise ValueError()
+        Client.return_value.get.side_effect = get
+        pages = [Page.of('regulation_landing_view', label_id='1234'),
+                 Page.of('chrome_section_view', label_id='1234-1',
+                         version='v1')]
+
+        results = list(warm.warm_pages(pages, host='example.com'))
+        Client.assert_called_with(HTTP_HOST='example.com')
+        self.assertEqual([(pages[0], 200), (pages[1], None)],
+                         [(page, status) for page, status, _ in results])
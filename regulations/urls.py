@@ -2,6 +2,7 @@ from django.conf import settings
 from django.conf.urls import patterns, url
 from django.views.decorators.cache import cache_page
 
+from regulations.middleware import generation_cache_page
 from regulations.views.about import about
 from regulations.views.chrome_breakaway import ChromeSXSView
 from regulations.views.chrome import (
@@ -38,6 +39,11 @@ subterp_pattern = r'(?P<label_id>[\d]+-(Appendices|Subpart(-[A-Z]+)?)-Interp)'
 
 lt_cache = cache_page(settings.CACHES['eregs_longterm_cache']['TIMEOUT'],
                       cache='eregs_longterm_cache')
+# Pages with chrome list the regulation's versions, so are also keyed by its
+# generation (see regulations.generator.generations)
+lt_chrome_cache = generation_cache_page(
+    settings.CACHES['eregs_longterm_cache']['TIMEOUT'],
+    cache='eregs_longterm_cache')
 
 
 urlpatterns = patterns(
@@ -63,7 +69,7 @@ urlpatterns = patterns(
     # A section by section paragraph with chrome
     # Example: http://.../sxs/201-2-g/2011-1738
     url(r'^sxs/%s/%s$' % (paragraph_pattern, notice_pattern),
-        lt_cache(ChromeSXSView.as_view()),
+        lt_chrome_cache(ChromeSXSView.as_view()),
         name='chrome_sxs_view'),
     # Search results for non-JS viewers
     # Example: http://.../search?q=term&version=2011-1738
@@ -74,7 +80,7 @@ urlpatterns = patterns(
     # Example: http://.../diff/201-4/2011-1738/2013-10704
     url(r'^diff/%s/%s/%s$' %
         (section_pattern, version_pattern, newer_version_pattern),
-        lt_cache(ChromeSectionDiffView.as_view()),
+        lt_chrome_cache(ChromeSectionDiffView.as_view()),
         name='chrome_section_diff_view'),
 
     url(r'^preamble/(?P<doc_number>[\w-]+)/cfr_changes/(?P<section>[\w-]+)$',
@@ -89,32 +95,32 @@ urlpatterns = patterns(
     # A regulation section with chrome
     # Example: http://.../201-4/2013-10704
     url(r'^%s/%s$' % (section_pattern, version_pattern),
-        lt_cache(ChromeView.as_view(partial_class=PartialSectionView)),
+        lt_chrome_cache(ChromeView.as_view(partial_class=PartialSectionView)),
         name='chrome_section_view'),
     # Subterp, interpretations of a while subpart, emptypart or appendices
     # Example: http://.../201-Subpart-A-Interp/2013-10706
     #          http://.../201-Subpart-Interp/2013-10706
     #          http://.../201-Appendices-Interp/2013-10706
     url(r'^%s/%s$' % (subterp_pattern, version_pattern),
-        lt_cache(ChromeSubterpView.as_view()),
+        lt_chrome_cache(ChromeSubterpView.as_view()),
         name=ChromeSubterpView.version_switch_view),
     # Interpretation of a section/paragraph or appendix
     # Example: http://.../201-4-Interp/2013-10704
     url(r'^%s/%s$' % (interp_pattern, version_pattern),
-        lt_cache(ChromeView.as_view(
+        lt_chrome_cache(ChromeView.as_view(
             partial_class=partial_interp.PartialInterpView)),
         name='chrome_interp_view'),
     # The whole regulation with chrome
     # Example: http://.../201/2013-10704
     url(r'^%s/%s$' % (reg_pattern, version_pattern),
-        lt_cache(ChromeView.as_view(
+        lt_chrome_cache(ChromeView.as_view(
             partial_class=PartialRegulationView,
             version_switch_view='chrome_regulation_view')),
         name='chrome_regulation_view'),
     # A regulation paragraph with chrome
     # Example: http://.../201-2-g/2013-10704
     url(r'^%s/%s$' % (paragraph_pattern, version_pattern),
-        lt_cache(ChromeView.as_view(
+        lt_chrome_cache(ChromeView.as_view(
             partial_class=PartialParagraphView,
             version_switch_view='chrome_paragraph_view')),
         name='chrome_paragraph_view'),
@@ -1,6 +1,6 @@
 from django.views.generic.base import TemplateView
 
-from regulations.generator import generator
+from regulations.generator import generator, timing
 from regulations.generator.node_types import label_to_text, type_from_label
 from regulations.generator.section_url import SectionUrl
 from regulations.generator.sidebar.help import Help as HelpSideBar
@@ -103,10 +103,12 @@ class ChromeView(TemplateView):
         context['node_type'] = type_from_label(label_id_list)
 
         error_handling.check_regulation(reg_part)
-        self.set_chrome_context(context, reg_part, version)
+        with timing.timer('chrome'):
+            self.set_chrome_context(context, reg_part, version)
 
         self.check_tree(context)
-        self.add_main_content(context)
+        with timing.timer('main'):
+            self.add_main_content(context)
         context['sidebar_content'] = self.sidebar(label_id, version)
 
         return context
@@ -1,12 +1,18 @@
 # vim: set encoding=utf-8
 
 from collections import namedtuple
+import copy
+import logging
+import threading
 
 import six
+from django.conf import settings
+from django.core.cache import caches
 from django.core.urlresolvers import reverse
 
-from regulations.generator import generator
+from regulations.generator import api_reader, executor, generator
 from regulations.generator.html_builder import CFRHTMLBuilder
+from regulations.generator.layers.diff_applier import DiffApplier
 from regulations.generator.layers.toc_applier import TableOfContentsLayer
 from regulations.generator.node_types import EMPTYPART, REGTEXT
 from regulations.generator.section_url import SectionUrl
@@ -24,8 +30,17 @@ class Versions(namedtuple('Versions', ['older', 'newer', 'return_to'])):
         return super(Versions, cls).__new__(cls, older, newer, return_to)
 
 
-def get_appliers(label_id, versions):
-    diff = generator.get_diff_applier(label_id, versions.older, versions.newer)
+logger = logging.getLogger(__name__)
+
+
+def get_appliers(label_id, versions, diff_json=None):
+    """Layer appliers for the diff of this label. If we already have the
+    diff's JSON, pass it along rather than fetching it again"""
+    if diff_json is None:
+        diff = generator.get_diff_applier(label_id, versions.older,
+                                          versions.newer)
+    else:
+        diff = DiffApplier(diff_json, label_id)
 
     if diff is None:
         raise error_handling.MissingContentException()
@@ -78,36 +93,151 @@ class PartialSectionDiffView(PartialView):
         versions = Versions(context['version'], context['newer_version'],
                             self.request.GET.get('from_version'))
 
-        tree = generator.get_tree_paragraph(label_id, versions.older)
-
-        if tree is None:
-            # TODO We need a more complicated check here to see if the diffs
-            # add the requested section. If not -> 404
-            tree = {}
-
-        appliers = get_appliers(label_id, versions)
-
-        builder = CFRHTMLBuilder(*appliers)
-        builder.tree = tree
-        builder.generate_html()
-
-        child_of_root = builder.tree
-        if builder.tree['node_type'] == REGTEXT:
-            child_of_root = {
-                'node_type': EMPTYPART,
-                'children': [builder.tree]}
-        context['tree'] = {'children': [child_of_root]}
+        renderer = DiffRenderer(label_id.split('-')[0], versions.older,
+                                versions.newer)
+        context['tree'] = renderer.section(label_id)
         context['markup_page_type'] = 'diff'
-
-        regpart = label_id.split('-')[0]
-        old_toc = fetch_toc(regpart, versions.older)
-        diff = generator.get_diff_json(regpart, versions.older, versions.newer)
-        context['TOC'] = diff_toc(versions, old_toc, diff)
+        context['TOC'] = diff_toc_urls(versions, renderer.toc())
         context['navigation'] = self.footer_nav(
             label_id, context['TOC'], versions)
         return context
 
 
+#   Renders of the same diff already in progress (in this process)
+_renders = api_reader.SingleFlight()
+
+
+def render_section(label_id, versions, diff_json):
+    """Apply the diff (and layers) to a section, returning the tree as the
+    template expects it"""
+    tree = generator.get_tree_paragraph(label_id, versions.older)
+
+    if tree is None:
+        # TODO We need a more complicated check here to see if the diffs
+        # add the requested section. If not -> 404
+        tree = {}
+
+    appliers = get_appliers(label_id, versions, diff_json)
+
+    builder = CFRHTMLBuilder(*appliers)
+    builder.tree = tree
+    builder.generate_html()
+
+    child_of_root = builder.tree
+    if builder.tree['node_type'] == REGTEXT:
+        child_of_root = {
+            'node_type': EMPTYPART,
+            'children': [builder.tree]}
+    return {'children': [child_of_root]}
+
+
+class DiffRenderer(object):
+    """Rendering a diff section means fetching and combining the layers of
+    both versions and the (whole part's) diff, so each rendered section is
+    stored in the long-term cache, keyed by the pair of versions. A request
+    only ever renders the section it asks for; every section of a diff can
+    be rendered ahead of time with `render_all` (see the precompute_diffs
+    command, and settings.DIFF_PRECOMPUTE)"""
+    CACHE = 'eregs_longterm_cache'
+
+    def __init__(self, part, older, newer):
+        self.part = part
+        self.versions = Versions(older, newer)
+
+    @property
+    def cache(self):
+        return caches[self.CACHE]
+
+    def _key(self, *suffix):
+        return '-'.join(('diff', self.part, self.versions.older,
+                         self.versions.newer) + suffix)
+
+    def diff_json(self):
+        """The diff, fetched for each use: the appliers graft (and then
+        annotate) its nodes"""
+        diff_json = generator.get_diff_json(
+            self.part, self.versions.older, self.versions.newer)
+        if diff_json is None:
+            raise error_handling.MissingContentException()
+        return diff_json
+
+    def toc(self):
+        """The diff's table of contents, without URLs (see diff_toc_urls)"""
+        key = self._key('toc')
+        toc = self.cache.get(key)
+        if toc is None:
+            toc = diff_toc_entries(fetch_toc(self.part, self.versions.older),
+                                   self.diff_json())
+            self.cache.set(key, toc)
+        return toc
+
+    def section(self, label_id):
+        """The rendered tree of this section (or other label), rendered and
+        stored on its first view. With settings.DIFF_PRECOMPUTE, that view
+        also starts rendering the rest of the diff, in the background"""
+        key = self._key('section', label_id)
+        tree = self.cache.get(key)
+        if tree is None:
+            tree = render_section(label_id, self.versions, self.diff_json())
+            self.cache.set(key, tree)
+            if settings.DIFF_PRECOMPUTE:
+                self.precompute()
+        return tree
+
+    def precompute(self):
+        """Render the rest of the diff on the shared worker pool, unless
+        it's been rendered (or is being rendered) already"""
+        if self.cache.get(self._key('rendered')) is not None:
+            return
+        with _precomputing_lock:
+            if self._key() in _precomputing:
+                return
+            _precomputing.add(self._key())
+
+        def render():
+            try:
+                DiffRenderer(self.part, *self.versions[:2]).render_all()
+            except Exception:
+                logger.exception('Could not precompute %s', self._key())
+            finally:
+                with _precomputing_lock:
+                    _precomputing.discard(self._key())
+        executor.submit(render)
+
+    def render_all(self):
+        """Render and store every section in the diff's table of contents
+        which isn't already stored. Returns the label_ids of those rendered
+        and of those which failed. Only one thread (per process) renders a
+        given diff at a time"""
+        def render():
+            labels = [el['section_id'] for el in self.toc()]
+            stored = self.cache.get_many(
+                [self._key('section', label_id) for label_id in labels])
+            results = {'rendered': [], 'failed': []}
+            for label_id in labels:
+                key = self._key('section', label_id)
+                if key in stored:
+                    continue
+                try:
+                    self.cache.set(key, render_section(
+                        label_id, self.versions, self.diff_json()))
+                    results['rendered'].append(label_id)
+                except Exception:
+                    # Left to be rendered (and fail) if requested
+                    logger.exception('Could not render diff of %s', label_id)
+                    results['failed'].append(label_id)
+            self.cache.set(self._key('rendered'), True)
+            return results
+
+        results, leader = _renders.do(self._key(), render)
+        return results if leader else copy.deepcopy(results)
+
+
+#   Diffs being precomputed in the background (in this process)
+_precomputing = set()
+_precomputing_lock = threading.Lock()
+
+
 class ChromeSectionDiffView(ChromeView):
     """Search results with chrome"""
     template_name = 'regulations/diff-chrome.html'
@@ -164,6 +294,12 @@ def extract_sections(toc):
 
 
 def diff_toc(versions, old_toc, diff):
+    return diff_toc_urls(versions, diff_toc_entries(old_toc, diff))
+
+
+def diff_toc_entries(old_toc, diff):
+    """The sections of the older version's table of contents, plus those
+    added by the diff, each marked with how the diff changes it"""
     # We work around Subparts in the TOC for now.
     compiled_toc = extract_sections(old_toc)
 
@@ -182,8 +318,6 @@ def diff_toc(versions, old_toc, diff):
 
     modified, deleted = modified_deleted_sections(diff)
     for el in compiled_toc:
-        if 'Subpart' not in el['index'] and 'Subjgrp' not in el['index']:
-            el['url'] = reverse_chrome_diff_view(el['section_id'], *versions)
         # Deleted first, lest deletions in paragraphs affect the section
         if tuple(el['index']) in deleted and 'op' not in el:
             el['op'] = 'deleted'
@@ -193,6 +327,14 @@ def diff_toc(versions, old_toc, diff):
     return sorted(compiled_toc, key=normalize_toc)
 
 
+def diff_toc_urls(versions, toc):
+    """Link each section of a diff's table of contents to its diff"""
+    for el in toc:
+        if 'Subpart' not in el['index'] and 'Subjgrp' not in el['index']:
+            el['url'] = reverse_chrome_diff_view(el['section_id'], *versions)
+    return toc
+
+
 def normalize_toc(toc_element):
     """Return a sorting order for a TOC element, primarily based on the
     index, and the type of content. General order is regulation text,
@@ -58,12 +58,12 @@ class PartialSubterpView(PartialSectionView):
 
         context['markup_page_type'] = 'reg-section'
         html_label = node_types.to_markup_id(label_id.split('-'))
-        interp['children'] = subterp_sects
-
+        # Copy rather than modify the fetched tree, which may be shared with
+        # other components rendering this request.
         # interp['label] is defined so that the template receives the
         # appropriate markup ID, matching the rendered subterp and not
         # the parent node in the tree
-        interp['label'] = label
+        interp = dict(interp, children=subterp_sects, label=label)
         inline_applier, p_applier, s_applier = self.determine_appliers(
             reg_part + '-Interp', version)
         builder = generate_html(interp, (inline_applier, p_applier, s_applier))
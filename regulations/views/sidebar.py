@@ -4,7 +4,7 @@ import six
 from django.conf import settings
 from django.views.generic.base import TemplateView
 
-from regulations.generator import api_reader
+from regulations.generator import api_reader, timing
 
 
 class SideBarView(TemplateView):
@@ -28,7 +28,8 @@ class SideBarView(TemplateView):
 
         sidebars = [klass(context['label_id'], context['version'])
                     for klass in klasses]
-        context['sidebars'] = [sidebar.full_context(client, self.request)
-                               for sidebar in sidebars]
+        with timing.timer('sidebar'):
+            context['sidebars'] = [sidebar.full_context(client, self.request)
+                                   for sidebar in sidebars]
 
         return context
@@ -3,7 +3,8 @@ import itertools
 import logging
 
 from regulations.generator import api_reader, generator
-from regulations.generator.layers.tree_builder import roman_nums
+from regulations.generator.layers.tree_builder import (
+    ROMAN_NUMERALS, roman_nums, sort_keys)
 from regulations.generator.layers.utils import convert_to_python
 from regulations.generator.toc import fetch_toc
 
@@ -13,6 +14,8 @@ logger = logging.getLogger(__name__)
 
 def to_roman(number):
     """ Convert an integer to a roman numeral """
+    if 0 < number <= len(ROMAN_NUMERALS):
+        return ROMAN_NUMERALS[number - 1]
     romans = list(itertools.islice(roman_nums(), 0, number + 1))
     return romans[number - 1]
 
@@ -58,12 +61,17 @@ def first_section(reg_part, version):
 def make_sortable(string):
     """Split a string into components, converting digits into ints so sorting
     works as we would expect"""
+    return sort_keys.get(('make_sortable', string),
+                         lambda: _make_sortable(string))
+
+
+def _make_sortable(string):
     if not string:      # base case
         return tuple()
     elif string[0].isdigit():
         prefix = "".join(itertools.takewhile(lambda c: c.isdigit(), string))
-        return (int(prefix),) + make_sortable(string[len(prefix):])
+        return (int(prefix),) + _make_sortable(string[len(prefix):])
     else:
         prefix = "".join(itertools.takewhile(lambda c: not c.isdigit(),
                                              string))
-        return (prefix,) + make_sortable(string[len(prefix):])
+        return (prefix,) + _make_sortable(string[len(prefix):])
@@ -0,0 +1,110 @@
+"""Warm the site's caches in-process, without going through a web server.
+Pages are requested through Django's test client, so the full middleware
+stack runs: responses land in the per-site (`default`) and long-term page
+caches, while the API data used to build them lands in `api_cache`."""
+from collections import OrderedDict
+from multiprocessing import Pool
+import marshal
+import os
+import timeit
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import Client
+
+from regulations.export import batches, default_host
+
+
+CACHE_ALIASES = ('api_cache', 'default', 'eregs_longterm_cache')
+
+
+def _stored_size(value):
+    if isinstance(value, bytes):
+        return len(value)
+    try:
+        return len(marshal.dumps(value))
+    except ValueError:
+        return 0
+
+
+def cache_size(alias):
+    """Number of entries and bytes stored by this cache, for those backends
+    which we can inspect (file-based and local memory); None otherwise"""
+    cache = caches[alias]
+    if isinstance(cache, FileBasedCache):
+        entries, size = 0, 0
+        for root, _, files in os.walk(cache._dir):
+            for name in files:
+                if name.endswith(cache.cache_suffix):
+                    entries += 1
+                    size += os.path.getsize(os.path.join(root, name))
+        return {'entries': entries, 'bytes': size}
+    if isinstance(cache, LocMemCache):
+        values = list(cache._cache.values())
+        return {'entries': len(values),
+                'bytes': sum(_stored_size(value) for value in values)}
+    return None
+
+
+def cache_sizes(aliases=CACHE_ALIASES):
+    return OrderedDict((alias, cache_size(alias)) for alias in aliases)
+
+
+def growth(before, after):
+    """Difference between two results of cache_sizes"""
+    result = OrderedDict()
+    for alias, size in after.items():
+        if size is None or before.get(alias) is None:
+            result[alias] = None
+        else:
+            result[alias] = dict((key, size[key] - before[alias][key])
+                                 for key in size)
+    return result
+
+
+def warm_page(client, page, secure=False):
+    """Request a single sitemap.Page. Returns its status code (None if the
+    view raised)"""
+    try:
+        return client.get(page.path, secure=secure).status_code
+    except Exception:
+        return None
+
+
+def _warm_batch(args):
+    """Pool.imap only passes a single argument"""
+    pages, host, secure = args
+    client = Client(HTTP_HOST=host)
+    results = []
+    for page in pages:
+        start = timeit.default_timer()
+        status = warm_page(client, page, secure)
+        results.append((page, status, timeit.default_timer() - start))
+    return results
+
+
+def warm_pages(pages, processes=1, host=None, secure=False):
+    """Request each of the pages, sharding batches of them (grouped by
+    version, see export.batches) across `processes` worker processes.
+    Requests are made with the given host (and scheme), as these are part of
+    the page caches' keys. Yields each page with its status code and the
+    seconds it took, in completion order.
+
+    Local-memory caches are private to each process, so warming them from
+    here only helps when they're backed by something shared (e.g.
+    memcached)"""
+    host = host or default_host()
+    tasks = ((batch, host, secure) for batch in batches(pages))
+    if processes > 1:
+        pool = Pool(processes)
+        try:
+            for results in pool.imap_unordered(_warm_batch, tasks):
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+    else:
+        for task in tasks:
+            for result in _warm_batch(task):
+                yield result
@@ -47,6 +47,7 @@ setup(
         'cached-property',
         'celery',
         'django>=1.8,<1.9',
+        'futures; python_version < "3"',
         'markdown2',
         'requests',
         'six',